@@ -1,20 +1,282 @@
+"""
+Admin pensado para tablas grandes (millones de visitas, miles de restaurantes).
+
+- Los filtros por restaurante (``FiltroAutocompletar``) son un buscador con
+  la vista de autocompletar del admin, en vez de una lista con todos los
+  nombres que se consultaba en cada carga del listado.
+- ``list_select_related`` en todos los listados: una consulta por página, no
+  una por fila y clave foránea.
+- ``PaginadorEstimado``: sin filtros, el total de filas sale de las
+  estadísticas de la base de datos en vez de un ``COUNT(*)``; y
+  ``show_full_result_count = False`` evita el segundo conteo.
+- ``Visit`` es de solo lectura y pagina por clave (``ChangeListPorCursor``):
+  no cuenta filas y la página 10.000 cuesta lo mismo que la primera.
+
+Así cada listado hace un número fijo de consultas, sea cual sea el tamaño de
+las tablas (ver ``AdminTests`` en core/tests.py).
+"""
+import calendar
+from datetime import date
+
+from django import forms
 from django.contrib import admin
-from .models import Restaurante, Categoria, Plato
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import formats, timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from .models import Restaurante, Categoria, Plato, Visit
+
+# Por debajo de esto se cuenta de verdad: el COUNT(*) es barato y exacto
+CONTEO_EXACTO_HASTA = 10_000
+
+CURSOR_VAR = 'antes'
+
+
+def filas_estimadas(modelo, using='default'):
+    """Número aproximado de filas de la tabla de ``modelo``, sin recorrerla.
+
+    PostgreSQL: ``pg_class.reltuples`` (lo mantienen ANALYZE y autovacuum).
+    SQLite: ``sqlite_stat1``, si la base se analizó (``ANALYZE`` o
+    ``PRAGMA optimize``). Si no, ``MAX(id) - MIN(id) + 1``, dos lecturas del
+    índice de la clave primaria: en tablas en las que casi solo se inserta
+    (como ``Visit``) es buena aproximación, y las filas que ``archivar_visitas``
+    borra, que son las más antiguas, no cuentan. Es una cota superior: los
+    huecos de otros borrados sí cuentan.
+    """
+    connection = connections[using]
+    tabla = modelo._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [tabla])
+            fila = cursor.fetchone()
+        if fila and fila[0] >= 0:
+            return fila[0]
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                # Primer número de cada fila: las filas del índice (o de la
+                # tabla); el mayor, por si algún índice es parcial
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [tabla])
+                filas = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                if filas:
+                    return max(filas)
+    ids = modelo._default_manager.using(using).order_by().values_list('pk', flat=True)
+    ultimo = ids.order_by('-pk').first()
+    if ultimo is None:
+        return 0
+    return ultimo - ids.order_by('pk').first() + 1
+
+
+class PaginadorEstimado(Paginator):
+    """Paginador que no cuenta las tablas grandes cuando el listado no tiene filtros."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimadas = filas_estimadas(queryset.model, queryset.db)
+            if estimadas > CONTEO_EXACTO_HASTA:
+                return estimadas
+        return super().count
+
+
+class FiltroAutocompletar(admin.RelatedFieldListFilter):
+    """Filtro por una clave foránea con buscador en vez de lista de valores.
+
+    Usa la vista de autocompletar del admin, así que el modelo relacionado
+    tiene que tener ``search_fields`` en su ``ModelAdmin``. Solo se consulta
+    el valor elegido, para mostrar su nombre.
+    """
+    template = 'admin/filtro_autocompletar.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.model_admin = model_admin
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def selector(self):
+        campo = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(self.field, self.model_admin.admin_site),
+        )
+        valor = self.lookup_val[-1] if self.lookup_val else None
+        return campo.widget.render(self.lookup_kwarg, valor, attrs={'id': f'filtro-{self.field_path}'})
+
+
+class AdminEscalable(admin.ModelAdmin):
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    # Por clave primaria: el listado y el autocompletar usan su índice
+    ordering = ('-pk',)
+
+    @property
+    def media(self):
+        return (super().media
+                + AutocompleteSelect(None, self.admin_site).media
+                + forms.Media(js=['js/filtro_autocompletar.js']))
+
+
+class ChangeListPorCursor(ChangeList):
+    """Listado paginado por clave: ``?antes=<id>`` muestra las filas con id menor.
+
+    Cada página es ``pk < id ORDER BY pk DESC LIMIT n``, que lee el índice de
+    la clave primaria desde donde acabó la anterior, en vez de ``OFFSET``,
+    que recorre todas las filas saltadas, y no hace falta contar nada. A
+    cambio solo se puede ir a la página siguiente o volver al principio.
+
+    La jerarquía de fechas se calcula con la primera y la última fecha del
+    listado (dos lecturas del índice) en vez de agrupar todas las filas por
+    año, mes o día, así que puede ofrecer meses o días sin visitas.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Cambiar un filtro o la fecha vuelve a la primera página
+        return super().get_query_string(new_params, [CURSOR_VAR, *(remove or [])])
+
+    def get_results(self, request):
+        try:
+            antes = int(request.GET[CURSOR_VAR])
+        except (KeyError, ValueError):
+            antes = None
+        queryset = self.queryset if antes is None else self.queryset.filter(pk__lt=antes)
+        filas = list(queryset.order_by('-pk')[:self.list_per_page + 1])
+
+        self.result_list = filas[:self.list_per_page]
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = antes is not None or len(filas) > self.list_per_page
+        self.paginator = None
+        self.primera_pagina = antes is None
+        self.siguiente = self.get_query_string({CURSOR_VAR: filas[-2].pk}) if len(filas) > self.list_per_page else None
+        self.filas_estimadas = None if self.queryset.query.where else filas_estimadas(self.model, self.queryset.db)
+
+    def jerarquia_de_fechas(self):
+        """Lo mismo que la etiqueta ``{% date_hierarchy %}`` del admin, sin agrupar filas."""
+        campo = self.date_hierarchy
+        fechas = self.queryset.order_by().values_list(campo, flat=True)
+        primera = fechas.order_by(campo).first()
+        ultima = fechas.order_by(f'-{campo}').first()
+        if primera is None:
+            return {'show': False}
+        primera, ultima = timezone.localtime(primera).date(), timezone.localtime(ultima).date()
+
+        año, mes, dia = (self.params.get(f'{campo}__{parte}') for parte in ('year', 'month', 'day'))
+        try:
+            año, mes, dia = (int(v) if v else None for v in (año, mes, dia))
+        except ValueError:
+            return {'show': False}
+        if año is None and primera.year == ultima.year:
+            año = primera.year
+            if primera.month == ultima.month:
+                mes = primera.month
+
+        def enlace(filtros):
+            return self.get_query_string(filtros, [f'{campo}__'])
+
+        claves = {'year': f'{campo}__year', 'month': f'{campo}__month', 'day': f'{campo}__day'}
+        if año and mes and dia:
+            dia = date(año, mes, dia)
+            return {
+                'show': True,
+                'back': {'link': enlace({claves['year']: año, claves['month']: mes}),
+                         'title': capfirst(formats.date_format(dia, 'YEAR_MONTH_FORMAT'))},
+                'choices': [{'title': capfirst(formats.date_format(dia, 'MONTH_DAY_FORMAT'))}],
+            }
+        if año and mes:
+            dias = [date(año, mes, d) for d in range(1, calendar.monthrange(año, mes)[1] + 1)]
+            return {
+                'show': True,
+                'back': {'link': enlace({claves['year']: año}), 'title': str(año)},
+                'choices': [
+                    {'link': enlace({claves['year']: año, claves['month']: mes, claves['day']: d.day}),
+                     'title': capfirst(formats.date_format(d, 'MONTH_DAY_FORMAT'))}
+                    for d in dias if primera <= d <= ultima
+                ],
+            }
+        if año:
+            meses = [date(año, m, 1) for m in range(1, 13)]
+            return {
+                'show': True,
+                'back': {'link': enlace({}), 'title': _('All dates')},
+                'choices': [
+                    {'link': enlace({claves['year']: año, claves['month']: m.month}),
+                     'title': capfirst(formats.date_format(m, 'YEAR_MONTH_FORMAT'))}
+                    for m in meses if (primera.year, primera.month) <= (m.year, m.month) <= (ultima.year, ultima.month)
+                ],
+            }
+        return {
+            'show': True,
+            'back': None,
+            'choices': [{'link': enlace({claves['year']: str(a)}), 'title': str(a)}
+                        for a in range(primera.year, ultima.year + 1)],
+        }
+
 
 # Una forma más avanzada de registrar para mejorar la visualización
 @admin.register(Restaurante)
-class RestauranteAdmin(admin.ModelAdmin):
+class RestauranteAdmin(AdminEscalable):
     list_display = ('nombre', 'dueño', 'slug', 'activo') # Campos a mostrar en la lista
     search_fields = ('nombre', 'dueño__username') # Añade una barra de búsqueda
     list_filter = ('activo',)
+    list_select_related = ('dueño',)
+    autocomplete_fields = ('dueño',)
 
 @admin.register(Categoria)
-class CategoriaAdmin(admin.ModelAdmin):
+class CategoriaAdmin(AdminEscalable):
     list_display = ('nombre', 'restaurante')
-    list_filter = ('restaurante__nombre',)
+    list_filter = (('restaurante', FiltroAutocompletar),)
+    list_select_related = ('restaurante',)
+    search_fields = ('nombre', 'restaurante__nombre')
+    autocomplete_fields = ('restaurante',)
 
 @admin.register(Plato)
-class PlatoAdmin(admin.ModelAdmin):
+class PlatoAdmin(AdminEscalable):
     list_display = ('nombre', 'categoria', 'precio', 'disponible')
-    list_filter = ('disponible', 'categoria__restaurante__nombre')
-    search_fields = ('nombre',)
\ No newline at end of file
+    list_filter = ('disponible', ('categoria__restaurante', FiltroAutocompletar))
+    list_select_related = ('categoria',)
+    search_fields = ('nombre',)
+    autocomplete_fields = ('categoria',)
+
+@admin.register(Visit)
+class VisitAdmin(AdminEscalable):
+    """Solo lectura: las visitas las guarda core/visitas.py."""
+    list_display = ('timestamp', 'restaurante', 'plato', 'tipo')
+    list_filter = ('tipo', ('restaurante', FiltroAutocompletar))
+    list_select_related = ('restaurante', 'plato')
+    date_hierarchy = 'timestamp'
+    sortable_by = ()
+    list_per_page = 100
+    show_facets = admin.ShowFacets.NEVER
+    change_list_template = 'admin/core/visit/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListPorCursor
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,233 @@
+"""
+Informes de visitas para el dueño: mapa de calor por hora de la semana,
+comparación con la semana anterior y conversión del menú a cada plato.
+
+El resumen diario (``VisitDailyStat``) no guarda la hora, así que estos
+informes leen ``Visit``: las visitas de un restaurante en las últimas
+``ANALITICA['SEMANAS']`` semanas (hasta hoy incluido).
+
+1. ``columnas_de_visitas`` trae tres columnas compactas (``array``): el
+   instante en segundos desde epoch, que calcula la base de datos para no
+   crear un ``datetime`` por fila; el tipo como número (su posición en
+   ``TIPOS_VISITA``) y el plato (0 si no tiene). Las filas se leen por lotes
+   de ``LOTE`` con el cursor, sin pasar por modelos.
+2. ``contar`` recorre las columnas una sola vez: cada visita cae en su hora
+   local (búsqueda binaria en los inicios de cada hora de la ventana, que
+   respeta los cambios de horario) y se cuenta por hora y tipo, y las
+   visitas a platos por plato y semana.
+3. ``informe`` arma los tres informes a partir de esas cuentas, que ya son
+   pequeñas (horas de la ventana y platos vistos), y lo guarda en caché por
+   restaurante y día ``SEGUNDOS_CACHE`` segundos.
+
+Solo cuentan las visitas que siguen en ``Visit``: las que se llevan
+``archivar_visitas`` (ver core/archivo_visitas.py) ya no, así que
+``SEMANAS`` debe quedar por debajo de ``ARCHIVO_VISITAS['DIAS']``.
+"""
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import BigIntegerField, Case, F, Func, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import TIPOS_VISITA, Plato, Visit
+
+CONFIG_POR_DEFECTO = {
+    'SEMANAS': 4,
+    'SEGUNDOS_CACHE': 600,
+    'LOTE': 50_000,
+}
+
+CODIGOS_TIPO = {tipo: codigo for codigo, (tipo, _) in enumerate(TIPOS_VISITA)}
+NUM_TIPOS = len(TIPOS_VISITA)
+# Llegadas al menú, para el mapa de calor (las de plato ocurren ya dentro)
+TIPOS_LLEGADA = ('qr', 'menu')
+DIAS_SEMANA = ('Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom')
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'ANALITICA', {}))
+    return config
+
+
+class Epoch(Func):
+    """Segundos desde epoch de una fecha con hora (SQLite y PostgreSQL)."""
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)'
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # '%%%%s' llega a SQLite como '%s': se escapa para la plantilla y para los parámetros
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                           **extra_context)
+
+
+def ventana(semanas, hoy=None):
+    """``(primer día, desde, hasta)`` de las ``semanas`` semanas que acaban hoy."""
+    hoy = hoy or timezone.localdate()
+    primer_dia = hoy - timedelta(days=7 * semanas - 1)
+    return primer_dia, _inicio(primer_dia), _inicio(hoy + timedelta(days=1))
+
+
+def _inicio(fecha, hora=0):
+    return timezone.make_aware(datetime.combine(fecha, time(hora)))
+
+
+def horas_de_la_ventana(primer_dia, semanas):
+    """Inicio (en segundos desde epoch) y posición de cada hora local de la ventana.
+
+    Devuelve ``(inicios, hora_de_semana, semana)``: la hora ``i`` empieza en
+    ``inicios[i]``, es la ``hora_de_semana[i]`` de la semana (lunes 0:00 es
+    la 0) y cae en la semana ``semana[i]`` de la ventana (la última es la que
+    acaba hoy). La hora que no existe al adelantar el reloj empieza en el
+    mismo instante que la siguiente, así que se queda sin visitas.
+    """
+    inicios, hora_de_semana, semana = [], [], []
+    for dias in range(7 * semanas):
+        fecha = primer_dia + timedelta(days=dias)
+        for hora in range(24):
+            inicios.append(int(_inicio(fecha, hora).timestamp()))
+            hora_de_semana.append(fecha.weekday() * 24 + hora)
+            semana.append(dias // 7)
+    return inicios, hora_de_semana, semana
+
+
+def columnas_de_visitas(restaurante_id, desde, hasta, using='default'):
+    """``(instantes, tipos, platos)`` de las visitas de ``restaurante_id`` entre ``desde`` y ``hasta``."""
+    tipo = Case(*(When(tipo=t, then=Value(c)) for t, c in CODIGOS_TIPO.items()),
+                default=Value(CODIGOS_TIPO['menu']), output_field=IntegerField())
+    queryset = (Visit.objects.using(using)
+        .filter(restaurante_id=restaurante_id, timestamp__gte=desde, timestamp__lt=hasta)
+        .order_by()
+        .values_list(Epoch(F('timestamp')), tipo, Coalesce(F('plato_id'), Value(0), output_field=BigIntegerField())))
+    sql, params = queryset.query.sql_with_params()
+
+    instantes, tipos, platos = array('q'), array('b'), array('q')
+    lote = _config()['LOTE']
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        while filas := cursor.fetchmany(lote):
+            columna_instantes, columna_tipos, columna_platos = zip(*filas)
+            instantes.extend(columna_instantes)
+            tipos.extend(columna_tipos)
+            platos.extend(columna_platos)
+    return instantes, tipos, platos
+
+
+def contar(instantes, tipos, platos, inicios, semana):
+    """Una pasada por las columnas.
+
+    Devuelve ``(por_hora, por_plato)``: ``por_hora[i * NUM_TIPOS + tipo]``
+    son las visitas de ese tipo en la hora ``i`` de ``inicios``, y
+    ``por_plato[plato, semana]`` las visitas de tipo ``'plato'`` a cada plato.
+    Las visitas anteriores a ``inicios[0]`` no deben estar en las columnas.
+    """
+    plato_tipo = CODIGOS_TIPO['plato']
+    por_hora = [0] * (len(inicios) * NUM_TIPOS)
+    por_plato = Counter()
+    for instante, tipo, plato in zip(instantes, tipos, platos):
+        hora = bisect_right(inicios, instante) - 1
+        por_hora[hora * NUM_TIPOS + tipo] += 1
+        if tipo == plato_tipo and plato:
+            por_plato[plato, semana[hora]] += 1
+    return por_hora, por_plato
+
+
+def _variacion(actual, anterior):
+    """Cambio en porcentaje respecto a la semana anterior (``None`` si no hubo visitas)."""
+    if not anterior:
+        return None
+    return round((actual - anterior) * 100 / anterior, 1)
+
+
+def calcular(instantes, tipos, platos, primer_dia, semanas, nombres_platos=None):
+    """Los tres informes a partir de las columnas (ver ``informe``)."""
+    inicios, hora_de_semana, semana = horas_de_la_ventana(primer_dia, semanas)
+    por_hora, por_plato = contar(instantes, tipos, platos, inicios, semana)
+
+    mapa = [[0] * 24 for _ in range(7)]
+    por_semana = [[0] * NUM_TIPOS for _ in range(semanas)]
+    llegada = {CODIGOS_TIPO[t] for t in TIPOS_LLEGADA}
+    for hora, posicion in enumerate(hora_de_semana):
+        for tipo in range(NUM_TIPOS):
+            visitas = por_hora[hora * NUM_TIPOS + tipo]
+            por_semana[semana[hora]][tipo] += visitas
+            if tipo in llegada:
+                mapa[posicion // 24][posicion % 24] += visitas
+
+    actual, anterior = semanas - 1, semanas - 2
+    semana_a_semana = {}
+    for tipo, codigo in CODIGOS_TIPO.items():
+        esta = por_semana[actual][codigo]
+        pasada = por_semana[anterior][codigo] if anterior >= 0 else 0
+        semana_a_semana[tipo] = {'actual': esta, 'anterior': pasada, 'variacion': _variacion(esta, pasada)}
+
+    visitas_menu = sum(fila[CODIGOS_TIPO['menu']] for fila in por_semana)
+    vistas = Counter()
+    for (plato, _), n in por_plato.items():
+        vistas[plato] += n
+    nombres_platos = nombres_platos or {}
+    conversion = []
+    for plato, total in vistas.most_common():
+        esta, pasada = por_plato[plato, actual], por_plato[plato, anterior]
+        conversion.append({
+            'plato_id': plato,
+            'nombre': nombres_platos.get(plato, ''),
+            'vistas': total,
+            'conversion': round(total * 100 / visitas_menu, 1) if visitas_menu else None,
+            'semana_actual': esta,
+            'semana_anterior': pasada,
+            'variacion': _variacion(esta, pasada),
+        })
+
+    return {
+        'desde': primer_dia,
+        'semanas': semanas,
+        'visitas': len(instantes),
+        'mapa_de_calor': mapa,
+        'maximo_por_hora': max(max(fila) for fila in mapa),
+        'semana_a_semana': semana_a_semana,
+        'visitas_menu': visitas_menu,
+        'conversion': conversion,
+    }
+
+
+def clave_cache(restaurante_id, hoy):
+    return f'analitica:{restaurante_id}:{hoy.isoformat()}'
+
+
+def informe(restaurante, semanas=None):
+    """Informes de las últimas ``semanas`` semanas de ``restaurante``, desde la caché si están.
+
+    ``{'desde', 'semanas', 'visitas', 'mapa_de_calor', 'maximo_por_hora',
+    'semana_a_semana', 'visitas_menu', 'conversion'}``:
+
+    - ``mapa_de_calor[dia][hora]``: llegadas al menú (QR y menú) por día de la
+      semana (lunes 0) y hora local, sumando todas las semanas.
+    - ``semana_a_semana[tipo]``: ``{'actual', 'anterior', 'variacion'}`` de
+      los últimos 7 días frente a los 7 anteriores, por tipo de visita.
+    - ``conversion``: por plato visto, de más a menos visto, ``vistas`` de su
+      detalle, ``conversion`` (vistas por cada 100 visitas al menú) y sus
+      vistas de esta semana y la anterior.
+    """
+    config = _config()
+    semanas = semanas or config['SEMANAS']
+    hoy = timezone.localdate()
+    clave = clave_cache(restaurante.pk, hoy)
+    guardado = cache.get(clave)
+    if guardado is not None and guardado['semanas'] == semanas:
+        return guardado
+
+    primer_dia, desde, hasta = ventana(semanas, hoy)
+    instantes, tipos, platos = columnas_de_visitas(restaurante.pk, desde, hasta)
+    vistos = set(platos)
+    vistos.discard(0)
+    nombres = dict(Plato.objects.filter(id__in=vistos).values_list('id', 'nombre')) if vistos else {}
+    datos = calcular(instantes, tipos, platos, primer_dia, semanas, nombres)
+    cache.set(clave, datos, config['SEGUNDOS_CACHE'])
+    return datos
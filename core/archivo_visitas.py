@@ -0,0 +1,178 @@
+"""
+Retención de las visitas en bruto.
+
+El dashboard solo lee ``VisitDailyStat``, así que las filas de ``Visit`` más
+antiguas que ``ARCHIVO_VISITAS['DIAS']`` días se pueden sacar de la tabla:
+
+1. se exportan por meses a ``<DIRECTORIO>/visitas-AAAA-MM-<id>-<id>.csv.gz``
+   (el rango de ids evita pisar un archivo si una ejecución anterior se
+   interrumpió a medias),
+2. se comprueba, fila a fila (restaurante, día, tipo y plato), que el resumen
+   diario las cubre y, si no (por ejemplo, filas importadas con
+   ``bulk_create``), se completa con lo que cuentan,
+3. se borran por lotes de ``LOTE`` filas, cada lote en su propia transacción
+   para no bloquear las inserciones del menú público.
+
+Lo ejecuta ``python manage.py archivar_visitas``. Después, los días archivados
+solo están en el resumen: ``recalcular_estadisticas`` no recalcula antes de
+``primer_dia_recalculable()``.
+"""
+import csv
+import gzip
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import Visit, VisitDailyStat
+from .visitas import inicio_del_dia, resumen_diario
+
+CONFIG_POR_DEFECTO = {
+    'DIAS': 90,
+    'DIRECTORIO': None,
+    'LOTE': 5000,
+}
+
+COLUMNAS = ('id', 'restaurante_id', 'plato_id', 'tipo', 'timestamp')
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'ARCHIVO_VISITAS', {}))
+    return config
+
+
+def fecha_de_corte(dias):
+    """Las visitas anteriores a este instante se archivan (siempre a medianoche)."""
+    return inicio_del_dia(timezone.localdate() - timedelta(days=dias))
+
+
+def meses_a_archivar(corte):
+    """Rangos ``(inicio, fin)`` de cada mes con visitas anteriores a ``corte``."""
+    primera = Visit.objects.filter(timestamp__lt=corte).aggregate(Min('timestamp'))['timestamp__min']
+    if primera is None:
+        return []
+    rangos = []
+    inicio = inicio_del_dia(timezone.localdate(primera).replace(day=1))
+    while inicio < corte:
+        siguiente = inicio_del_dia((inicio.date() + timedelta(days=32)).replace(day=1))
+        rangos.append((inicio, min(siguiente, corte)))
+        inicio = siguiente
+    return rangos
+
+
+def exportar(visitas, directorio, mes):
+    """Escribe ``visitas`` en un CSV comprimido; devuelve la ruta y las filas."""
+    limites = visitas.aggregate(Min('id'), Max('id'))
+    ruta = Path(directorio) / f"visitas-{mes:%Y-%m}-{limites['id__min']}-{limites['id__max']}.csv.gz"
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, prefix='.tmp-')
+    filas = 0
+    with os.fdopen(descriptor, 'wb') as crudo, gzip.open(crudo, 'wt', newline='') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(COLUMNAS)
+        for fila in visitas.order_by('id').values_list(*COLUMNAS).iterator(chunk_size=5000):
+            escritor.writerow(fila[:-1] + (fila[-1].isoformat(),))
+            filas += 1
+    os.replace(temporal, ruta)
+    return ruta, filas
+
+
+def completar_resumen(visitas):
+    """Completa el resumen diario con las ``visitas`` que se van a archivar.
+
+    Cada fila del resumen (restaurante, día, tipo y plato) que cuente menos
+    que ``visitas`` sube hasta lo que cuentan ``visitas``, y las que faltan se
+    crean. Ninguna baja: puede incluir visitas de ese día archivadas en una
+    ejecución anterior. Devuelve los pares ``(restaurante_id, fecha)``
+    completados.
+    """
+    en_bruto = {
+        (fila['restaurante_id'], fila['fecha'], fila['tipo'], fila['plato_id']): fila['visitas']
+        for fila in resumen_diario(visitas)
+    }
+    if not en_bruto:
+        return []
+
+    existentes = {}
+    candidatas = VisitDailyStat.objects.filter(
+        restaurante_id__in={clave[0] for clave in en_bruto}, fecha__in={clave[1] for clave in en_bruto},
+    )
+    for fila in candidatas.iterator():
+        existentes[fila.restaurante_id, fila.fecha, fila.tipo, fila.plato_id] = fila
+
+    nuevas, cambiadas, completados = [], [], set()
+    for clave, total in en_bruto.items():
+        fila = existentes.get(clave)
+        if fila is None:
+            restaurante_id, fecha, tipo, plato_id = clave
+            nuevas.append(VisitDailyStat(
+                restaurante_id=restaurante_id, fecha=fecha, tipo=tipo, plato_id=plato_id, visitas=total,
+            ))
+        elif fila.visitas < total:
+            fila.visitas = total
+            cambiadas.append(fila)
+        else:
+            continue
+        completados.add(clave[:2])
+    with transaction.atomic():
+        VisitDailyStat.objects.bulk_create(nuevas, batch_size=1000)
+        VisitDailyStat.objects.bulk_update(cambiadas, ['visitas'], batch_size=1000)
+    return sorted(completados)
+
+
+def primer_dia_recalculable():
+    """Primer día cuyo resumen se puede reconstruir a partir de ``Visit``.
+
+    Los días anteriores al corte de ``ARCHIVO_VISITAS['DIAS']`` pueden estar
+    archivados, y también los anteriores a la visita más antigua que queda
+    (si se archivó con otro ``--dias``): de esos días solo queda el resumen.
+    ``None`` si no hay visitas en bruto.
+    """
+    primera = Visit.objects.aggregate(Min('timestamp'))['timestamp__min']
+    if primera is None:
+        return None
+    return max(timezone.localdate(primera), timezone.localdate() - timedelta(days=_config()['DIAS']))
+
+
+def borrar_por_lotes(visitas, lote):
+    borradas = 0
+    while True:
+        ids = list(visitas.order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return borradas
+        with transaction.atomic():
+            borradas += Visit.objects.filter(id__in=ids).delete()[0]
+
+
+def archivar_visitas(dias=None, directorio=None, lote=None, progreso=None):
+    """Exporta, resume y borra las visitas anteriores a ``dias`` días.
+
+    Devuelve una lista de ``(ruta, filas)`` con los archivos escritos.
+    """
+    config = _config()
+    dias = config['DIAS'] if dias is None else dias
+    directorio = directorio or config['DIRECTORIO'] or Path(settings.BASE_DIR) / 'archivo' / 'visitas'
+    lote = lote or config['LOTE']
+
+    archivos = []
+    for inicio, fin in meses_a_archivar(fecha_de_corte(dias)):
+        visitas = Visit.objects.filter(timestamp__gte=inicio, timestamp__lt=fin)
+        ultimo = visitas.aggregate(Max('id'))['id__max']
+        if ultimo is None:
+            continue
+        # Solo se borra lo exportado; lo que llegue mientras tanto espera a la próxima vez
+        visitas = visitas.filter(id__lte=ultimo)
+        ruta, filas = exportar(visitas, directorio, inicio)
+        completar_resumen(visitas)
+        borrar_por_lotes(visitas, lote)
+        archivos.append((ruta, filas))
+        if progreso:
+            progreso(ruta, filas)
+    return archivos
@@ -0,0 +1,33 @@
+"""
+Precarga de los workers.
+
+Sin precarga, la primera petición de cada worker paga la compilación de sus
+plantillas y la construcción del resolvedor de URLs. ``precargar()`` lo hace
+al arrancar: compila todas las plantillas de ``core/templates``, que quedan
+en el loader con caché (Django lo activa siempre que ``TEMPLATES`` no define
+``loaders``, también con ``DEBUG``, y lo vacía solo cuando cambia una
+plantilla), e importa las vistas al llenar el resolvedor.
+
+La llaman ``menu_digital/wsgi.py`` y ``menu_digital/asgi.py``; los comandos
+de ``manage.py`` y las pruebas no la pagan.
+"""
+from pathlib import Path
+
+from django.template import engines
+from django.urls import get_resolver
+
+DIRECTORIO_PLANTILLAS = Path(__file__).resolve().parent / 'templates'
+
+
+def nombres_de_plantillas(directorio=DIRECTORIO_PLANTILLAS):
+    return sorted(ruta.relative_to(directorio).as_posix() for ruta in directorio.rglob('*.html'))
+
+
+def precargar():
+    """Compila las plantillas y llena el resolvedor de URLs; devuelve las plantillas compiladas."""
+    motor = engines['django']
+    nombres = nombres_de_plantillas()
+    for nombre in nombres:
+        motor.get_template(nombre)
+    get_resolver().reverse_dict  # importa las vistas y prepara {% url %}
+    return nombres
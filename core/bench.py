@@ -0,0 +1,197 @@
+"""
+Utilidades compartidas por ``python manage.py benchmark`` y
+``python manage.py generar_datos``.
+
+Los benchmarks se ejecutan sobre una base de datos temporal (igual que las
+pruebas), así que nunca tocan ``db.sqlite3`` ni los archivos subidos.
+"""
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from .models import Categoria, Plato, Restaurante, Visit, VisitDailyStat
+from .visitas import reconstruir_resumen
+
+
+@contextmanager
+def base_de_datos_temporal():
+    """Crea una base de datos de prueba y un MEDIA_ROOT temporal."""
+    setup_test_environment(debug=False)
+    nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        # Los QR se generan en el mismo hilo: la base en memoria no admite
+        # escrituras simultáneas desde el pool de hilos
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media, QR_TAREAS={'SINCRONO': True}):
+            yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        teardown_test_environment()
+
+
+def crear_restaurante_demo(nombre='Demo', categorias=5, platos_por_categoria=10):
+    """Crea un restaurante con su dueño, categorías y platos."""
+    dueño = User.objects.create_user(username=f'{nombre}-{User.objects.count()}', password='bench')
+    restaurante = Restaurante.objects.create(dueño=dueño, nombre=nombre)
+    for c in range(categorias):
+        categoria = Categoria.objects.create(restaurante=restaurante, nombre=f'Categoría {c}')
+        Plato.objects.bulk_create([
+            Plato(
+                categoria=categoria,
+                nombre=f'Plato {c}-{p}',
+                descripcion='Descripción de prueba ' * 5,
+                precio=Decimal('9.90'),
+            )
+            for p in range(platos_por_categoria)
+        ])
+    return restaurante
+
+
+def generar_datos(restaurantes, categorias, platos, visitas, dias=30, prefijo='demo',
+                  password='demo', semilla=0, lote=10_000, progreso=None):
+    """Crea datos de carga con ``bulk_create``.
+
+    ``restaurantes`` restaurantes (dueños ``<prefijo>-<n>`` con contraseña
+    ``password``), cada uno con ``categorias`` categorías de ``platos`` platos,
+    y ``visitas`` visitas repartidas al azar entre todos en los últimos
+    ``dias`` días. Al final calcula el resumen diario de esas visitas. No genera
+    códigos QR. Devuelve la lista de restaurantes creados.
+    """
+    azar = random.Random(semilla)
+    hash_password = make_password(password)
+
+    with transaction.atomic():
+        usuarios = User.objects.bulk_create([
+            User(username=f'{prefijo}-{n}', password=hash_password) for n in range(restaurantes)
+        ], batch_size=lote)
+        creados = Restaurante.objects.bulk_create([
+            Restaurante(dueño=usuario, nombre=f'Restaurante {prefijo} {n}', slug=f'{prefijo}-{n}')
+            for n, usuario in enumerate(usuarios)
+        ], batch_size=lote)
+        secciones = Categoria.objects.bulk_create([
+            Categoria(restaurante=restaurante, nombre=f'Categoría {c}')
+            for restaurante in creados for c in range(categorias)
+        ], batch_size=lote)
+
+        pendientes = []
+        for categoria in secciones:
+            for p in range(platos):
+                pendientes.append(Plato(
+                    categoria=categoria,
+                    nombre=f'Plato {p}',
+                    descripcion='Descripción del plato de prueba. ' * azar.randint(1, 6),
+                    precio=Decimal(azar.randint(150, 4000)) / 100,
+                    disponible=azar.random() > 0.1,
+                ))
+            if len(pendientes) >= lote:
+                Plato.objects.bulk_create(pendientes)
+                pendientes = []
+        Plato.objects.bulk_create(pendientes)
+
+    platos_por_restaurante = {}
+    for restaurante_id, plato_id in Plato.objects.filter(
+            categoria__restaurante__in=creados).values_list('categoria__restaurante_id', 'id'):
+        platos_por_restaurante.setdefault(restaurante_id, []).append(plato_id)
+
+    ahora = timezone.now()
+    segundos = dias * 24 * 3600
+    ids = [r.id for r in creados]
+    for inicio in range(0, visitas, lote):
+        filas = []
+        for _ in range(min(lote, visitas - inicio)):
+            restaurante_id = azar.choice(ids)
+            platos_del_restaurante = platos_por_restaurante.get(restaurante_id)
+            con_plato = platos_del_restaurante and azar.random() < 0.3
+            filas.append(Visit(
+                restaurante_id=restaurante_id,
+                plato_id=azar.choice(platos_del_restaurante) if con_plato else None,
+                tipo='plato' if con_plato else azar.choice(('menu', 'menu', 'menu', 'qr')),
+                timestamp=ahora - timedelta(seconds=azar.randrange(segundos)),
+            ))
+        with transaction.atomic():
+            Visit.objects.bulk_create(filas)
+        if progreso:
+            progreso(inicio + len(filas), visitas)
+
+    # Solo los restaurantes nuevos (de 500 en 500): el resumen del resto no se toca
+    for inicio in range(0, len(ids), 500):
+        grupo = ids[inicio:inicio + 500]
+        reconstruir_resumen(
+            Visit.objects.filter(restaurante_id__in=grupo),
+            VisitDailyStat.objects.filter(restaurante_id__in=grupo),
+            lote,
+        )
+    return creados
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta ``funcion`` ``repeticiones`` veces y resume las latencias."""
+    tiempos = []
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    total = time.perf_counter() - inicio
+    return resumir(tiempos, total)
+
+
+def medir_en_hilos(funcion, repeticiones, concurrencia):
+    """Como ``medir``, con ``concurrencia`` hilos llamando a ``funcion`` a la vez (WSGI)."""
+    def cronometrar(_):
+        t0 = time.perf_counter()
+        funcion()
+        return time.perf_counter() - t0
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        tiempos = list(pool.map(cronometrar, range(repeticiones)))
+    return resumir(tiempos, time.perf_counter() - inicio)
+
+
+async def amedir(corrutina, repeticiones, concurrencia):
+    """Como ``medir``, con hasta ``concurrencia`` corrutinas en vuelo (ASGI)."""
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def cronometrar():
+        async with semaforo:
+            t0 = time.perf_counter()
+            await corrutina()
+            return time.perf_counter() - t0
+
+    inicio = time.perf_counter()
+    tiempos = await asyncio.gather(*(cronometrar() for _ in range(repeticiones)))
+    return resumir(tiempos, time.perf_counter() - inicio)
+
+
+def resumir(tiempos, total):
+    ordenados = sorted(tiempos)
+
+    def percentil(p):
+        indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+        return ordenados[indice] * 1000
+
+    return {
+        'peticiones': len(tiempos),
+        'req_s': round(len(tiempos) / total, 1) if total else 0.0,
+        'media_ms': round(statistics.fmean(tiempos) * 1000, 3),
+        'p50_ms': round(percentil(50), 3),
+        'p95_ms': round(percentil(95), 3),
+        'p99_ms': round(percentil(99), 3),
+    }
@@ -0,0 +1,135 @@
+"""
+Búsqueda de platos dentro del menú de un restaurante.
+
+El índice lo crea la migración ``0011_busqueda_platos``: una tabla FTS5 en
+SQLite y un índice GIN de ``tsvector`` en PostgreSQL, ambos sin distinguir
+acentos ni mayúsculas. Cada palabra buscada se trata como prefijo
+("marg" encuentra "Margarita"). Si el motor no tiene índice se usa
+``icontains``.
+
+En SQLite el restaurante de cada plato está copiado en el índice y lo
+mantienen triggers sobre ``core_plato`` y ``core_categoria`` (migraciones
+0011 y 0013). Una migración que reconstruya una de esas tablas (en SQLite,
+cualquier ``AlterField``) borra sus triggers sin avisar: hay que volver a
+crearlos en la misma migración, o las búsquedas dejan de ver los cambios y
+pueden mostrar platos de otro restaurante.
+
+``buscar_platos`` devuelve los resultados y las facetas de disponibilidad y
+de rangos de precio (``RANGOS_PRECIO``), calculadas sobre todas las
+coincidencias del texto antes de aplicar los filtros de precio y
+disponibilidad.
+"""
+import re
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Plato
+
+RANGOS_PRECIO = (Decimal(5), Decimal(10), Decimal(20), Decimal(50))
+MAX_RESULTADOS = 50
+
+_con_indice = {}
+
+
+def palabras(texto):
+    return re.findall(r'\w+', texto.lower())[:8]
+
+
+def indice_disponible():
+    """Si la base de datos actual tiene el índice de la migración."""
+    clave = (connection.alias, connection.settings_dict['NAME'])
+    if clave not in _con_indice:
+        if connection.vendor == 'sqlite':
+            _con_indice[clave] = 'core_plato_fts' in connection.introspection.table_names()
+        else:
+            _con_indice[clave] = connection.vendor == 'postgresql'
+    return _con_indice[clave]
+
+
+def coincidencias(restaurante, texto):
+    """Platos del restaurante cuyo nombre o descripción contienen ``texto``."""
+    terminos = palabras(texto)
+    if not terminos:
+        return Plato.objects.none()
+    if not indice_disponible():
+        return coincidencias_sin_indice(Plato.objects.filter(categoria__restaurante=restaurante), terminos)
+
+    # El índice ya filtra por restaurante: sin el JOIN con categoría fuera de
+    # la subconsulta, SQLite recorre las coincidencias en vez de buscar cada
+    # una dentro de cada categoría
+    if connection.vendor == 'sqlite':
+        consulta = ' AND '.join(f'"{t}"*' for t in terminos)
+        return Plato.objects.filter(id__in=RawSQL(
+            "SELECT rowid FROM core_plato_fts WHERE core_plato_fts MATCH %s",
+            [f'restaurante:r{restaurante.id} AND {{nombre descripcion}}: ({consulta})'],
+        ))
+    consulta = ' & '.join(f'{t}:*' for t in terminos)
+    return Plato.objects.filter(id__in=RawSQL(
+        "SELECT p.id FROM core_plato p JOIN core_categoria c ON c.id = p.categoria_id "
+        "WHERE c.restaurante_id = %s "
+        "AND to_tsvector('es_sin_acentos', p.nombre || ' ' || p.descripcion) "
+        "@@ to_tsquery('es_sin_acentos', %s)",
+        [restaurante.id, consulta],
+    ))
+
+
+def coincidencias_sin_indice(platos, terminos):
+    for termino in terminos:
+        platos = platos.filter(Q(nombre__icontains=termino) | Q(descripcion__icontains=termino))
+    return platos
+
+
+def buscar_platos(restaurante, texto, precio_min=None, precio_max=None, disponible=None,
+                  limite=MAX_RESULTADOS):
+    """Resultados y facetas de la búsqueda ``texto``; dos consultas en total."""
+    platos = coincidencias(restaurante, texto)
+    facetas = platos.aggregate(**_agregados_de_facetas())
+
+    if precio_min is not None:
+        platos = platos.filter(precio__gte=precio_min)
+    if precio_max is not None:
+        platos = platos.filter(precio__lte=precio_max)
+    if disponible is not None:
+        platos = platos.filter(disponible=disponible)
+    resultados = list(
+        platos.order_by('categoria_id', 'nombre')
+        .values('id', 'nombre', 'descripcion', 'precio', 'disponible', 'categoria__nombre')[:limite]
+    )
+    for plato in resultados:
+        plato['categoria'] = plato.pop('categoria__nombre')
+
+    return {
+        'total': facetas.pop('total'),
+        'resultados': resultados,
+        'facetas': {
+            'disponible': {'si': facetas.pop('disponibles'), 'no': facetas.pop('agotados')},
+            'precio': [
+                {'desde': desde, 'hasta': hasta, 'platos': facetas[f'rango_{n}']}
+                for n, (desde, hasta) in enumerate(_rangos())
+            ],
+        },
+    }
+
+
+def _rangos():
+    limites = (None, *RANGOS_PRECIO, None)
+    return list(zip(limites, limites[1:]))
+
+
+def _agregados_de_facetas():
+    agregados = {
+        'total': Count('id'),
+        'disponibles': Count('id', filter=Q(disponible=True)),
+        'agotados': Count('id', filter=Q(disponible=False)),
+    }
+    for n, (desde, hasta) in enumerate(_rangos()):
+        condicion = Q()
+        if desde is not None:
+            condicion &= Q(precio__gte=desde)
+        if hasta is not None:
+            condicion &= Q(precio__lt=hasta)
+        agregados[f'rango_{n}'] = Count('id', filter=condicion)
+    return agregados
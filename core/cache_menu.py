@@ -0,0 +1,39 @@
+"""
+Caché y validación condicional del menú público.
+
+``components/menu_publico.html`` guarda el bloque de categorías y platos con
+``{% cache %}``, con clave por ``Restaurante.slug`` y ``menu_actualizado``.
+Las señales de ``core/signals.py`` actualizan ``menu_actualizado`` cada vez
+que cambia el restaurante, una de sus categorías o uno de sus platos (desde
+las vistas, el admin o el perfil), así que la clave cambia sola y la entrada
+anterior deja de usarse, también en los demás procesos del servidor.
+
+La misma marca de tiempo sirve para el ETag y el Last-Modified del menú.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Categoria, Restaurante
+
+
+def segundos_cache_menu():
+    return getattr(settings, 'MENU_CACHE_SEGUNDOS', 60 * 60 * 24)
+
+
+def version_menu(restaurante):
+    """Versión del menú: microsegundos de ``menu_actualizado``."""
+    return int(restaurante.menu_actualizado.timestamp() * 1_000_000)
+
+
+def etag_menu(restaurante):
+    return f'"{restaurante.pk}-{version_menu(restaurante)}"'
+
+
+def marcar_menu_actualizado(restaurante_id=None, categoria_id=None):
+    """Mueve ``menu_actualizado`` al momento actual con un solo UPDATE."""
+    restaurantes = Restaurante.objects.all()
+    if categoria_id is not None:
+        restaurantes = restaurantes.filter(id__in=Categoria.objects.filter(id=categoria_id).values('restaurante_id'))
+    else:
+        restaurantes = restaurantes.filter(id=restaurante_id)
+    restaurantes.update(menu_actualizado=timezone.now())
@@ -0,0 +1,105 @@
+"""
+Datos del dashboard del dueño, en dos fragmentos que se cachean por separado.
+
+- Estadísticas: salen del resumen diario (``VisitDailyStat``) y cambian con
+  cada visita, así que el fragmento se guarda ``DASHBOARD_ESTADISTICAS_SEGUNDOS``
+  (un minuto por defecto) con clave por restaurante y día.
+- Categorías: una página de categorías con sus platos y cuántos tiene cada
+  una. Se guarda con la versión del menú (ver core/cache_menu.py), igual que
+  el menú público, así que cualquier cambio la invalida.
+
+``pages/dashboard.html`` incluye los dos fragmentos y las vistas
+``dashboard_estadisticas`` y ``dashboard_categorias`` los sirven sueltos para
+paginar o refrescar sin recargar la página, y ``dashboard_eventos`` manda
+``contadores`` al conectarse y luego solo lo que suma cada lote de visitas
+(ver core/eventos.py).
+
+Las plantillas llaman a estas funciones solo si el fragmento no está en
+caché: con las dos entradas guardadas el dashboard consulta únicamente la
+sesión, el usuario y el restaurante.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Plato
+
+CATEGORIAS_POR_PAGINA = 3
+
+
+def segundos_cache_estadisticas():
+    return getattr(settings, 'DASHBOARD_ESTADISTICAS_SEGUNDOS', 60)
+
+
+def numero_de_pagina(valor):
+    """Número de página pedido; cualquier valor no numérico es la primera."""
+    try:
+        return max(int(valor), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def estadisticas(restaurante):
+    """Visitas de hoy y de los últimos 14 días, por día, y los platos más vistos."""
+    hoy = timezone.localdate()
+    resumen = restaurante.estadisticas
+
+    # Para gráfico: visitas agrupadas por día en últimos 14 días
+    stats_dias = list(resumen.filter(fecha__gte=hoy - timedelta(days=13))
+        .values(dia=F('fecha'))
+        .annotate(total=Sum('visitas'))
+        .order_by('dia'))
+
+    top_platos = list(resumen
+        .filter(plato__isnull=False)
+        .values('plato__nombre')
+        .annotate(veces=Sum('visitas'))
+        .order_by('-veces')[:5])
+
+    return {
+        'visitas_hoy': sum(d['total'] for d in stats_dias if d['dia'] == hoy),
+        'visitas_ultimas_2semanas': sum(d['total'] for d in stats_dias),
+        'stats_dias': stats_dias,
+        'top_platos': top_platos,
+    }
+
+
+def contadores(restaurante):
+    """Estado inicial de los contadores que el dashboard actualiza en vivo.
+
+    ``{'fecha', 'visitas_hoy', 'visitas_ultimas_2semanas', 'platos': {id:
+    {'nombre', 'visitas'}}}``, con todos los platos vistos (no solo los cinco
+    primeros) para poder reordenarlos al llegar visitas nuevas.
+    """
+    hoy = timezone.localdate()
+    resumen = restaurante.estadisticas
+    totales = resumen.filter(fecha__gte=hoy - timedelta(days=13)).aggregate(
+        visitas_hoy=Coalesce(Sum('visitas', filter=Q(fecha=hoy)), 0),
+        visitas_ultimas_2semanas=Coalesce(Sum('visitas'), 0),
+    )
+    platos = (resumen
+        .filter(plato__isnull=False)
+        .values_list('plato_id', 'plato__nombre')
+        .annotate(Sum('visitas'))
+        .order_by())
+    return {
+        'fecha': hoy.isoformat(),
+        **totales,
+        'platos': {id: {'nombre': nombre, 'visitas': visitas} for id, nombre, visitas in platos},
+    }
+
+
+def pagina_de_categorias(restaurante, numero):
+    """Página ``numero`` de categorías con ``num_platos`` y sus platos ya cargados.
+
+    Siempre tres consultas: el total de categorías, la página y los platos.
+    """
+    categorias = (restaurante.categorias
+        .order_by('nombre')
+        .annotate(num_platos=Count('platos'))
+        .prefetch_related(Prefetch('platos', queryset=Plato.objects.order_by('id'))))
+    return Paginator(categorias, CATEGORIAS_POR_PAGINA).get_page(numero)
@@ -0,0 +1,121 @@
+"""
+Avisos en vivo para el dashboard (Server-Sent Events).
+
+Cada vaciado del buffer de visitas (ver core/visitas.py) publica aquí, por
+restaurante, lo que ese lote suma a sus contadores: visitas del día y
+visitas de cada plato. La vista ``dashboard_eventos`` se suscribe y reenvía
+cada aviso al navegador, así que los dashboards abiertos se actualizan sin
+volver a consultar la base de datos: hay un solo publicador (el vaciado) y
+tantos suscriptores como dashboards conectados.
+
+Los suscriptores son colas de asyncio de cada conexión; ``publicar`` se
+puede llamar desde cualquier hilo porque entrega con
+``call_soon_threadsafe``. Si un cliente lento llena su cola
+(``EVENTOS_DASHBOARD['MAX_PENDIENTES']``) se descartan sus avisos y se le
+manda ``RESINCRONIZAR`` para que vuelva a pedir los contadores completos.
+
+El canal vive en la memoria del proceso: con varios procesos de servidor,
+cada dashboard solo recibe las visitas que guarda su mismo proceso hasta
+que se reconecta. Para repartir entre procesos habría que cambiar este
+módulo por un canal compartido (Redis, LISTEN/NOTIFY de PostgreSQL) con la
+misma interfaz.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+CONFIG_POR_DEFECTO = {
+    'LATIDO': 15,
+    'MAX_PENDIENTES': 100,
+}
+
+RESINCRONIZAR = object()
+
+_lock = threading.Lock()
+_suscriptores = defaultdict(set)
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'EVENTOS_DASHBOARD', {}))
+    return config
+
+
+def latido():
+    """Segundos sin avisos tras los que el flujo SSE envía un comentario de latido."""
+    return _config()['LATIDO']
+
+
+@contextmanager
+def suscribir(restaurante_id):
+    """Cola con los avisos de ``restaurante_id`` mientras dure el bloque.
+
+    Hay que llamarla desde el event loop que va a leer la cola.
+    """
+    cola = asyncio.Queue(maxsize=_config()['MAX_PENDIENTES'])
+    entrada = (asyncio.get_running_loop(), cola)
+    with _lock:
+        _suscriptores[restaurante_id].add(entrada)
+    try:
+        yield cola
+    finally:
+        with _lock:
+            _suscriptores[restaurante_id].discard(entrada)
+            if not _suscriptores[restaurante_id]:
+                del _suscriptores[restaurante_id]
+
+
+def suscriptores(restaurante_id=None):
+    with _lock:
+        if restaurante_id is None:
+            return sum(len(entradas) for entradas in _suscriptores.values())
+        return len(_suscriptores.get(restaurante_id, ()))
+
+
+def publicar(restaurante_id, datos):
+    """Reparte ``datos`` entre los suscriptores de ``restaurante_id``; devuelve cuántos son."""
+    with _lock:
+        entradas = list(_suscriptores.get(restaurante_id, ()))
+    for loop, cola in entradas:
+        try:
+            loop.call_soon_threadsafe(_entregar, cola, datos)
+        except RuntimeError:
+            pass  # el event loop ya se cerró; la suscripción se retira sola
+    return len(entradas)
+
+
+def publicar_visitas(visitas, nombres_platos):
+    """Publica lo que suman ``visitas`` (ya guardadas) a cada restaurante.
+
+    Un aviso por restaurante y día: ``{'fecha', 'visitas', 'platos': {id:
+    {'nombre', 'visitas'}}}``. No hace nada si nadie está suscrito.
+    """
+    with _lock:
+        con_suscriptores = set(_suscriptores)
+    if not con_suscriptores:
+        return
+    avisos = {}
+    for visita in visitas:
+        if visita.restaurante_id not in con_suscriptores:
+            continue
+        fecha = timezone.localdate(visita.timestamp).isoformat()
+        aviso = avisos.setdefault((visita.restaurante_id, fecha), {'fecha': fecha, 'visitas': 0, 'platos': {}})
+        aviso['visitas'] += 1
+        if visita.plato_id is not None:
+            plato = aviso['platos'].setdefault(
+                visita.plato_id, {'nombre': nombres_platos[visita.plato_id], 'visitas': 0})
+            plato['visitas'] += 1
+    for (restaurante_id, _), aviso in avisos.items():
+        publicar(restaurante_id, aviso)
+
+
+def _entregar(cola, datos):
+    if cola.full():
+        while not cola.empty():
+            cola.get_nowait()
+        datos = RESINCRONIZAR
+    cola.put_nowait(datos)
@@ -0,0 +1,163 @@
+"""
+Variantes optimizadas de las imágenes subidas (platos y logos).
+
+Al subir una imagen se le quitan los metadatos (EXIF con la ubicación GPS,
+XMP, comentarios) antes de guardarla (``sin_metadatos``) y se generan copias
+en varios anchos (``ANCHOS``) en AVIF y WebP, más un JPEG de respaldo. Las
+rutas se guardan en el campo ``*_variantes`` del modelo::
+
+    {'origen': 'platos/pizza.jpg',
+     'avif': [[320, 'platos/variantes/pizza-320.avif'], ...],
+     'webp': [[320, 'platos/variantes/pizza-320.webp'], ...],
+     'jpeg': [[960, 'platos/variantes/pizza-960.jpg']]}
+
+El menú público usa las variantes de los platos y el dashboard las del logo
+(``fuentes_de_imagen``).
+
+``variantes_de_imagen`` solo usa Pillow, así que se puede ejecutar en procesos
+secundarios (ver ``manage.py procesar_imagenes``). Pillow se importa dentro
+de las funciones que lo usan: ``core.signals`` y ``core.menu`` importan este
+módulo al arrancar y la mayoría de los procesos nunca procesan una imagen.
+"""
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+ANCHOS = (320, 640, 960)
+
+# Formato -> (formato de Pillow, extensión, opciones de guardado)
+FORMATOS = {
+    'avif': ('AVIF', 'avif', {'quality': 55, 'speed': 8}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+RESPALDO = ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True})
+
+
+def formatos_disponibles():
+    from PIL import features
+
+    return [f for f in FORMATOS if features.check(f)]
+
+
+def sin_metadatos(datos):
+    """Devuelve la imagen ``datos`` en su mismo formato, sin metadatos.
+
+    La orientación EXIF se aplica a los píxeles antes de descartarla. Un
+    JPEG que no hay que girar se guarda con sus mismas tablas de
+    cuantización (``quality='keep'``), sin volver a comprimirlo. Se conserva
+    el perfil de color ICC. Las animaciones (GIF, WebP) se devuelven tal
+    cual: al guardarlas de nuevo se perderían fotogramas o sus duraciones.
+    """
+    from PIL import ExifTags, Image, ImageOps
+
+    with Image.open(BytesIO(datos)) as original:
+        if getattr(original, 'is_animated', False):
+            return datos
+        formato = original.format
+        girar = original.getexif().get(ExifTags.Base.Orientation, 1) != 1
+        imagen = ImageOps.exif_transpose(original) if girar else original
+        opciones = {'icc_profile': original.info.get('icc_profile')}
+        if formato == 'JPEG':
+            opciones['quality'] = 90 if girar else 'keep'
+        for clave in ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment'):
+            imagen.info.pop(clave, None)
+        buffer = BytesIO()
+        imagen.save(buffer, format=formato, exif=b'', **opciones)
+    return buffer.getvalue()
+
+
+def variantes_de_imagen(datos):
+    """Genera las variantes de una imagen.
+
+    Devuelve ``{formato: [(ancho, bytes), ...]}``; el respaldo ``'jpeg'``
+    tiene una sola entrada con el ancho mayor.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(datos)) as original:
+        # Aplica la orientación EXIF antes de descartar los metadatos
+        imagen = ImageOps.exif_transpose(original)
+        imagen = imagen.convert('RGBA' if imagen.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    anchos = [a for a in ANCHOS if a < imagen.width] or [imagen.width]
+    if imagen.width < ANCHOS[-1] and imagen.width not in anchos:
+        anchos.append(imagen.width)
+
+    copias = {}
+    for ancho in anchos:
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        copias[ancho] = imagen.resize((ancho, alto), Image.Resampling.LANCZOS)
+
+    resultado = {}
+    for formato in formatos_disponibles():
+        formato_pil, _, opciones = FORMATOS[formato]
+        resultado[formato] = [(ancho, _codificar(copia, formato_pil, opciones)) for ancho, copia in copias.items()]
+
+    ancho_mayor = anchos[-1]
+    respaldo = copias[ancho_mayor]
+    if respaldo.mode == 'RGBA':
+        fondo = Image.new('RGB', respaldo.size, 'white')
+        fondo.paste(respaldo, mask=respaldo.getchannel('A'))
+        respaldo = fondo
+    resultado['jpeg'] = [(ancho_mayor, _codificar(respaldo, RESPALDO[0], RESPALDO[2]))]
+    return resultado
+
+
+def guardar_variantes(campo, variantes):
+    """Guarda las variantes de ``campo`` (un ImageFieldFile) en su storage.
+
+    Devuelve el diccionario que va en el campo ``*_variantes`` del modelo.
+    """
+    directorio, archivo = posixpath.split(campo.name)
+    base = posixpath.splitext(archivo)[0]
+    extensiones = {f: FORMATOS[f][1] for f in FORMATOS}
+    extensiones['jpeg'] = RESPALDO[1]
+
+    guardadas = {'origen': campo.name}
+    for formato, copias in variantes.items():
+        guardadas[formato] = [
+            [ancho, campo.storage.save(
+                posixpath.join(directorio, 'variantes', f'{base}-{ancho}.{extensiones[formato]}'),
+                ContentFile(datos),
+            )]
+            for ancho, datos in copias
+        ]
+    return guardadas
+
+
+def borrar_variantes(storage, variantes):
+    for formato, copias in (variantes or {}).items():
+        if formato == 'origen':
+            continue
+        for _, nombre in copias:
+            storage.delete(nombre)
+
+
+def srcset(storage, variantes, formato):
+    return ', '.join(f'{storage.url(nombre)} {ancho}w' for ancho, nombre in (variantes or {}).get(formato, []))
+
+
+def url_respaldo(storage, variantes):
+    copias = (variantes or {}).get('jpeg')
+    return storage.url(copias[0][1]) if copias else None
+
+
+def fuentes_de_imagen(campo, variantes):
+    """URL de respaldo y ``srcset`` de cada formato, para un ``<picture>``."""
+    if not campo:
+        return None
+    return {
+        'url': url_respaldo(campo.storage, variantes) or campo.url,
+        'srcset_avif': srcset(campo.storage, variantes, 'avif'),
+        'srcset_webp': srcset(campo.storage, variantes, 'webp'),
+    }
+
+
+def _codificar(imagen, formato, opciones):
+    if formato == 'JPEG' and imagen.mode != 'RGB':
+        imagen = imagen.convert('RGB')
+    buffer = BytesIO()
+    # Sin exif=...: Pillow no copia los metadatos de la imagen original
+    imagen.save(buffer, format=formato, **opciones)
+    return buffer.getvalue()
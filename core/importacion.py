@@ -0,0 +1,206 @@
+"""
+Importación y exportación masiva del menú.
+
+Formato: una fila por plato con las columnas ``COLUMNAS``, en CSV (con
+cabecera) o en JSON Lines (un objeto por línea). También se acepta un
+``.json`` con una lista de objetos, aunque ese se lee entero en memoria.
+
+``importar_menu`` lee las filas de una en una, las valida con los campos de
+``CategoriaForm`` y ``PlatoForm`` y las escribe por lotes de ``LOTE`` con
+``bulk_create``/``bulk_update`` dentro de una sola transacción: si alguna fila
+no es válida no se guarda nada (los errores indican el número de fila, sin
+contar la cabecera). Un plato se identifica por su categoría y su
+nombre, así que volver a importar un archivo actualiza en lugar de duplicar.
+"""
+import csv
+import io
+import json
+from itertools import chain
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .cache_menu import marcar_menu_actualizado
+from .forms import CategoriaForm, PlatoForm
+from .models import Categoria, Plato
+from .publicacion import programar_publicacion
+
+COLUMNAS = ('categoria', 'nombre', 'descripcion', 'precio', 'disponible')
+FORMATOS = ('csv', 'jsonl')
+CAMPOS_ACTUALIZABLES = ('descripcion', 'precio', 'disponible')
+LOTE = 500
+MAX_ERRORES = 50
+
+VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'x'}
+
+
+class ErrorImportacion(Exception):
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__('; '.join(errores))
+
+
+def formato_de(nombre_archivo):
+    extension = nombre_archivo.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'jsonl'
+    raise ErrorImportacion([f"Formato no soportado: .{extension} (usa .csv o .jsonl)"])
+
+
+def leer_filas(archivo, formato):
+    """Itera las filas de ``archivo`` (binario) como diccionarios."""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    try:
+        if formato == 'csv':
+            yield from csv.DictReader(texto)
+            return
+        primera = texto.readline()
+        if primera.lstrip().startswith('['):
+            yield from json.loads(primera + texto.read())
+            return
+        for numero, linea in enumerate(chain([primera], texto), start=1):
+            if linea.strip():
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    raise ErrorImportacion([f"Línea {numero}: JSON inválido"])
+    except UnicodeDecodeError:
+        raise ErrorImportacion(["El archivo no está en UTF-8"])
+    except (csv.Error, ValueError) as exc:
+        raise ErrorImportacion([f"Archivo mal formado: {exc}"])
+
+
+def importar_menu(restaurante, filas, lote=LOTE):
+    """Crea o actualiza las categorías y platos de ``filas``.
+
+    Devuelve un resumen con ``categorias_creadas``, ``platos_creados`` y
+    ``platos_actualizados``; lanza ``ErrorImportacion`` si hay filas inválidas.
+    """
+    resumen = {'categorias_creadas': 0, 'platos_creados': 0, 'platos_actualizados': 0}
+    categorias = {c.nombre: c for c in restaurante.categorias.all()}
+    errores = []
+    pendientes = []
+
+    with transaction.atomic():
+        for numero, fila in enumerate(filas, start=1):
+            datos, error = _validar(fila)
+            if error:
+                errores.append(f"Fila {numero}: {error}")
+                if len(errores) >= MAX_ERRORES:
+                    break
+                continue
+            if errores:
+                continue  # ya no se va a guardar nada; solo se siguen buscando errores
+            pendientes.append(datos)
+            if len(pendientes) >= lote:
+                _guardar_lote(restaurante, categorias, pendientes, resumen)
+                pendientes = []
+        if errores:
+            raise ErrorImportacion(errores)
+        _guardar_lote(restaurante, categorias, pendientes, resumen)
+
+        # bulk_create/bulk_update no envían señales: se avisa a mano
+        marcar_menu_actualizado(restaurante_id=restaurante.id)
+        programar_publicacion(restaurante.id)
+    return resumen
+
+
+# Los campos de los formularios, sin instanciar un formulario por fila (cada
+# instancia copia todos sus campos y widgets, que es lo que más cuesta)
+CAMPOS_CATEGORIA = {'nombre': CategoriaForm.base_fields['nombre']}
+CAMPOS_PLATO = {nombre: PlatoForm.base_fields[nombre] for nombre in ('nombre', 'descripcion', 'precio', 'disponible')}
+
+
+def _validar(fila):
+    if not isinstance(fila, dict):
+        return None, "no es un objeto"
+    disponible = _texto(fila.get('disponible'))
+    valores = {
+        'categoria': _texto(fila.get('categoria')),
+        'nombre': _texto(fila.get('nombre')),
+        'descripcion': _texto(fila.get('descripcion')),
+        'precio': _texto(fila.get('precio')),
+        'disponible': disponible.lower() in VERDADEROS if disponible else True,
+    }
+    datos, errores = {}, []
+    for columna, campo in [('categoria', CAMPOS_CATEGORIA['nombre']), *CAMPOS_PLATO.items()]:
+        try:
+            datos[columna] = campo.clean(valores[columna])
+        except ValidationError as exc:
+            errores.append(f"{columna}: {' '.join(exc.messages)}")
+    return (None, '; '.join(errores)) if errores else (datos, None)
+
+
+def _guardar_lote(restaurante, categorias, filas, resumen):
+    nuevas = {f['categoria'] for f in filas} - set(categorias)
+    if nuevas:
+        creadas = Categoria.objects.bulk_create(
+            [Categoria(restaurante=restaurante, nombre=nombre) for nombre in sorted(nuevas)]
+        )
+        categorias.update((c.nombre, c) for c in creadas)
+        resumen['categorias_creadas'] += len(creadas)
+
+    existentes = {
+        (p.categoria_id, p.nombre): p
+        for p in Plato.objects.filter(
+            categoria__in=[categorias[f['categoria']] for f in filas],
+            nombre__in={f['nombre'] for f in filas},
+        )
+    }
+    ahora = timezone.now()
+    crear, actualizar = [], {}
+    for fila in filas:
+        categoria = categorias[fila['categoria']]
+        plato = existentes.get((categoria.id, fila['nombre']))
+        if plato is None:
+            plato = Plato(categoria=categoria, nombre=fila['nombre'])
+            existentes[(categoria.id, fila['nombre'])] = plato
+            crear.append(plato)
+        elif plato.pk is not None:
+            # Solo se actualiza lo que cambia: bulk_update construye un CASE
+            # por fila y campo, y reimportar el mismo archivo no debe costar
+            if all(getattr(plato, campo) == fila[campo] for campo in CAMPOS_ACTUALIZABLES):
+                continue
+            plato.actualizado = ahora  # bulk_update no aplica auto_now
+            actualizar[plato.pk] = plato
+        for campo in CAMPOS_ACTUALIZABLES:
+            setattr(plato, campo, fila[campo])
+
+    Plato.objects.bulk_create(crear)
+    Plato.objects.bulk_update(actualizar.values(), [*CAMPOS_ACTUALIZABLES, 'actualizado'])
+    resumen['platos_creados'] += len(crear)
+    resumen['platos_actualizados'] += len(actualizar)
+
+
+def exportar_menu(restaurante, formato):
+    """Genera el menú en ``formato`` línea a línea, para ``StreamingHttpResponse``."""
+    platos = (
+        Plato.objects
+        .filter(categoria__restaurante=restaurante)
+        .order_by('categoria_id', 'id')
+        .values_list('categoria__nombre', 'nombre', 'descripcion', 'precio', 'disponible')
+    )
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(COLUMNAS)
+        for fila in platos.iterator(chunk_size=2000):
+            yield escritor.writerow(fila[:-1] + ('1' if fila[-1] else '0',))
+    else:
+        for fila in platos.iterator(chunk_size=2000):
+            datos = dict(zip(COLUMNAS, fila))
+            datos['precio'] = str(datos['precio'])
+            yield json.dumps(datos, ensure_ascii=False) + '\n'
+
+
+class _Eco:
+    """Pseudo-archivo para que ``csv.writer`` devuelva cada línea en vez de escribirla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
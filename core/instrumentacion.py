@@ -0,0 +1,249 @@
+"""
+Medición del rendimiento de cada petición.
+
+``InstrumentacionMiddleware`` mide, para una fracción ``MUESTREO`` de las
+peticiones, el número de consultas SQL y su tiempo, el tiempo de renderizado
+de plantillas y el tiempo total. Los resultados:
+
+* se envían en la cabecera ``Server-Timing`` (visibles en las DevTools), solo
+  a usuarios staff o con ``DEBUG``: al resto no se le cuenta cuántas
+  consultas hace cada página,
+* se guardan en un buffer circular en memoria de ``TAMANO_BUFFER`` entradas,
+  que resume la vista ``rendimiento`` (solo staff) con percentiles por vista,
+* se escriben en el log ``core.instrumentacion``; las vistas que pasan de
+  ``PRESUPUESTO_CONSULTAS`` consultas se registran como advertencia.
+
+El tiempo de plantillas lo mide el motor ``DjangoTemplatesMedidas``, que es
+el ``BACKEND`` de ``settings.TEMPLATES``. Configuración en
+``settings.INSTRUMENTACION``.
+"""
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as backend_django
+from django.utils.decorators import sync_and_async_middleware
+
+CONFIG_POR_DEFECTO = {
+    'ACTIVA': True,
+    'MUESTREO': 0.1,
+    'PRESUPUESTO_CONSULTAS': 20,
+    'TAMANO_BUFFER': 2000,
+}
+
+logger = logging.getLogger(__name__)
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+_lock = threading.Lock()
+_muestras = deque(maxlen=CONFIG_POR_DEFECTO['TAMANO_BUFFER'])
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'INSTRUMENTACION', {}))
+    return config
+
+
+class Medicion:
+    __slots__ = ('consultas', 'segundos_sql', 'segundos_plantillas')
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos_sql = 0.0
+        self.segundos_plantillas = 0.0
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    # execute_wrapper de Django: se llama en cada consulta de cada conexión.
+    # La medición viaja en un ContextVar, que sync_to_async copia al hilo
+    # donde corre el ORM cuando la vista es async.
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.segundos_sql += time.perf_counter() - inicio
+        medicion.consultas += 1
+
+
+def _añadir_medicion(sender, connection, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+def instalar_medicion():
+    """Engancha la medición de consultas a cada conexión al abrirla."""
+    connection_created.connect(_añadir_medicion, dispatch_uid='instrumentacion')
+    for conexion in connections.all(initialized_only=True):
+        _añadir_medicion(None, conexion)
+
+
+class PlantillaMedida(backend_django.Template):
+    """Plantilla que suma su tiempo de render a la medición en curso."""
+
+    def render(self, context=None, request=None):
+        medicion = _medicion_actual.get()
+        if medicion is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion.segundos_plantillas += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidas(backend_django.DjangoTemplates):
+    """Motor de plantillas de Django que mide el render de nivel superior.
+
+    Solo pasan por aquí ``render()``, ``render_to_string`` y
+    ``TemplateResponse``; los ``{% include %}`` quedan dentro de la
+    plantilla que los incluye.
+    """
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return PlantillaMedida(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            backend_django.reraise(exc, self)
+
+
+@sync_and_async_middleware
+def InstrumentacionMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            config = _config()
+            if not config['ACTIVA'] or random.random() >= config['MUESTREO']:
+                return await get_response(request)
+            medicion = Medicion()
+            token = _medicion_actual.set(medicion)
+            inicio = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _medicion_actual.reset(token)
+            total = time.perf_counter() - inicio
+            return _anotar(request, response, medicion, total, config, await _ave_server_timing(request))
+    else:
+        def middleware(request):
+            config = _config()
+            if not config['ACTIVA'] or random.random() >= config['MUESTREO']:
+                return get_response(request)
+            medicion = Medicion()
+            token = _medicion_actual.set(medicion)
+            inicio = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _medicion_actual.reset(token)
+            total = time.perf_counter() - inicio
+            return _anotar(request, response, medicion, total, config, _ve_server_timing(request))
+    return middleware
+
+
+def _anotar(request, response, medicion, total, config, server_timing):
+    """Guarda la muestra, añade Server-Timing si ``server_timing`` y avisa si se pasó del presupuesto."""
+    vista = request.resolver_match.view_name if request.resolver_match else request.path
+    muestra = {
+        'vista': vista,
+        'metodo': request.method,
+        'estado': response.status_code,
+        'consultas': medicion.consultas,
+        'sql_ms': round(medicion.segundos_sql * 1000, 3),
+        'plantillas_ms': round(medicion.segundos_plantillas * 1000, 3),
+        'total_ms': round(total * 1000, 3),
+        'sobre_presupuesto': medicion.consultas > config['PRESUPUESTO_CONSULTAS'],
+    }
+    guardar_muestra(muestra, config['TAMANO_BUFFER'])
+
+    if server_timing:
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={muestra["sql_ms"]};desc="{medicion.consultas} consultas"',
+            f'tpl;dur={muestra["plantillas_ms"]}',
+            f'total;dur={muestra["total_ms"]}',
+        ])
+    if muestra['sobre_presupuesto']:
+        logger.warning(
+            "%s hizo %d consultas (presupuesto: %d)",
+            vista, medicion.consultas, config['PRESUPUESTO_CONSULTAS'], extra={'rendimiento': muestra},
+        )
+    else:
+        logger.debug("%s %s %s ms", request.method, vista, muestra['total_ms'], extra={'rendimiento': muestra})
+    return response
+
+
+def _ve_server_timing(request):
+    if settings.DEBUG:
+        return True
+    # Las rutas de core/via_publica.py no pasan por la autenticación
+    usuario = getattr(request, 'user', None)
+    return usuario is not None and usuario.is_staff
+
+
+async def _ave_server_timing(request):
+    # En el event loop no se puede tocar request.user: si la vista no lo
+    # usó, es un objeto perezoso que consultaría la base de datos sin await
+    if settings.DEBUG:
+        return True
+    auser = getattr(request, 'auser', None)
+    return auser is not None and (await auser()).is_staff
+
+
+def guardar_muestra(muestra, tamano):
+    global _muestras
+    with _lock:
+        if _muestras.maxlen != tamano:
+            _muestras = deque(_muestras, maxlen=tamano)
+        _muestras.append(muestra)
+
+
+def vaciar_muestras():
+    with _lock:
+        _muestras.clear()
+
+
+def resumen_por_vista():
+    """Percentiles del tiempo total y medias de consultas por vista.
+
+    El buffer es de cada proceso: con varios workers cada uno resume solo
+    las peticiones que atendió.
+    """
+    with _lock:
+        muestras = list(_muestras)
+
+    por_vista = {}
+    for muestra in muestras:
+        por_vista.setdefault(muestra['vista'], []).append(muestra)
+
+    vistas = {}
+    for vista, lista in sorted(por_vista.items()):
+        totales = sorted(m['total_ms'] for m in lista)
+        vistas[vista] = {
+            'peticiones': len(lista),
+            'p50_ms': _percentil(totales, 50),
+            'p95_ms': _percentil(totales, 95),
+            'p99_ms': _percentil(totales, 99),
+            'consultas_media': round(statistics.fmean(m['consultas'] for m in lista), 1),
+            'consultas_max': max(m['consultas'] for m in lista),
+            'sql_ms_media': round(statistics.fmean(m['sql_ms'] for m in lista), 3),
+            'plantillas_ms_media': round(statistics.fmean(m['plantillas_ms'] for m in lista), 3),
+            'sobre_presupuesto': sum(m['sobre_presupuesto'] for m in lista),
+        }
+    return {'presupuesto_consultas': _config()['PRESUPUESTO_CONSULTAS'], 'vistas': vistas}
+
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
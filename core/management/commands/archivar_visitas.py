@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.archivo_visitas import archivar_visitas
+
+
+class Command(BaseCommand):
+    help = ("Exporta a CSV.gz por meses las visitas más antiguas que --dias, se asegura de que "
+            "el resumen diario las incluya y las borra de la tabla por lotes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int,
+                            help="Días de visitas en bruto que se conservan (por defecto ARCHIVO_VISITAS['DIAS']).")
+        parser.add_argument('--directorio', help="Carpeta de los archivos (por defecto ARCHIVO_VISITAS['DIRECTORIO']).")
+        parser.add_argument('--lote', type=int, help="Filas por DELETE.")
+
+    def handle(self, *args, **options):
+        def progreso(ruta, filas):
+            self.stdout.write(f"  {ruta}: {filas} visitas")
+
+        archivos = archivar_visitas(
+            dias=options['dias'],
+            directorio=options['directorio'],
+            lote=options['lote'],
+            progreso=progreso,
+        )
+        total = sum(filas for _, filas in archivos)
+        self.stdout.write(self.style.SUCCESS(f"{total} visitas archivadas en {len(archivos)} archivos."))
@@ -0,0 +1,465 @@
+import asyncio
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from array import array
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from itertools import count
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.bench import (
+    amedir, base_de_datos_temporal, crear_restaurante_demo, generar_datos, medir, medir_en_hilos, resumir,
+)
+from core import analitica, busqueda, dashboard, eventos
+from core.menu import a_json, cargar_menu, menu_a_dict, orjson, payload_menu
+from core.models import Plato, Visit
+from core.visitas import vaciar_visitas
+
+# Librerías pesadas que solo se importan al usarlas (ver core/qr.py y core/imagenes.py)
+DIFERIDOS = ('PIL', 'qrcode')
+
+_datos_de_carga = None
+
+
+def datos_de_carga(opciones):
+    """Genera una sola vez por ejecución los datos que usan los escenarios de carga."""
+    global _datos_de_carga
+    if _datos_de_carga is None:
+        _datos_de_carga = generar_datos(
+            restaurantes=opciones['restaurantes'],
+            categorias=opciones['categorias'],
+            platos=opciones['platos'],
+            visitas=opciones['visitas'],
+            prefijo='bench',
+            password='bench',
+        )
+    return _datos_de_carga
+
+
+def cliente_de(restaurante):
+    cliente = Client()
+    cliente.force_login(restaurante.dueño)
+    return cliente
+
+
+def escenario_visitas(opciones):
+    """Menú público con un INSERT por visita frente al registro por lotes."""
+    restaurante = crear_restaurante_demo()
+    cliente = Client()
+    url = reverse('menu_publico', args=[restaurante.slug])
+    repeticiones = opciones['repeticiones']
+
+    resultados = {}
+    with override_settings(VISITAS_BUFFER={'SINCRONO': True}):
+        resultados['insert_por_visita'] = medir(lambda: cliente.get(url), repeticiones)
+    with override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 5, 'SINCRONO': False}):
+        resultados['por_lotes'] = medir(lambda: cliente.get(url), repeticiones)
+        vaciar_visitas()
+    return resultados
+
+
+def escenario_serializacion(opciones):
+    """Tiempo de serializar el menú a JSON según su tamaño (orjson y json)."""
+    resultados = {}
+    for platos in (10, 100, 1000, 10000):
+        restaurante = crear_restaurante_demo(f'Serial {platos}', categorias=10, platos_por_categoria=platos // 10)
+        datos = menu_a_dict(restaurante, cargar_menu(restaurante))
+        vueltas = max(5, opciones['repeticiones'] * 100 // platos)
+        if orjson is not None:
+            resultados[f'orjson_{platos}'] = medir(lambda: orjson.dumps(datos, default=str), vueltas)
+        resultados[f'json_{platos}'] = medir(
+            lambda: json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')), vueltas)
+        resultados[f'bytes_{platos}'] = {'identity': len(a_json(datos)), 'gzip': len(payload_menu(restaurante)['gzip'])}
+    return resultados
+
+
+def escenario_menu_publico(opciones):
+    """Menú público con la caché de fragmentos fría y caliente."""
+    restaurantes = datos_de_carga(opciones)
+    urls = [reverse('menu_publico', args=[r.slug]) for r in restaurantes]
+    cliente = Client()
+    vuelta = count()
+
+    def sin_cache():
+        cache.clear()
+        cliente.get(urls[next(vuelta) % len(urls)])
+
+    resultados = {
+        'sin_cache': medir(sin_cache, opciones['repeticiones']),
+        'con_cache': medir(lambda: cliente.get(urls[next(vuelta) % len(urls)]), opciones['repeticiones']),
+    }
+    vaciar_visitas()
+    return resultados
+
+
+def escenario_via_publica(opciones):
+    """Menú público por la vía rápida (core/via_publica.py) frente a toda la pila de middleware.
+
+    Con y sin cookie de sesión: un navegador con sesión (el dueño, o cualquiera
+    que haya iniciado sesión) costaba dos consultas más por escaneo.
+    """
+    restaurante = datos_de_carga(opciones)[0]
+    url = reverse('menu_publico', args=[restaurante.slug])
+    pila_completa = [m for m in settings.MIDDLEWARE if m != 'core.via_publica.ViaPublicaMiddleware']
+
+    def variante(cliente):
+        cliente.get(url)  # calienta la caché del fragmento
+        # Las consultas se leen de la cabecera que añade core/instrumentacion.py
+        # (solo con DEBUG en las vistas públicas, y siempre que la petición
+        # entre en la muestra)
+        with override_settings(DEBUG=True, INSTRUMENTACION={'MUESTREO': 1.0}):
+            server_timing = cliente.get(url)['Server-Timing']
+        resultado = medir(lambda: cliente.get(url), opciones['repeticiones'])
+        resultado['consultas'] = int(re.search(r'"(\d+) consultas"', server_timing).group(1))
+        return resultado
+
+    resultados = {}
+    with override_settings(VISITAS_BUFFER={'TAMANO': 10 ** 9, 'SEGUNDOS': 3600}):
+        for nombre, middleware in (('via_publica', settings.MIDDLEWARE), ('pila_completa', pila_completa)):
+            # Cada Client carga el middleware en su primera petición
+            with override_settings(MIDDLEWARE=middleware):
+                resultados[f'{nombre}_anonimo'] = variante(Client())
+                resultados[f'{nombre}_con_sesion'] = variante(cliente_de(restaurante))
+    vaciar_visitas()
+    return resultados
+
+
+def escenario_asgi(opciones):
+    """Menú público y beacon con N peticiones simultáneas: WSGI (hilos) frente a ASGI.
+
+    Usa los manejadores WSGI y ASGI de Django en el mismo proceso (``Client`` y
+    ``AsyncClient``), sin socket. Para medir con servidores reales:
+    ``gunicorn --threads N menu_digital.wsgi`` y
+    ``uvicorn menu_digital.asgi:application``.
+    """
+    restaurante = datos_de_carga(opciones)[0]
+    menu = reverse('menu_publico', args=[restaurante.slug])
+    beacon = reverse('visita_beacon', args=[restaurante.slug])
+    repeticiones = opciones['repeticiones']
+    cliente_async = AsyncClient()
+
+    resultados = {}
+    # Sin vaciados durante la medición: la base en memoria no admite
+    # escrituras desde varios hilos a la vez
+    with override_settings(VISITAS_BUFFER={'TAMANO': 10 ** 9, 'SEGUNDOS': 3600}):
+        for concurrencia in opciones['concurrencia']:
+            resultados[f'wsgi_menu_c{concurrencia}'] = medir_en_hilos(
+                lambda: Client().get(menu), repeticiones, concurrencia)
+            resultados[f'asgi_menu_c{concurrencia}'] = asyncio.run(
+                amedir(lambda: cliente_async.get(menu), repeticiones, concurrencia))
+            resultados[f'wsgi_beacon_c{concurrencia}'] = medir_en_hilos(
+                lambda: Client().post(beacon), repeticiones, concurrencia)
+            resultados[f'asgi_beacon_c{concurrencia}'] = asyncio.run(
+                amedir(lambda: cliente_async.post(beacon), repeticiones, concurrencia))
+    vaciar_visitas()
+    return resultados
+
+
+def escenario_busqueda(opciones):
+    """Búsqueda en un menú de 10.000 platos: índice de texto frente a icontains."""
+    restaurante = crear_restaurante_demo('Busqueda', categorias=100, platos_por_categoria=100)
+    cliente = Client()
+    url = reverse('buscar_platos', args=[restaurante.slug])
+    consultas = ['plato 42', 'descripcion', 'sin resultados']
+    vuelta = count()
+
+    resultados = {
+        'endpoint': medir(lambda: cliente.get(url, {'q': consultas[next(vuelta) % len(consultas)]}),
+                          opciones['repeticiones']),
+    }
+    for texto in consultas:
+        terminos = busqueda.palabras(texto)
+        platos = Plato.objects.filter(categoria__restaurante=restaurante)
+        resultados[f'indice "{texto}"'] = medir(
+            lambda: list(busqueda.coincidencias(restaurante, texto).values_list('id')), opciones['repeticiones'])
+        resultados[f'icontains "{texto}"'] = medir(
+            lambda: list(busqueda.coincidencias_sin_indice(platos, terminos).values_list('id')),
+            opciones['repeticiones'])
+    return resultados
+
+
+def escenario_dashboard(opciones):
+    """Dashboard del dueño con el historial de visitas generado, con y sin sus fragmentos en caché."""
+    restaurante = datos_de_carga(opciones)[0]
+    cliente = cliente_de(restaurante)
+    url = reverse('dashboard')
+
+    def sin_cache(**parametros):
+        cache.clear()
+        cliente.get(url, parametros)
+
+    return {
+        'dashboard_sin_cache': medir(sin_cache, opciones['repeticiones']),
+        'dashboard_pagina_2_sin_cache': medir(lambda: sin_cache(page=2), opciones['repeticiones']),
+        'dashboard': medir(lambda: cliente.get(url), opciones['repeticiones']),
+        'fragmento_estadisticas': medir(
+            lambda: cliente.get(reverse('dashboard_estadisticas')), opciones['repeticiones']),
+        'fragmento_categorias': medir(
+            lambda: cliente.get(reverse('dashboard_categorias'), {'page': 2}), opciones['repeticiones']),
+    }
+
+
+def escenario_eventos(opciones):
+    """Reparto de un lote de visitas a N dashboards conectados por SSE (core/eventos.py).
+
+    Se compara con lo que costaría que cada dashboard volviera a pedir sus
+    contadores a la base de datos.
+    """
+    restaurante = datos_de_carga(opciones)[0]
+    platos = dict(Plato.objects.filter(categoria__restaurante=restaurante).values_list('id', 'nombre')[:20])
+    ahora = datetime.now(timezone.utc)
+    lote = [
+        Visit(restaurante_id=restaurante.id, plato_id=plato_id, tipo='plato', timestamp=ahora)
+        for plato_id in list(platos) * 5
+    ]
+
+    async def repartir(dashboards):
+        with ExitStack() as suscripciones:
+            colas = [suscripciones.enter_context(eventos.suscribir(restaurante.id)) for _ in range(dashboards)]
+
+            async def una_vez():
+                eventos.publicar_visitas(lote, platos)
+                for cola in colas:
+                    await cola.get()
+
+            return await amedir(una_vez, opciones['repeticiones'], 1)
+
+    resultados = {
+        'contadores_desde_la_base': medir(lambda: dashboard.contadores(restaurante), opciones['repeticiones']),
+    }
+    for dashboards in (1, 100, 1000):
+        resultados[f'aviso_a_{dashboards}_dashboards'] = asyncio.run(repartir(dashboards))
+    return resultados
+
+
+def escenario_analitica(opciones):
+    """Informes de core/analitica.py.
+
+    ``calculo_en_memoria`` mide la pasada sobre ``--visitas-analitica``
+    visitas sintéticas (diez millones por defecto) ya en columnas, sin base
+    de datos: generar tantas filas en SQLite tardaría más que el propio
+    benchmark. El resto usa un restaurante de los datos de carga: leer sus
+    columnas de ``Visit``, el informe completo sin caché y desde la caché.
+    """
+    visitas = opciones['visitas_analitica']
+    semanas = analitica._config()['SEMANAS']
+    primer_dia, desde, hasta = analitica.ventana(semanas)
+    azar = random.Random(0)
+    codigos = analitica.CODIGOS_TIPO
+    instantes = array('q', azar.choices(range(int(desde.timestamp()), int(hasta.timestamp())), k=visitas))
+    tipos = array('b', azar.choices((codigos['qr'], codigos['menu'], codigos['menu'], codigos['plato']), k=visitas))
+    platos = array('q', (azar.randrange(1, 200) if tipo == codigos['plato'] else 0 for tipo in tipos))
+    pocas = max(1, min(3, opciones['repeticiones']))
+
+    calculo = medir(lambda: analitica.calcular(instantes, tipos, platos, primer_dia, semanas), pocas)
+    calculo['visitas'] = visitas
+    calculo['visitas_por_segundo'] = round(visitas / (calculo['media_ms'] / 1000))
+
+    restaurante = datos_de_carga(opciones)[0]
+
+    def sin_cache():
+        cache.clear()
+        analitica.informe(restaurante)
+
+    columnas = medir(lambda: analitica.columnas_de_visitas(restaurante.pk, desde, hasta), pocas)
+    columnas['visitas'] = len(analitica.columnas_de_visitas(restaurante.pk, desde, hasta)[0])
+    return {
+        'calculo_en_memoria': calculo,
+        'columnas_desde_la_base': columnas,
+        'informe_sin_cache': medir(sin_cache, pocas),
+        'informe': medir(lambda: analitica.informe(restaurante), opciones['repeticiones']),
+    }
+
+
+def escenario_arranque(opciones):
+    """Arranque en frío de un worker (importar ``menu_digital.wsgi``) frente a un presupuesto.
+
+    Cada repetición es un intérprete nuevo con ``python -X importtime``; además
+    del tiempo total se informa cuánto fue importar módulos, los paquetes que
+    más tardaron en importarse y si se cargó alguna librería que debería
+    diferirse (``DIFERIDOS``). Con ``dentro_del_presupuesto`` falso el comando
+    termina con error, para usarlo en CI.
+    """
+    codigo = (
+        "import sys, menu_digital.wsgi; "
+        f"print(' '.join(m for m in {DIFERIDOS!r} if m in sys.modules))"
+    )
+    tiempos, importacion, cargados = [], [], set()
+    por_paquete = {}
+    inicio = time.perf_counter()
+    for _ in range(max(5, opciones['repeticiones'] // 20)):
+        t0 = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', codigo],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        )
+        tiempos.append(time.perf_counter() - t0)
+        cargados.update(proceso.stdout.split())
+        paquetes = importaciones_por_paquete(proceso.stderr)
+        importacion.append(sum(paquetes.values()) / 1000)
+        for paquete, microsegundos in paquetes.items():
+            por_paquete.setdefault(paquete, []).append(microsegundos / 1000)
+
+    resultado = resumir(tiempos, time.perf_counter() - inicio)
+    resultado['importacion_ms'] = round(statistics.median(importacion), 1)
+    resultado['mas_lentos'] = ', '.join(
+        f'{paquete}={statistics.median(ms):.1f}ms'
+        for paquete, ms in sorted(por_paquete.items(), key=lambda p: -statistics.median(p[1]))[:5]
+    )
+    resultado['diferidos_cargados'] = ' '.join(sorted(cargados)) or '-'
+    resultado['presupuesto_ms'] = opciones['presupuesto_arranque']
+    resultado['dentro_del_presupuesto'] = resultado['p50_ms'] <= opciones['presupuesto_arranque'] and not cargados
+    return {'worker_wsgi': resultado}
+
+
+def importaciones_por_paquete(salida):
+    """``{paquete: microsegundos}`` de la salida de ``-X importtime``, por paquete raíz.
+
+    Suma el tiempo propio de cada módulo (no el acumulado, que contaría dos
+    veces los imports anidados).
+    """
+    paquetes = {}
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        propio, _, nombre = linea[len('import time:'):].split('|')
+        paquete = nombre.strip().split('.')[0]
+        paquetes[paquete] = paquetes.get(paquete, 0) + int(propio)
+    return paquetes
+
+
+def escenario_registro(opciones):
+    """Registro de un dueño nuevo con su restaurante (incluye el hash de la contraseña)."""
+    numero = count()
+
+    def registrar():
+        n = next(numero)
+        Client().post(reverse('registro'), {
+            'username': f'nuevo-{n}',
+            'email': f'nuevo-{n}@example.com',
+            'password1': 'clave-de-benchmark-123',
+            'password2': 'clave-de-benchmark-123',
+            'nombre': 'Restaurante Nuevo',
+        })
+
+    return {'registro': medir(registrar, max(5, opciones['repeticiones'] // 10))}
+
+
+def escenario_platos(opciones):
+    """Alta, edición y baja de platos desde el dashboard."""
+    restaurante = datos_de_carga(opciones)[0]
+    categoria = restaurante.categorias.first()
+    cliente = cliente_de(restaurante)
+    datos = {'nombre': 'Plato de benchmark', 'descripcion': 'Prueba', 'precio': '9.90', 'disponible': 'on'}
+    repeticiones = opciones['repeticiones']
+
+    crear = medir(lambda: cliente.post(reverse('plato_crear', args=[categoria.id]), datos), repeticiones)
+    ids = iter(list(Plato.objects.filter(categoria=categoria, nombre=datos['nombre']).values_list('id', flat=True)))
+    editar = medir(lambda: cliente.post(reverse('plato_editar', args=[next(ids)]), datos), repeticiones)
+    ids = iter(list(Plato.objects.filter(categoria=categoria, nombre=datos['nombre']).values_list('id', flat=True)))
+    eliminar = medir(lambda: cliente.post(reverse('plato_eliminar', args=[next(ids)])), repeticiones)
+    return {'crear': crear, 'editar': editar, 'eliminar': eliminar}
+
+
+ESCENARIOS = {
+    'visitas': escenario_visitas,
+    'serializacion': escenario_serializacion,
+    'menu_publico': escenario_menu_publico,
+    'via_publica': escenario_via_publica,
+    'asgi': escenario_asgi,
+    'busqueda': escenario_busqueda,
+    'dashboard': escenario_dashboard,
+    'eventos': escenario_eventos,
+    'analitica': escenario_analitica,
+    'registro': escenario_registro,
+    'arranque': escenario_arranque,
+    'platos': escenario_platos,
+}
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Mide latencia (p50/p95/p99) y peticiones por segundo de las vistas principales "
+            "sobre una base de datos temporal.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('escenarios', nargs='*',
+                            help=f"Escenarios a ejecutar: {', '.join(ESCENARIOS)} (por defecto, todos).")
+        parser.add_argument('--repeticiones', type=int, default=200)
+        parser.add_argument('--restaurantes', type=int, default=20,
+                            help="Restaurantes generados para los escenarios de carga.")
+        parser.add_argument('--categorias', type=int, default=8, help="Categorías por restaurante.")
+        parser.add_argument('--platos', type=int, default=15, help="Platos por categoría.")
+        parser.add_argument('--visitas', type=int, default=100_000, help="Visitas generadas en total.")
+        parser.add_argument('--visitas-analitica', type=int, default=10_000_000,
+                            help="Visitas sintéticas del cálculo en memoria del escenario analitica.")
+        parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 10, 50],
+                            help="Peticiones simultáneas del escenario asgi.")
+        parser.add_argument('--presupuesto-arranque', type=float, default=400, metavar='MS',
+                            help="Mediana máxima del arranque en frío de un worker (escenario arranque).")
+        parser.add_argument('--json', metavar='ARCHIVO',
+                            help="Guarda los resultados en JSON para compararlos entre commits.")
+
+    def handle(self, *args, **options):
+        global _datos_de_carga
+        escenarios = options['escenarios'] or list(ESCENARIOS)
+        desconocidos = set(escenarios) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+        informe = {
+            'commit': commit_actual(),
+            'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'opciones': {k: options[k] for k in (
+                'repeticiones', 'restaurantes', 'categorias', 'platos', 'visitas', 'visitas_analitica', 'concurrencia',
+                'presupuesto_arranque',
+            )},
+            'resultados': {},
+        }
+        _datos_de_carga = None
+        with base_de_datos_temporal():
+            for nombre in escenarios:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"== {nombre} =="))
+                resultados = ESCENARIOS[nombre](options)
+                informe['resultados'][nombre] = resultados
+                for variante, datos in resultados.items():
+                    detalle = "  ".join(f"{k}={v}" for k, v in datos.items())
+                    self.stdout.write(f"{variante:<20} {detalle}")
+
+        if options['json']:
+            with open(options['json'], 'w') as archivo:
+                json.dump(informe, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+        fuera = [
+            f"{nombre}/{variante}"
+            for nombre, resultados in informe['resultados'].items()
+            for variante, datos in resultados.items()
+            if datos.get('dentro_del_presupuesto') is False
+        ]
+        if fuera:
+            raise CommandError(f"Fuera de presupuesto: {', '.join(fuera)}")
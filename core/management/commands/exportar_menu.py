@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacion import FORMATOS, exportar_menu
+from core.models import Restaurante
+
+
+class Command(BaseCommand):
+    help = "Exporta las categorías y platos de un restaurante en CSV o JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurante', metavar='SLUG')
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--salida', metavar='ARCHIVO', help="Por defecto, la salida estándar.")
+
+    def handle(self, *args, **options):
+        try:
+            restaurante = Restaurante.objects.get(slug=options['restaurante'])
+        except Restaurante.DoesNotExist:
+            raise CommandError(f"No existe el restaurante '{options['restaurante']}'.")
+
+        lineas = exportar_menu(restaurante, options['formato'])
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as archivo:
+                archivo.writelines(lineas)
+        else:
+            for linea in lineas:
+                self.stdout.write(linea, ending='')
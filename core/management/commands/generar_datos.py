@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import generar_datos
+from core.models import Restaurante
+
+
+class Command(BaseCommand):
+    help = ("Crea restaurantes, categorías, platos y visitas de prueba para medir el rendimiento. "
+            "Los dueños se llaman <prefijo>-<n> y su contraseña es --password.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurantes', type=int, default=100)
+        parser.add_argument('--categorias', type=int, default=8, help="Categorías por restaurante.")
+        parser.add_argument('--platos', type=int, default=15, help="Platos por categoría.")
+        parser.add_argument('--visitas', type=int, default=1_000_000, help="Visitas en total.")
+        parser.add_argument('--dias', type=int, default=30, help="Días hacia atrás en los que se reparten las visitas.")
+        parser.add_argument('--prefijo', default='demo')
+        parser.add_argument('--password', default='demo')
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Restaurante.objects.filter(slug__startswith=f"{options['prefijo']}-").exists():
+            raise CommandError(f"Ya hay restaurantes con el prefijo '{options['prefijo']}'; usa otro --prefijo.")
+
+        def progreso(hechas, total):
+            if hechas % 100_000 == 0 or hechas == total:
+                self.stdout.write(f"  {hechas}/{total} visitas")
+
+        creados = generar_datos(
+            restaurantes=options['restaurantes'],
+            categorias=options['categorias'],
+            platos=options['platos'],
+            visitas=options['visitas'],
+            dias=options['dias'],
+            prefijo=options['prefijo'],
+            password=options['password'],
+            semilla=options['semilla'],
+            progreso=progreso,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(creados)} restaurantes con {options['categorias']} categorías de "
+            f"{options['platos']} platos y {options['visitas']} visitas."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacion import FORMATOS, ErrorImportacion, formato_de, importar_menu, leer_filas
+from core.models import Restaurante
+
+
+class Command(BaseCommand):
+    help = ("Importa categorías y platos desde un CSV o JSON Lines "
+            "(columnas: categoria, nombre, descripcion, precio, disponible).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurante', metavar='SLUG')
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=FORMATOS, help="Por defecto, según la extensión del archivo.")
+        parser.add_argument('--lote', type=int, default=500, help="Filas por bulk_create/bulk_update.")
+
+    def handle(self, *args, **options):
+        try:
+            restaurante = Restaurante.objects.get(slug=options['restaurante'])
+        except Restaurante.DoesNotExist:
+            raise CommandError(f"No existe el restaurante '{options['restaurante']}'.")
+
+        try:
+            formato = options['formato'] or formato_de(options['archivo'])
+            with open(options['archivo'], 'rb') as archivo:
+                resumen = importar_menu(restaurante, leer_filas(archivo, formato), lote=options['lote'])
+        except ErrorImportacion as exc:
+            raise CommandError("No se ha importado nada:\n" + "\n".join(exc.errores))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['platos_creados']} platos nuevos, {resumen['platos_actualizados']} actualizados y "
+            f"{resumen['categorias_creadas']} categorías nuevas."))
@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.imagenes import borrar_variantes, guardar_variantes, variantes_de_imagen
+from core.models import Plato, Restaurante
+from core.publicacion import programar_publicacion
+
+
+class Command(BaseCommand):
+    help = "Genera las variantes optimizadas (AVIF/WebP/JPEG) de las imágenes de platos y logos existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help="Procesos que redimensionan las imágenes (por defecto, uno por núcleo).")
+        parser.add_argument('--todas', action='store_true',
+                            help="Vuelve a procesar también las imágenes que ya tienen variantes.")
+
+    def handle(self, *args, **options):
+        trabajos = []
+        for modelo, campo, campo_variantes in (
+            (Plato, 'imagen', 'imagen_variantes'),
+            (Restaurante, 'logo', 'logo_variantes'),
+        ):
+            instancias = modelo.objects.exclude(**{campo: ''}).exclude(**{campo: None}).only('id', campo, campo_variantes)
+            for instancia in instancias:
+                if options['todas'] or getattr(instancia, campo_variantes).get('origen') != getattr(instancia, campo).name:
+                    trabajos.append((instancia, campo, campo_variantes))
+
+        self.procesadas = self.errores = 0
+        platos, restaurantes = set(), set()
+        # Pillow trabaja en paralelo; los archivos y la base de datos se
+        # escriben desde este proceso. Se envían pocas imágenes a la vez para
+        # no cargarlas todas en memoria.
+        lote = options['procesos'] * 4
+        with ProcessPoolExecutor(max_workers=options['procesos']) as pool:
+            for inicio in range(0, len(trabajos), lote):
+                for instancia, campo, campo_variantes in self.procesar_lote(pool, trabajos[inicio:inicio + lote]):
+                    (platos if isinstance(instancia, Plato) else restaurantes).add(instancia.pk)
+
+        # Las URLs del menú cambiaron: nueva versión para la caché y el ETag,
+        # y update() no envía señales, así que el menú estático se publica a mano
+        restaurantes.update(Restaurante.objects.filter(categorias__platos__in=platos).values_list('id', flat=True))
+        Restaurante.objects.filter(id__in=restaurantes).update(menu_actualizado=timezone.now())
+        for restaurante_id in restaurantes:
+            programar_publicacion(restaurante_id)
+
+        self.stdout.write(self.style.SUCCESS(f"{self.procesadas} imágenes procesadas, {self.errores} con errores."))
+
+    def procesar_lote(self, pool, trabajos):
+        futuros = []
+        for instancia, campo, campo_variantes in trabajos:
+            imagen = getattr(instancia, campo)
+            try:
+                with imagen.open('rb') as archivo:
+                    futuros.append((instancia, campo, campo_variantes, pool.submit(variantes_de_imagen, archivo.read())))
+            except OSError as exc:
+                self.stderr.write(f"{imagen.name}: {exc}")
+                self.errores += 1
+
+        for instancia, campo, campo_variantes, futuro in futuros:
+            imagen = getattr(instancia, campo)
+            try:
+                variantes = futuro.result()
+            except Exception as exc:
+                self.stderr.write(f"{imagen.name}: {exc}")
+                self.errores += 1
+                continue
+            borrar_variantes(imagen.storage, getattr(instancia, campo_variantes))
+            nuevas = guardar_variantes(imagen, variantes)
+            type(instancia).objects.filter(pk=instancia.pk).update(**{campo_variantes: nuevas})
+            self.procesadas += 1
+            yield instancia, campo, campo_variantes
@@ -0,0 +1,47 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import Restaurante
+from core.publicacion import directorio_menu, publicacion_activa, publicar_restaurante
+
+
+def _publicar(restaurante_id):
+    try:
+        publicar_restaurante(restaurante_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Vuelve a generar el HTML estático de todos los menús activos (MENU_ESTATICO['DIRECTORIO'])."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4,
+                            help="Menús que se renderizan a la vez (por defecto 4).")
+
+    def handle(self, *args, **options):
+        if not publicacion_activa():
+            raise CommandError("Define MENU_ESTATICO['DIRECTORIO'] (o MENU_ESTATICO_DIR) para publicar los menús.")
+
+        activos = dict(Restaurante.objects.filter(activo=True).values_list('id', 'slug'))
+        if options['hilos'] > 1:
+            with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+                list(pool.map(_publicar, activos))
+        else:
+            for restaurante_id in activos:
+                publicar_restaurante(restaurante_id)
+
+        # Retira los menús de restaurantes eliminados o desactivados
+        retirados = 0
+        raiz = directorio_menu('_').parent
+        slugs = set(activos.values())
+        if raiz.exists():
+            for directorio in raiz.iterdir():
+                if directorio.is_dir() and directorio.name not in slugs:
+                    shutil.rmtree(directorio, ignore_errors=True)
+                    retirados += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{len(activos)} menús publicados, {retirados} retirados."))
@@ -0,0 +1,46 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archivo_visitas import primer_dia_recalculable
+from core.models import Restaurante, Visit, VisitDailyStat
+from core.visitas import inicio_del_dia, reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = ("Reconstruye el resumen diario de visitas (VisitDailyStat) a partir de Visit. "
+            "Los días que pueden estar archivados (ver archivar_visitas) no se tocan.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurante', metavar='SLUG',
+                            help="Recalcula solo el restaurante indicado.")
+        parser.add_argument('--desde', metavar='AAAA-MM-DD', type=date.fromisoformat,
+                            help="Recalcula solo a partir de esa fecha.")
+        parser.add_argument('--lote', type=int, default=1000,
+                            help="Filas por INSERT (por defecto 1000).")
+
+    def handle(self, *args, **options):
+        visitas = Visit.objects.all()
+        estadisticas = VisitDailyStat.objects.all()
+        if options['restaurante']:
+            try:
+                restaurante = Restaurante.objects.get(slug=options['restaurante'])
+            except Restaurante.DoesNotExist:
+                raise CommandError(f"No existe el restaurante '{options['restaurante']}'.")
+            visitas = visitas.filter(restaurante=restaurante)
+            estadisticas = estadisticas.filter(restaurante=restaurante)
+
+        # Antes de este día el resumen puede ser lo único que queda de las
+        # visitas archivadas: borrarlo y recalcularlo las perdería
+        desde = primer_dia_recalculable()
+        if desde is None:
+            self.stdout.write("No hay visitas en bruto; el resumen se deja como está.")
+            return
+        if options['desde'] and options['desde'] < desde:
+            self.stdout.write(f"Los días anteriores al {desde} pueden estar archivados: se recalcula desde el {desde}.")
+        desde = max(desde, options['desde'] or desde)
+        visitas = visitas.filter(timestamp__gte=inicio_del_dia(desde))
+        estadisticas = estadisticas.filter(fecha__gte=desde)
+
+        creadas = reconstruir_resumen(visitas, estadisticas, options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"{creadas} filas de estadísticas generadas desde el {desde}."))
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Restaurante, TareaQR
+from core.qr import png_qr
+from core.tareas_qr import guardar_qr, reanudar_tareas, url_menu
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a generar los códigos QR de todos los restaurantes usando todos los núcleos. "
+            "Necesario cada vez que cambia SITE_URL.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help="Procesos que dibujan los QR (por defecto, uno por núcleo).")
+        parser.add_argument('--solo-faltantes', action='store_true',
+                            help="Genera solo los restaurantes que aún no tienen QR.")
+        parser.add_argument('--pendientes', action='store_true',
+                            help="Solo vuelve a lanzar las tareas QR perdidas (QR_TAREAS['CADUCIDAD']).")
+
+    def handle(self, *args, **options):
+        if options['pendientes']:
+            with transaction.atomic():
+                lanzadas = reanudar_tareas()
+            self.stdout.write(self.style.SUCCESS(f"{lanzadas} tareas QR vueltas a lanzar."))
+            return
+
+        restaurantes = Restaurante.objects.only('id', 'slug', 'qr_code').order_by('id')
+        if options['solo_faltantes']:
+            restaurantes = restaurantes.filter(qr_code__in=['', None])
+        restaurantes = list(restaurantes)
+        urls = [url_menu(r.slug) for r in restaurantes]
+
+        # Las imágenes se dibujan en paralelo; los archivos y la base de datos
+        # se escriben desde este proceso.
+        with ProcessPoolExecutor(max_workers=options['procesos']) as pool:
+            for restaurante, png in zip(restaurantes, pool.map(png_qr, urls, chunksize=16)):
+                with transaction.atomic():
+                    guardar_qr(restaurante, png)
+                    TareaQR.objects.update_or_create(
+                        clave=restaurante.slug,
+                        defaults={'restaurante': restaurante, 'estado': TareaQR.COMPLETADA, 'error': ''},
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(restaurantes)} códigos QR generados con {options['procesos']} procesos."))
@@ -0,0 +1,131 @@
+"""
+Carga del menú público en una estructura simple.
+
+``cargar_menu`` hace siempre dos consultas (categorías y platos disponibles),
+sin importar el tamaño del menú, y devuelve listas y diccionarios listos para
+la plantilla o para serializar.
+
+``payload_menu`` serializa esa estructura a JSON (con orjson si está
+instalado) y guarda en caché el resultado ya comprimido con gzip y, si está
+el paquete ``brotli``, con brotli, de modo que la API solo lo calcula una vez
+por versión del menú.
+"""
+import gzip
+import json
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .cache_menu import segundos_cache_menu, version_menu
+from .imagenes import srcset, url_respaldo
+from .models import Categoria, Plato
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def cargar_menu(restaurante):
+    """Devuelve las categorías del restaurante con sus platos disponibles.
+
+    ``[{'id', 'nombre', 'platos': [{'id', 'nombre', 'descripcion', 'precio',
+    'imagen_url', 'srcset_avif', 'srcset_webp'}]}]``
+    """
+    categorias = [
+        dict(categoria, platos=[])
+        for categoria in (Categoria.objects
+            .filter(restaurante=restaurante)
+            .order_by('id')
+            .values('id', 'nombre'))
+    ]
+    por_id = {categoria['id']: categoria for categoria in categorias}
+
+    platos = (Plato.objects
+        .filter(categoria__restaurante=restaurante, disponible=True)
+        .order_by('categoria_id', 'id')
+        .values_list('id', 'categoria_id', 'nombre', 'descripcion', 'precio', 'imagen', 'imagen_variantes'))
+    for id, categoria_id, nombre, descripcion, precio, imagen, variantes in platos:
+        por_id[categoria_id]['platos'].append({
+            'id': id,
+            'nombre': nombre,
+            'descripcion': descripcion,
+            'precio': precio,
+            'imagen_url': (url_respaldo(default_storage, variantes) or default_storage.url(imagen)) if imagen else None,
+            'srcset_avif': srcset(default_storage, variantes, 'avif'),
+            'srcset_webp': srcset(default_storage, variantes, 'webp'),
+        })
+    return categorias
+
+
+def menu_a_dict(restaurante, categorias):
+    """Estructura pública del menú tal como la devuelve la API."""
+    return {
+        'restaurante': {
+            'nombre': restaurante.nombre,
+            'slug': restaurante.slug,
+            'descripcion': restaurante.descripcion or '',
+        },
+        'version': version_menu(restaurante),
+        'categorias': [
+            {
+                'id': categoria['id'],
+                'nombre': categoria['nombre'],
+                'platos': [
+                    {
+                        'id': plato['id'],
+                        'nombre': plato['nombre'],
+                        'descripcion': plato['descripcion'],
+                        'precio': plato['precio'],
+                        'imagen': plato['imagen_url'],
+                        'srcset': {'avif': plato['srcset_avif'], 'webp': plato['srcset_webp']},
+                    }
+                    for plato in categoria['platos']
+                ],
+            }
+            for categoria in categorias
+        ],
+    }
+
+
+def a_json(datos):
+    """JSON compacto en bytes; los Decimal se escriben como cadena."""
+    if orjson is not None:
+        return orjson.dumps(datos, default=str)
+    return json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def payload_menu(restaurante):
+    """Devuelve ``{codificación: bytes}`` con el JSON del menú.
+
+    Siempre incluye ``'identity'`` y ``'gzip'``; ``'br'`` solo si está
+    instalado ``brotli``.
+    """
+    clave = f'menu-json:{restaurante.pk}:{version_menu(restaurante)}'
+    payload = cache.get(clave)
+    if payload is None:
+        cuerpo = a_json(menu_a_dict(restaurante, cargar_menu(restaurante)))
+        payload = {'identity': cuerpo, 'gzip': gzip.compress(cuerpo, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            payload['br'] = brotli.compress(cuerpo)
+        cache.set(clave, payload, segundos_cache_menu())
+    return payload
+
+
+def elegir_codificacion(accept_encoding, payload):
+    """Elige la mejor codificación del payload que acepta el cliente."""
+    aceptadas = {
+        parte.split(';')[0].strip().lower()
+        for parte in accept_encoding.split(',')
+        if not parte.strip().endswith(('q=0', 'q=0.0'))
+    }
+    for codificacion in ('br', 'gzip'):
+        if codificacion in payload and codificacion in aceptadas:
+            return codificacion
+    return 'identity'
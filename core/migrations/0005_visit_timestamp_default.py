@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_visit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visit',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
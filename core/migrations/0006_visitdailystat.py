@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_visit_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo', models.CharField(choices=[('qr', 'Escaneo QR'), ('menu', 'Visita Menú'), ('plato', 'Detalle Plato')], max_length=20)),
+                ('visitas', models.PositiveIntegerField(default=0)),
+                ('plato', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='estadisticas', to='core.plato')),
+                ('restaurante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='core.restaurante')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurante', 'fecha', 'tipo', 'plato'), name='stat_unica_por_plato'), models.UniqueConstraint(condition=models.Q(('plato__isnull', True)), fields=('restaurante', 'fecha', 'tipo'), name='stat_unica_sin_plato')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_visitdailystat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='plato',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='restaurante',
+            name='menu_actualizado',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_menu_actualizado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visit',
+            name='restaurante',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='visitas', to='core.restaurante'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['restaurante', 'timestamp'], name='visit_rest_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['restaurante', 'plato'], name='visit_rest_plato_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_visit_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaQR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.SlugField(unique=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completada', 'Completada'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+                ('restaurante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tareas_qr', to='core.restaurante')),
+            ],
+        ),
+    ]
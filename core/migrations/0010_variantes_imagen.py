@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_tareaqr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plato',
+            name='imagen_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurante',
+            name='logo_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,110 @@
+"""
+Índice de búsqueda de platos (ver core/busqueda.py).
+
+SQLite: tabla virtual FTS5 ``core_plato_fts`` mantenida con triggers, para
+que también la actualicen ``bulk_create``/``bulk_update`` y los borrados en
+cascada. El restaurante se indexa como un término más (``r<id>``), así FTS5
+cruza las dos listas de coincidencias en vez de leer una columna por fila.
+
+PostgreSQL: índice GIN sobre ``to_tsvector`` con una configuración en
+español que ignora los acentos. En otros motores no se crea nada y la
+búsqueda usa ``icontains``.
+"""
+from django.db import migrations
+
+SQLITE = [
+    """
+    CREATE VIRTUAL TABLE core_plato_fts USING fts5(
+        nombre, descripcion, restaurante,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO core_plato_fts (rowid, nombre, descripcion, restaurante)
+    SELECT p.id, p.nombre, p.descripcion, 'r' || c.restaurante_id
+    FROM core_plato p JOIN core_categoria c ON c.id = p.categoria_id
+    """,
+    """
+    CREATE TRIGGER core_plato_fts_insert AFTER INSERT ON core_plato BEGIN
+        INSERT INTO core_plato_fts (rowid, nombre, descripcion, restaurante)
+        SELECT new.id, new.nombre, new.descripcion, 'r' || c.restaurante_id
+        FROM core_categoria c WHERE c.id = new.categoria_id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_plato_fts_update AFTER UPDATE OF nombre, descripcion, categoria_id ON core_plato BEGIN
+        DELETE FROM core_plato_fts WHERE rowid = old.id;
+        INSERT INTO core_plato_fts (rowid, nombre, descripcion, restaurante)
+        SELECT new.id, new.nombre, new.descripcion, 'r' || c.restaurante_id
+        FROM core_categoria c WHERE c.id = new.categoria_id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_plato_fts_delete AFTER DELETE ON core_plato BEGIN
+        DELETE FROM core_plato_fts WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_DESHACER = [
+    "DROP TRIGGER IF EXISTS core_plato_fts_delete",
+    "DROP TRIGGER IF EXISTS core_plato_fts_update",
+    "DROP TRIGGER IF EXISTS core_plato_fts_insert",
+    "DROP TABLE IF EXISTS core_plato_fts",
+]
+
+POSTGRESQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    DO $$ BEGIN
+        CREATE TEXT SEARCH CONFIGURATION es_sin_acentos (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_sin_acentos
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    EXCEPTION WHEN unique_violation THEN NULL;
+    END $$
+    """,
+    """
+    CREATE INDEX core_plato_busqueda_idx ON core_plato
+    USING GIN (to_tsvector('es_sin_acentos', nombre || ' ' || descripcion))
+    """,
+]
+
+POSTGRESQL_DESHACER = [
+    "DROP INDEX IF EXISTS core_plato_busqueda_idx",
+]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def crear_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        _ejecutar(schema_editor, SQLITE)
+    elif vendor == 'postgresql':
+        _ejecutar(schema_editor, POSTGRESQL)
+
+
+def borrar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _ejecutar(schema_editor, SQLITE_DESHACER)
+    elif vendor == 'postgresql':
+        _ejecutar(schema_editor, POSTGRESQL_DESHACER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_variantes_imagen'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_busqueda_platos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['timestamp'], name='visit_timestamp_idx'),
+        ),
+    ]
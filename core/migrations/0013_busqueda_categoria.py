@@ -0,0 +1,57 @@
+"""
+El índice FTS5 de SQLite (``0011_busqueda_platos``) guarda el restaurante de
+cada plato, que sale de su categoría. Los triggers de ``core_plato`` no se
+enteran si la categoría cambia de restaurante (el admin lo permite), y sus
+platos seguían saliendo en las búsquedas del restaurante anterior. Este
+trigger los mueve con la categoría, y la migración corrige las filas que ya
+hubieran quedado mal.
+"""
+from django.db import migrations
+
+SQLITE = [
+    """
+    CREATE TRIGGER core_categoria_fts_update AFTER UPDATE OF restaurante_id ON core_categoria BEGIN
+        UPDATE core_plato_fts SET restaurante = 'r' || new.restaurante_id
+        WHERE rowid IN (SELECT id FROM core_plato WHERE categoria_id = new.id);
+    END
+    """,
+    """
+    UPDATE core_plato_fts SET restaurante = (
+        SELECT 'r' || c.restaurante_id
+        FROM core_plato p JOIN core_categoria c ON c.id = p.categoria_id
+        WHERE p.id = core_plato_fts.rowid
+    )
+    """,
+]
+
+SQLITE_DESHACER = [
+    "DROP TRIGGER IF EXISTS core_categoria_fts_update",
+]
+
+
+def _con_fts(schema_editor):
+    conexion = schema_editor.connection
+    return conexion.vendor == 'sqlite' and 'core_plato_fts' in conexion.introspection.table_names()
+
+
+def crear_trigger(apps, schema_editor):
+    if _con_fts(schema_editor):
+        for sql in SQLITE:
+            schema_editor.execute(sql)
+
+
+def borrar_trigger(apps, schema_editor):
+    if _con_fts(schema_editor):
+        for sql in SQLITE_DESHACER:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_visit_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_trigger, borrar_trigger),
+    ]
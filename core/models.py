@@ -1,53 +1,80 @@
-from django.db import models
+import re
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Cast, Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
-from django.core.files import File
-from io import BytesIO
-import qrcode
-from django.conf import settings
+
+from .qr import png_qr
+from .tareas_qr import encolar_qr, guardar_qr, url_menu
 
 class Restaurante(models.Model):
+    INTENTOS_SLUG = 5
+
     dueño = models.OneToOneField(User, on_delete=models.CASCADE)
     nombre = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, help_text="Texto para la URL, ej: pizzeria-pepe. No usar espacios ni ñ.")
     logo = models.ImageField(upload_to='logos/', blank=True, null=True)
+    # Copias redimensionadas del logo (ver core/imagenes.py)
+    logo_variantes = models.JSONField(default=dict, blank=True, editable=False)
     descripcion = models.TextField(blank=True, null=True, help_text="Breve descripción o eslogan del restaurante.")
     activo = models.BooleanField(default=True, help_text="Controla si el menú público está activo o no.")
     qr_code = models.ImageField(upload_to='qrcodes/', blank=True, null=True, help_text="Código QR del menú público.")
+    # Última modificación del restaurante o de cualquiera de sus categorías y
+    # platos (las señales de core/signals.py lo mantienen al día). Sirve de
+    # versión para la caché y el ETag del menú público.
+    menu_actualizado = models.DateTimeField(default=timezone.now, editable=False)
 
     def save(self, *args, **kwargs):
         # Crear un slug automáticamente si no existe
-        if not self.slug:
-            base_slug = slugify(self.nombre)
-            slug = base_slug
-            counter = 1
-            # Evitar duplicados
-            while Restaurante.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-
-        super().save(*args, **kwargs)
-
-        # Generar el código QR si no existe
+        slug_automatico = not self.slug
+        if slug_automatico:
+            self.slug = self.siguiente_slug_libre()
+
+        self.menu_actualizado = timezone.now()
+        for intento in range(self.INTENTOS_SLUG):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                break
+            except IntegrityError:
+                # Otro registro simultáneo tomó el mismo slug: se elige otro
+                ultimo_intento = intento == self.INTENTOS_SLUG - 1
+                if not slug_automatico or ultimo_intento or not self.slug_ocupado():
+                    raise
+                self.slug = self.siguiente_slug_libre()
+                kwargs.pop('force_insert', None)
+
+        # Generar el código QR si no existe (en segundo plano, ver core/tareas_qr.py)
         if not self.qr_code:
-            self.generar_qr()
+            encolar_qr(self)
+
+    def siguiente_slug_libre(self):
+        """Elige el slug a partir del nombre con una sola consulta.
+
+        Si ``base`` está libre se usa tal cual; si no, ``base-N`` con N una
+        unidad mayor que el sufijo más alto ya registrado.
+        """
+        base = slugify(self.nombre) or 'restaurante'
+        ocupados = Restaurante.objects.filter(slug__startswith=base).exclude(pk=self.pk).aggregate(
+            base_ocupada=Count('id', filter=Q(slug=base)),
+            mayor_sufijo=Max(
+                Cast(Substr('slug', len(base) + 2), models.IntegerField()),
+                filter=Q(slug__regex=rf'^{re.escape(base)}-[0-9]+$'),
+            ),
+        )
+        if not ocupados['base_ocupada']:
+            return base
+        return f"{base}-{(ocupados['mayor_sufijo'] or 0) + 1}"
+
+    def slug_ocupado(self):
+        return Restaurante.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
 
     def generar_qr(self):
-        """Genera automáticamente un código QR con la URL pública del restaurante."""
-        url_menu = f"{settings.SITE_URL}/restaurante/{self.slug}/"
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(url_menu)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="purple", back_color="white")
-
-        # Guardar imagen QR en memoria
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        file_name = f"qr-{self.slug}.png"
-        self.qr_code.save(file_name, File(buffer), save=False)
-        buffer.close()
-        super().save(update_fields=['qr_code'])
+        """Genera en el momento el código QR con la URL pública del restaurante."""
+        guardar_qr(self, png_qr(url_menu(self.slug)))
 
     def __str__(self):
         return self.nombre
@@ -56,7 +83,8 @@ class Restaurante(models.Model):
 class Categoria(models.Model):
     restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name='categorias')
     nombre = models.CharField(max_length=50)
-    
+    actualizado = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.nombre
 
@@ -67,18 +95,77 @@ class Plato(models.Model):
     descripcion = models.TextField(blank=True)
     precio = models.DecimalField(max_digits=8, decimal_places=2)
     imagen = models.ImageField(upload_to='platos/', blank=True, null=True)
+    # Copias redimensionadas de la imagen (ver core/imagenes.py)
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
     disponible = models.BooleanField(default=True)
-    
+    actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nombre
     
 
+TIPOS_VISITA = [('qr', 'Escaneo QR'), ('menu', 'Visita Menú'), ('plato', 'Detalle Plato')]
+
+
 class Visit(models.Model):
-    restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name="visitas")
+    # Sin índice propio: lo cubren los índices compuestos de Meta
+    restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name="visitas", db_index=False)
     plato = models.ForeignKey(Plato, on_delete=models.SET_NULL, null=True, blank=True, related_name="vistas")
-    timestamp = models.DateTimeField(auto_now_add=True)
-    tipo = models.CharField(max_length=20, choices=[('qr', 'Escaneo QR'), ('menu', 'Visita Menú'), ('plato', 'Detalle Plato')], default='menu')
+    # Se asigna al encolar la visita (ver core/visitas.py), no al guardarla
+    timestamp = models.DateTimeField(default=timezone.now)
+    tipo = models.CharField(max_length=20, choices=TIPOS_VISITA, default='menu')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurante', 'timestamp'], name='visit_rest_timestamp_idx'),
+            models.Index(fields=['restaurante', 'plato'], name='visit_rest_plato_idx'),
+            # Jerarquía de fechas y filtro por fecha del admin (ver core/admin.py)
+            models.Index(fields=['timestamp'], name='visit_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"{self.restaurante} - {self.timestamp} - {self.tipo}"
+
+
+# Resumen diario de visitas: el dashboard lee de aquí en vez de recorrer Visit.
+# Se actualiza al guardar cada lote de visitas (ver core/visitas.py).
+class VisitDailyStat(models.Model):
+    restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name="estadisticas")
+    plato = models.ForeignKey(Plato, on_delete=models.SET_NULL, null=True, blank=True, related_name="estadisticas")
+    fecha = models.DateField()
+    tipo = models.CharField(max_length=20, choices=TIPOS_VISITA)
+    visitas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurante', 'fecha', 'tipo', 'plato'], name='stat_unica_por_plato'),
+            models.UniqueConstraint(fields=['restaurante', 'fecha', 'tipo'], condition=models.Q(plato__isnull=True), name='stat_unica_sin_plato'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurante} - {self.fecha} - {self.tipo}: {self.visitas}"
+
+
+# Trabajo de generación del QR de un restaurante (ver core/tareas_qr.py).
+# La clave es el slug: como mucho hay una tarea por URL pública.
+class TareaQR(models.Model):
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    COMPLETADA = 'completada'
+    ERROR = 'error'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_PROCESO, 'En proceso'),
+        (COMPLETADA, 'Completada'),
+        (ERROR, 'Error'),
+    ]
+
+    clave = models.SlugField(unique=True)
+    restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name="tareas_qr")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"QR {self.clave}: {self.estado}"
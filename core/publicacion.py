@@ -0,0 +1,147 @@
+"""
+Publicación de los menús públicos como HTML estático.
+
+Si ``MENU_ESTATICO['DIRECTORIO']`` está definido, el menú de cada restaurante
+activo se escribe en ``<DIRECTORIO>/restaurante/<slug>/index.html`` junto con
+``index.html.gz`` (y ``index.html.br`` si está instalado ``brotli``), para que
+nginx o la CDN lo sirvan sin pasar por Django::
+
+    location /restaurante/ {
+        root /ruta/al/DIRECTORIO;
+        gzip_static on;
+        try_files $uri $uri/index.html @django;
+    }
+
+Las señales de ``core/signals.py`` vuelven a publicar un restaurante cuando
+cambian él, sus categorías o sus platos. La página estática cuenta las
+visitas con ``navigator.sendBeacon`` contra la vista ``visita_beacon``.
+"""
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+
+from .cache_menu import segundos_cache_menu, version_menu
+from .menu import brotli, cargar_menu
+
+logger = logging.getLogger(__name__)
+
+CONFIG_POR_DEFECTO = {
+    'DIRECTORIO': None,
+    'SINCRONO': False,
+    'HILOS': 2,
+}
+
+_lock = threading.Lock()
+_pendientes = set()
+_pool = None
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'MENU_ESTATICO', {}))
+    return config
+
+
+def publicacion_activa():
+    return bool(_config()['DIRECTORIO'])
+
+
+def directorio_menu(slug):
+    return Path(_config()['DIRECTORIO']) / 'restaurante' / slug
+
+
+def renderizar_menu_estatico(restaurante):
+    """HTML del menú tal como lo ve un visitante anónimo, con el beacon de visitas."""
+    return render_to_string('components/menu_publico.html', {
+        'restaurante': restaurante,
+        'categorias': lambda: cargar_menu(restaurante),
+        'cache_segundos': segundos_cache_menu(),
+        'version_menu': version_menu(restaurante),
+        'estatico': True,
+    })
+
+
+def publicar_menu(restaurante):
+    """Escribe el HTML del menú y sus versiones comprimidas."""
+    if not restaurante.activo:
+        retirar_menu(restaurante.slug)
+        return
+    html = renderizar_menu_estatico(restaurante).encode()
+    directorio = directorio_menu(restaurante.slug)
+    directorio.mkdir(parents=True, exist_ok=True)
+    _escribir(directorio / 'index.html', html)
+    _escribir(directorio / 'index.html.gz', gzip.compress(html, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _escribir(directorio / 'index.html.br', brotli.compress(html))
+
+
+def retirar_menu(slug):
+    shutil.rmtree(directorio_menu(slug), ignore_errors=True)
+
+
+def programar_publicacion(restaurante_id):
+    """Vuelve a publicar el restaurante al terminar la transacción actual.
+
+    Varias modificaciones seguidas del mismo restaurante se agrupan en una
+    sola publicación mientras la anterior sigue en cola.
+    """
+    config = _config()
+    if not config['DIRECTORIO']:
+        return
+    if config['SINCRONO']:
+        transaction.on_commit(lambda: publicar_restaurante(restaurante_id))
+        return
+
+    def encolar():
+        with _lock:
+            if restaurante_id in _pendientes:
+                return
+            _pendientes.add(restaurante_id)
+        _pool_de_hilos(config['HILOS']).submit(_publicar_en_hilo, restaurante_id)
+
+    transaction.on_commit(encolar)
+
+
+def publicar_restaurante(restaurante_id):
+    from .models import Restaurante
+
+    restaurante = Restaurante.objects.filter(pk=restaurante_id).first()
+    if restaurante is not None:
+        publicar_menu(restaurante)
+
+
+def _publicar_en_hilo(restaurante_id):
+    with _lock:
+        _pendientes.discard(restaurante_id)
+    try:
+        publicar_restaurante(restaurante_id)
+    except Exception:
+        logger.exception("No se pudo publicar el menú del restaurante %s", restaurante_id)
+    finally:
+        connection.close()
+
+
+def _escribir(ruta, datos):
+    # Se escribe en un temporal y se renombra para no servir archivos a medias
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, prefix='.tmp-')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(datos)
+    os.chmod(temporal, 0o644)
+    os.replace(temporal, ruta)
+
+
+def _pool_de_hilos(hilos):
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='publicacion')
+        return _pool
@@ -0,0 +1,82 @@
+"""
+Restaurante del dueño que hace la petición.
+
+``RestauranteActualMiddleware`` (después de ``AuthenticationMiddleware``)
+añade a cada petición, como hace Django con ``request.user``:
+
+- ``request.restaurante``: el restaurante del usuario, perezoso. Es falso
+  si no tiene sesión o no tiene restaurante (compárese con ``if not``, no
+  con ``is None``).
+- ``request.arestaurante()``: lo mismo para vistas async, que no pueden
+  consultar la base de datos sin ``await``.
+
+El restaurante se consulta la primera vez que se usa, como mucho una vez
+por petición, y no se guarda entre peticiones: es lo que decide qué puede
+editar cada usuario, y una caché por proceso seguiría dando el restaurante
+a su antiguo dueño en los demás workers después de cambiarlo o borrarlo.
+Las vistas que solo buscan objetos del dueño no lo necesitan: filtran por
+``request.user.id`` (``restaurante__dueño_id=``) y no consultan nada más.
+
+Las vistas privadas usan ``@restaurante_requerido``, que exige sesión
+iniciada y muestra la página de error si el usuario no tiene restaurante
+(por ejemplo, un superusuario creado con ``createsuperuser``), o
+``RestauranteRequeridoMixin``.
+"""
+from functools import partial, wraps
+
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import render
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .models import Restaurante
+
+
+def obtener_restaurante(request):
+    if not hasattr(request, '_restaurante'):
+        usuario = request.user
+        request._restaurante = (
+            Restaurante.objects.filter(dueño_id=usuario.id).first() if usuario.is_authenticated else None
+        )
+    return request._restaurante
+
+
+async def aobtener_restaurante(request):
+    if not hasattr(request, '_restaurante'):
+        usuario = await request.auser()
+        request._restaurante = (
+            await Restaurante.objects.filter(dueño_id=usuario.id).afirst() if usuario.is_authenticated else None
+        )
+    return request._restaurante
+
+
+class RestauranteActualMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request.restaurante = SimpleLazyObject(lambda: obtener_restaurante(request))
+        request.arestaurante = partial(aobtener_restaurante, request)
+
+
+def sin_restaurante(request):
+    return render(request, 'pages/error.html', {
+        'message': 'No tienes un restaurante asociado.'
+    })
+
+
+def restaurante_requerido(vista):
+    """Como ``login_required``, y además el usuario debe tener restaurante."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if obtener_restaurante(request) is None:
+            return sin_restaurante(request)
+        return vista(request, *args, **kwargs)
+    return login_required(envoltura)
+
+
+class RestauranteRequeridoMixin(LoginRequiredMixin):
+    """Para vistas basadas en clases: exige sesión, pero no consulta el restaurante.
+
+    ``get_queryset`` debe filtrar por ``request.user.id``, así un usuario sin
+    restaurante no encuentra nada (404); las vistas que crean objetos
+    comprueban ``request.restaurante`` al guardar.
+    """
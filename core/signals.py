@@ -0,0 +1,139 @@
+import logging
+
+from django.db.models import F
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache_menu import marcar_menu_actualizado
+from .imagenes import borrar_variantes, guardar_variantes, sin_metadatos, variantes_de_imagen
+from .models import Categoria, Plato, Restaurante, VisitDailyStat
+from .publicacion import programar_publicacion, publicacion_activa, retirar_menu
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_delete, sender=Plato)
+def conservar_estadisticas_de_plato(sender, instance, **kwargs):
+    """Pasa las estadísticas del plato eliminado a la fila sin plato de cada día.
+
+    Así los totales diarios no cambian y se mantiene una sola fila sin plato
+    por restaurante, fecha y tipo.
+    """
+    for stat in VisitDailyStat.objects.filter(plato=instance):
+        sin_plato = VisitDailyStat.objects.filter(
+            restaurante_id=stat.restaurante_id, fecha=stat.fecha, tipo=stat.tipo, plato__isnull=True,
+        )
+        if sin_plato.update(visitas=F('visitas') + stat.visitas):
+            stat.delete()
+        else:
+            stat.plato = None
+            stat.save(update_fields=['plato'])
+
+
+# --- Variantes optimizadas de imágenes (ver core/imagenes.py) ---
+
+def quitar_metadatos(instance, campo):
+    """Quita los metadatos de la imagen recién subida, antes de que se guarde."""
+    imagen = getattr(instance, campo)
+    if not imagen or imagen._committed:
+        return
+    try:
+        imagen.open('rb')
+        limpia = sin_metadatos(imagen.read())
+    except Exception:
+        # El formulario ya validó la imagen; si Pillow no puede rehacerla se guarda tal cual
+        logger.exception("No se pudieron quitar los metadatos de %s", imagen.name)
+        return
+    setattr(instance, campo, ContentFile(limpia, name=imagen.name))
+
+
+@receiver(pre_save, sender=Plato)
+def metadatos_imagen_plato(sender, instance, **kwargs):
+    quitar_metadatos(instance, 'imagen')
+
+
+@receiver(pre_save, sender=Restaurante)
+def metadatos_logo_restaurante(sender, instance, **kwargs):
+    quitar_metadatos(instance, 'logo')
+
+
+def actualizar_variantes(instance, campo, campo_variantes):
+    """Regenera las variantes si la imagen cambió desde la última vez."""
+    imagen = getattr(instance, campo)
+    anteriores = getattr(instance, campo_variantes) or {}
+    if (imagen.name or None) == anteriores.get('origen'):
+        return
+
+    borrar_variantes(imagen.storage, anteriores)
+    nuevas = {}
+    if imagen:
+        try:
+            with imagen.open('rb') as archivo:
+                nuevas = guardar_variantes(imagen, variantes_de_imagen(archivo.read()))
+        except Exception:
+            # Se sirve la imagen original; se reintenta en el próximo guardado
+            logger.exception("No se pudieron generar las variantes de %s", imagen.name)
+    setattr(instance, campo_variantes, nuevas)
+    type(instance).objects.filter(pk=instance.pk).update(**{campo_variantes: nuevas})
+
+
+@receiver(post_save, sender=Plato)
+def variantes_imagen_plato(sender, instance, **kwargs):
+    actualizar_variantes(instance, 'imagen', 'imagen_variantes')
+
+
+@receiver(post_save, sender=Restaurante)
+def variantes_logo_restaurante(sender, instance, **kwargs):
+    actualizar_variantes(instance, 'logo', 'logo_variantes')
+
+
+@receiver(post_delete, sender=Plato)
+def borrar_variantes_plato(sender, instance, **kwargs):
+    borrar_variantes(instance.imagen.storage, instance.imagen_variantes)
+
+
+@receiver(post_delete, sender=Restaurante)
+def borrar_variantes_logo(sender, instance, **kwargs):
+    borrar_variantes(instance.logo.storage, instance.logo_variantes)
+
+
+# --- Versión del menú público (caché y ETag) ---
+# Restaurante.save() ya actualiza su propia marca. Estos receptores van
+# después de los de imágenes para que la nueva versión incluya las variantes.
+
+@receiver([post_save, post_delete], sender=Categoria)
+def actualizar_menu_categoria(sender, instance, **kwargs):
+    marcar_menu_actualizado(restaurante_id=instance.restaurante_id)
+
+
+@receiver([post_save, post_delete], sender=Plato)
+def actualizar_menu_plato(sender, instance, **kwargs):
+    marcar_menu_actualizado(categoria_id=instance.categoria_id)
+
+
+
+# --- Menús publicados como HTML estático (ver core/publicacion.py) ---
+
+@receiver(post_save, sender=Restaurante)
+def publicar_menu_restaurante(sender, instance, **kwargs):
+    programar_publicacion(instance.pk)
+
+
+@receiver(post_delete, sender=Restaurante)
+def retirar_menu_restaurante(sender, instance, **kwargs):
+    if publicacion_activa():
+        retirar_menu(instance.slug)
+
+
+@receiver([post_save, post_delete], sender=Categoria)
+def publicar_menu_categoria(sender, instance, **kwargs):
+    programar_publicacion(instance.restaurante_id)
+
+
+@receiver([post_save, post_delete], sender=Plato)
+def publicar_menu_plato(sender, instance, **kwargs):
+    if publicacion_activa():
+        restaurante_id = Categoria.objects.filter(id=instance.categoria_id).values_list('restaurante_id', flat=True).first()
+        if restaurante_id is not None:
+            programar_publicacion(restaurante_id)
@@ -0,0 +1,20 @@
+'use strict';
+// Filtros del admin con buscador (core/admin.py, FiltroAutocompletar):
+// al elegir un valor se recarga el listado con el filtro aplicado.
+{
+    const $ = django.jQuery;
+
+    $(function() {
+        $('.filtro-autocompletar select').on('change', function() {
+            const params = new URLSearchParams(window.location.search);
+            params.delete('p');
+            params.delete('antes');
+            if (this.value) {
+                params.set(this.name, this.value);
+            } else {
+                params.delete(this.name);
+            }
+            window.location.search = params.toString();
+        });
+    });
+}
@@ -0,0 +1,141 @@
+"""
+Generación de códigos QR en segundo plano.
+
+``encolar_qr`` registra una ``TareaQR`` (una por slug, así que pedir dos veces
+el mismo QR no crea dos trabajos) y la ejecuta en un pool de hilos cuando
+termina la transacción actual, de modo que el registro y ``regenerar_qr`` no
+esperan a que se dibuje la imagen. Con ``QR_TAREAS['SINCRONO'] = True`` la
+tarea se ejecuta en el mismo hilo, que es lo que usan las pruebas.
+
+El pool vive en memoria: si el proceso se reinicia, sus tareas se quedan
+pendientes o en proceso. Las que llevan más de ``QR_TAREAS['CADUCIDAD']``
+segundos sin cambiar se dan por perdidas; ``encolar_qr`` las vuelve a lanzar y
+``manage.py regenerar_qrs --pendientes`` (``reanudar_tareas``) lanza todas.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .qr import png_qr
+
+logger = logging.getLogger(__name__)
+
+CONFIG_POR_DEFECTO = {
+    'SINCRONO': False,
+    'HILOS': 2,
+    'CADUCIDAD': 600,
+}
+
+_lock = threading.Lock()
+_pool = None
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'QR_TAREAS', {}))
+    return config
+
+
+def url_menu(slug):
+    return f"{settings.SITE_URL}/restaurante/{slug}/"
+
+
+def encolar_qr(restaurante):
+    """Pide (o vuelve a pedir) el QR del restaurante y devuelve su tarea."""
+    from .models import TareaQR
+
+    config = _config()
+    tarea, creada = TareaQR.objects.get_or_create(
+        clave=restaurante.slug, defaults={'restaurante': restaurante},
+    )
+    if not creada:
+        if tarea.estado == TareaQR.PENDIENTE and tarea.actualizada >= _limite_de_caducidad(config):
+            # Ya hay un trabajo en cola para este slug
+            return tarea
+        TareaQR.objects.filter(pk=tarea.pk).update(estado=TareaQR.PENDIENTE, error='', actualizada=timezone.now())
+        tarea.estado = TareaQR.PENDIENTE
+
+    _lanzar(tarea.pk, config)
+    return tarea
+
+
+def reanudar_tareas():
+    """Vuelve a lanzar las tareas perdidas (pendientes o en proceso caducadas).
+
+    Devuelve cuántas se lanzaron.
+    """
+    from .models import TareaQR
+
+    config = _config()
+    perdidas = TareaQR.objects.filter(
+        estado__in=[TareaQR.PENDIENTE, TareaQR.EN_PROCESO],
+        actualizada__lt=_limite_de_caducidad(config),
+    )
+    lanzadas = 0
+    for tarea_id in perdidas.values_list('pk', flat=True):
+        # Otro proceso puede haberla reanudado o terminado mientras tanto
+        if perdidas.filter(pk=tarea_id).update(estado=TareaQR.PENDIENTE, error='', actualizada=timezone.now()):
+            _lanzar(tarea_id, config)
+            lanzadas += 1
+    return lanzadas
+
+
+def _limite_de_caducidad(config):
+    return timezone.now() - timedelta(seconds=config['CADUCIDAD'])
+
+
+def _lanzar(tarea_id, config):
+    if config['SINCRONO']:
+        transaction.on_commit(lambda: ejecutar_tarea(tarea_id))
+    else:
+        transaction.on_commit(lambda: _pool_de_hilos(config['HILOS']).submit(_ejecutar_en_hilo, tarea_id))
+
+
+def ejecutar_tarea(tarea_id):
+    """Dibuja y guarda el QR de la tarea si sigue pendiente."""
+    from .models import TareaQR
+
+    # Solo un trabajador puede pasar la tarea de pendiente a en proceso
+    if not TareaQR.objects.filter(pk=tarea_id, estado=TareaQR.PENDIENTE).update(
+            estado=TareaQR.EN_PROCESO, actualizada=timezone.now()):
+        return
+    tarea = TareaQR.objects.select_related('restaurante').get(pk=tarea_id)
+    try:
+        guardar_qr(tarea.restaurante, png_qr(url_menu(tarea.restaurante.slug)))
+    except Exception as exc:
+        logger.exception("No se pudo generar el QR de %s", tarea.clave)
+        TareaQR.objects.filter(pk=tarea_id).update(estado=TareaQR.ERROR, error=str(exc), actualizada=timezone.now())
+    else:
+        TareaQR.objects.filter(pk=tarea_id).update(estado=TareaQR.COMPLETADA, actualizada=timezone.now())
+
+
+def guardar_qr(restaurante, png):
+    """Guarda el PNG como ``qr_code`` del restaurante con un único UPDATE."""
+    from .models import Restaurante
+
+    anterior = restaurante.qr_code.name if restaurante.qr_code else None
+    restaurante.qr_code.save(f"qr-{restaurante.slug}.png", ContentFile(png), save=False)
+    Restaurante.objects.filter(pk=restaurante.pk).update(qr_code=restaurante.qr_code.name)
+    if anterior and anterior != restaurante.qr_code.name:
+        restaurante.qr_code.storage.delete(anterior)
+
+
+def _ejecutar_en_hilo(tarea_id):
+    try:
+        ejecutar_tarea(tarea_id)
+    finally:
+        connection.close()
+
+
+def _pool_de_hilos(hilos):
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='qr')
+        return _pool
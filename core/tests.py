@@ -1,3 +1,1595 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import shutil
+import subprocess
+import sys
+import threading
+import unittest
+import tempfile
+from array import array
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import ConnectionHandler, DatabaseError, close_old_connections, connection
+from django.db.models import F, Sum
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from .models import Categoria, Plato, Restaurante, TareaQR, Visit, VisitDailyStat
+from .admin import filas_estimadas
+from .instrumentacion import PlantillaMedida, resumen_por_vista, vaciar_muestras
+from .tareas_qr import encolar_qr
+from . import analitica, arranque, busqueda, dashboard, eventos, visitas
+from .visitas import acumular_estadisticas, aregistrar_visita, inicio_del_dia, registrar_visita, resumen_diario, vaciar_visitas, visitas_pendientes
+
+MEDIA_TEMPORAL = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_TEMPORAL, ignore_errors=True)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_TEMPORAL,
+    VISITAS_BUFFER={'SINCRONO': True},
+    QR_TAREAS={'SINCRONO': True},
+)
+class BaseTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='dueño', password='clave-segura-123')
+        cls.restaurante = Restaurante.objects.create(dueño=cls.usuario, nombre='Pizzería Pepe')
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        vaciar_visitas()
+
+
+class VisitasTests(BaseTestCase):
+
+    def test_modo_sincrono_guarda_cada_visita(self):
+        self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertEqual(Visit.objects.filter(restaurante=self.restaurante, tipo='menu').count(), 1)
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 3, 'SEGUNDOS': 3600})
+    def test_buffer_se_vacia_al_llenarse_fuera_de_la_peticion(self):
+        with mock.patch('core.visitas._vaciar_en_hilo') as vaciar:
+            registrar_visita(self.restaurante.id)
+            registrar_visita(self.restaurante.id)
+            self.assertEqual(visitas_pendientes(), 2)
+
+            registrar_visita(self.restaurante.id)
+            visitas._hilo_lote.join()
+        vaciar.assert_called_once_with()
+        self.assertEqual(Visit.objects.count(), 0)
+        self.assertEqual(vaciar_visitas(), 3)
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_error_de_base_de_datos_devuelve_el_lote_al_buffer(self):
+        registrar_visita(self.restaurante.id)
+        registrar_visita(self.restaurante.id)
+        with mock.patch.object(Visit.objects, 'bulk_create', side_effect=DatabaseError('caída')):
+            with self.assertRaises(DatabaseError):
+                vaciar_visitas()
+        self.assertEqual(visitas_pendientes(), 2)
+        self.assertFalse(Visit.objects.exists())
+
+        self.assertEqual(vaciar_visitas(), 2)
+        self.assertEqual(Visit.objects.count(), 2)
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600, 'MAXIMO': 3})
+    def test_con_la_base_de_datos_caida_el_buffer_no_crece_sin_limite(self):
+        otro = Restaurante.objects.create(dueño=User.objects.create_user(username='otro'), nombre='Otro')
+        registrar_visita(self.restaurante.id)
+        registrar_visita(self.restaurante.id)
+        with mock.patch.object(Restaurante.objects, 'filter', side_effect=DatabaseError('caída')):
+            with self.assertRaises(DatabaseError):
+                vaciar_visitas()
+        self.assertEqual(visitas_pendientes(), 2)
+
+        with self.assertLogs('core.visitas', 'ERROR') as logs:
+            registrar_visita(otro.id)
+            registrar_visita(otro.id)
+        self.assertIn('descartadas las 1 visitas más antiguas', logs.output[0])
+        self.assertEqual(visitas_pendientes(), 3)
+        self.assertEqual(vaciar_visitas(), 3)
+        self.assertEqual(Visit.objects.filter(restaurante=otro).count(), 2)
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_vaciado_conserva_la_hora_de_la_visita(self):
+        antes = timezone.now()
+        registrar_visita(self.restaurante.id)
+        self.assertEqual(vaciar_visitas(), 1)
+        visita = Visit.objects.get()
+        self.assertLess(visita.timestamp - antes, timedelta(seconds=1))
+        self.assertGreaterEqual(visita.timestamp, antes)
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_descarta_visitas_de_restaurantes_eliminados(self):
+        otro = Restaurante.objects.create(
+            dueño=User.objects.create_user(username='otro', password='clave-segura-123'),
+            nombre='Otro',
+        )
+        registrar_visita(self.restaurante.id)
+        registrar_visita(otro.id)
+        otro.delete()
+        self.assertEqual(vaciar_visitas(), 1)
+        self.assertEqual(Visit.objects.get().restaurante, self.restaurante)
+
+
+class EstadisticasDiariasTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        cls.plato = Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+
+    def test_cada_lote_suma_al_resumen_diario(self):
+        registrar_visita(self.restaurante.id)
+        registrar_visita(self.restaurante.id)
+        registrar_visita(self.restaurante.id, tipo='plato', plato_id=self.plato.id)
+
+        hoy = timezone.localdate()
+        self.assertEqual(
+            VisitDailyStat.objects.get(restaurante=self.restaurante, fecha=hoy, tipo='menu', plato=None).visitas, 2)
+        self.assertEqual(
+            VisitDailyStat.objects.get(restaurante=self.restaurante, fecha=hoy, tipo='plato', plato=self.plato).visitas, 1)
+
+    def test_dashboard_lee_el_resumen(self):
+        hoy = timezone.localdate()
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=hoy, tipo='menu', visitas=4)
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=hoy - timedelta(days=3), tipo='menu', visitas=6)
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=hoy - timedelta(days=20), tipo='menu', visitas=50)
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=hoy, tipo='plato', plato=self.plato, visitas=3)
+
+        datos = dashboard.estadisticas(self.restaurante)
+
+        self.assertEqual(datos['visitas_hoy'], 7)
+        self.assertEqual(datos['visitas_ultimas_2semanas'], 13)
+        self.assertEqual(len(datos['stats_dias']), 2)
+        self.assertEqual(datos['top_platos'], [{'plato__nombre': 'Margarita', 'veces': 3}])
+
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard_estadisticas'))
+        self.assertContains(response, 'Margarita')
+
+    def test_recalcular_estadisticas_desde_visitas(self):
+        ayer = timezone.now() - timedelta(days=1)
+        Visit.objects.bulk_create([
+            Visit(restaurante=self.restaurante, tipo='menu'),
+            Visit(restaurante=self.restaurante, tipo='menu', timestamp=ayer),
+            Visit(restaurante=self.restaurante, tipo='plato', plato=self.plato),
+        ])
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=timezone.localdate(), tipo='menu', visitas=99)
+
+        call_command('recalcular_estadisticas', stdout=StringIO())
+
+        self.assertEqual(VisitDailyStat.objects.count(), 3)
+        self.assertEqual(
+            VisitDailyStat.objects.get(fecha=timezone.localdate(), tipo='menu').visitas, 1)
+
+    def test_eliminar_plato_conserva_los_totales(self):
+        registrar_visita(self.restaurante.id)
+        registrar_visita(self.restaurante.id, tipo='menu', plato_id=self.plato.id)
+
+        self.plato.delete()
+
+        stat = VisitDailyStat.objects.get()
+        self.assertIsNone(stat.plato_id)
+        self.assertEqual(stat.visitas, 2)
+
+
+class MenuCacheTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        cls.plato = Plato.objects.create(categoria=cls.categoria, nombre='Margarita', precio=Decimal('8.50'))
+        cls.url = reverse('menu_publico', args=[cls.restaurante.slug])
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_segunda_visita_no_consulta_categorias_ni_platos(self):
+        self.client.get(self.url)
+        # Solo el restaurante: la visita queda en el buffer
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Margarita')
+
+    def test_visitas_se_cuentan_con_el_menu_en_cache(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(Visit.objects.filter(restaurante=self.restaurante).count(), 2)
+
+    def test_editar_plato_invalida_el_menu(self):
+        self.client.get(self.url)
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('plato_editar', args=[self.plato.pk]), {
+            'nombre': 'Cuatro quesos', 'descripcion': '', 'precio': '10.00', 'disponible': 'on',
+        })
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Cuatro quesos')
+        self.assertNotContains(response, 'Margarita')
+
+    def test_nueva_categoria_invalida_el_menu(self):
+        self.client.get(self.url)
+        Categoria.objects.create(restaurante=self.restaurante, nombre='Postres')
+        self.assertContains(self.client.get(self.url), 'Postres')
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_cambios_en_otro_restaurante_no_invalidan(self):
+        otro = Restaurante.objects.create(
+            dueño=User.objects.create_user(username='otro', password='clave-segura-123'),
+            nombre='Otro',
+        )
+        self.client.get(self.url)
+        Categoria.objects.create(restaurante=otro, nombre='Bebidas')
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+
+class MenuCondicionalTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        cls.plato = Plato.objects.create(categoria=cls.categoria, nombre='Margarita', precio=Decimal('8.50'))
+        cls.url = reverse('menu_publico', args=[cls.restaurante.slug])
+
+    def test_responde_304_si_el_etag_coincide(self):
+        etag = self.client.get(self.url).headers['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_304_tambien_cuenta_la_visita(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(Visit.objects.filter(restaurante=self.restaurante).count(), 2)
+
+    def test_responde_304_con_if_modified_since(self):
+        ultima = self.client.get(self.url).headers['Last-Modified']
+        response = self.client.get(self.url, headers={'If-Modified-Since': ultima})
+        self.assertEqual(response.status_code, 304)
+
+    def test_cambiar_un_plato_cambia_el_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.plato.precio = Decimal('9.00')
+        self.plato.save()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_eliminar_categoria_cambia_el_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.categoria.delete()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+class NumeroDeConsultasTests(BaseTestCase):
+    """El número de consultas de cada vista no depende del tamaño del menú."""
+
+    TAMAÑOS = (10, 100, 1000)
+
+    def crear_menu(self, platos, categorias=10):
+        self.restaurante.categorias.all().delete()
+        creadas = Categoria.objects.bulk_create([
+            Categoria(restaurante=self.restaurante, nombre=f'Categoría {c}') for c in range(categorias)
+        ])
+        Plato.objects.bulk_create([
+            Plato(
+                categoria=creadas[p % categorias],
+                nombre=f'Plato {p}',
+                descripcion='Descripción larga ' * 20,
+                precio=Decimal('5.00'),
+                disponible=p % 10 != 0,
+            )
+            for p in range(platos)
+        ])
+        return creadas
+
+    def test_menu_publico(self):
+        url = reverse('menu_publico', args=[self.restaurante.slug])
+        for tamaño in self.TAMAÑOS:
+            with self.subTest(platos=tamaño):
+                self.crear_menu(tamaño)
+                cache.clear()
+                # Restaurante, categorías y platos disponibles
+                with self.assertNumQueries(3):
+                    response = self.client.get(url)
+                self.assertEqual(
+                    sum(len(c['platos']) for c in response.context['categorias']()),
+                    tamaño - tamaño // 10,
+                )
+
+    def test_menu_publico_omite_platos_no_disponibles(self):
+        categoria = Categoria.objects.create(restaurante=self.restaurante, nombre='Pizzas')
+        Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+        Plato.objects.create(categoria=categoria, nombre='Agotada', precio=Decimal('8.50'), disponible=False)
+        response = self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertContains(response, 'Margarita')
+        self.assertNotContains(response, 'Agotada')
+
+    def test_dashboard(self):
+        self.client.force_login(self.usuario)
+        for tamaño in self.TAMAÑOS:
+            with self.subTest(platos=tamaño):
+                self.crear_menu(tamaño)
+                cache.clear()
+                # Sesión, usuario y restaurante; las dos consultas de
+                # estadísticas; y total, página y platos de las categorías
+                with self.assertNumQueries(8):
+                    response = self.client.get(reverse('dashboard'), {'page': 2})
+                self.assertContains(response, 'Página 2 de 4')
+                # Con los dos fragmentos en caché solo queda la parte fija
+                with self.assertNumQueries(3):
+                    self.client.get(reverse('dashboard'), {'page': 2})
+
+    def test_fragmentos_del_dashboard(self):
+        self.client.force_login(self.usuario)
+        categorias = self.crear_menu(100)
+        cache.clear()
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('dashboard_categorias'), {'page': 'x'})
+        self.assertContains(response, 'Página 1 de 4')
+        self.assertContains(response, '10 platos')
+        self.assertNotContains(response, '<html')
+
+        # Un plato nuevo cambia la versión del menú y la página vuelve a calcularse
+        Plato.objects.create(categoria=categorias[0], nombre='Nuevo', precio=Decimal('1.00'))
+        response = self.client.get(reverse('dashboard_categorias'))
+        self.assertContains(response, '11 platos')
+
+    def test_vistas_de_platos_y_categorias(self):
+        self.client.force_login(self.usuario)
+        for tamaño in self.TAMAÑOS:
+            with self.subTest(platos=tamaño):
+                categoria = self.crear_menu(tamaño)[0]
+                plato = categoria.platos.first()
+                datos_plato = {'nombre': 'Nuevo', 'descripcion': '', 'precio': '7.00', 'disponible': 'on'}
+
+                # Cada petición: sesión y usuario, más lo propio de la vista. Las
+                # vistas filtran por el id del dueño, así que solo categoria_crear
+                # consulta su restaurante (ver core/restaurante_actual.py)
+                with self.assertNumQueries(2):
+                    self.client.get(reverse('plato_crear', args=[categoria.id]))
+                with self.assertNumQueries(5):
+                    self.client.post(reverse('plato_crear', args=[categoria.id]), datos_plato)
+                with self.assertNumQueries(3):
+                    self.client.get(reverse('plato_editar', args=[plato.pk]))
+                with self.assertNumQueries(5):
+                    self.client.post(reverse('plato_editar', args=[plato.pk]), datos_plato)
+                with self.assertNumQueries(8):
+                    self.client.post(reverse('plato_eliminar', args=[plato.pk]))
+                with self.assertNumQueries(5):
+                    self.client.post(reverse('categoria_crear'), {'nombre': 'Postres'})
+                with self.assertNumQueries(5):
+                    self.client.post(reverse('categoria_editar', args=[categoria.pk]), {'nombre': 'Entradas'})
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN es propio de SQLite")
+class IndicesTests(BaseTestCase):
+
+    def plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' | '.join(fila[-1] for fila in cursor.fetchall())
+
+    def test_consultas_del_dashboard_usan_indices(self):
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('dashboard'))
+
+        estadisticas = [c['sql'] for c in consultas if 'FROM "core_visitdailystat"' in c['sql']]
+        self.assertEqual(len(estadisticas), 2)
+        for sql in estadisticas:
+            plan = self.plan(sql)
+            # El índice de la restricción única (restaurante, fecha, tipo, plato)
+            self.assertIn('SEARCH core_visitdailystat USING INDEX', plan)
+            self.assertNotIn('SCAN core_visitdailystat', plan)
+
+    def test_rango_de_fechas_usa_indice_de_visitas(self):
+        desde = timezone.localdate() - timedelta(days=13)
+        sql, params = (Visit.objects
+            .filter(restaurante=self.restaurante, timestamp__gte=inicio_del_dia(desde))
+            .values('id').query.sql_with_params())
+        self.assertIn('USING COVERING INDEX visit_rest_timestamp_idx (restaurante_id=? AND timestamp>?)',
+                      self.plan(sql, params))
+
+    def test_visitas_por_plato_usan_indice(self):
+        sql, params = (Visit.objects
+            .filter(restaurante=self.restaurante, plato__isnull=False)
+            .values('plato').query.sql_with_params())
+        self.assertIn('visit_rest_plato_idx', self.plan(sql, params))
+
+
+class TareasQRTests(BaseTestCase):
+
+    def crear_restaurante(self, nombre='Taquería'):
+        dueño = User.objects.create_user(username=nombre.lower(), password='clave-segura-123')
+        with self.captureOnCommitCallbacks(execute=True):
+            return Restaurante.objects.create(dueño=dueño, nombre=nombre)
+
+    def test_registro_genera_el_qr_al_confirmar(self):
+        restaurante = self.crear_restaurante()
+        restaurante.refresh_from_db()
+        self.assertTrue(restaurante.qr_code.name.startswith('qrcodes/qr-taqueria'))
+        self.assertEqual(TareaQR.objects.get(clave=restaurante.slug).estado, TareaQR.COMPLETADA)
+
+    def test_la_tarea_es_unica_por_slug(self):
+        restaurante = self.crear_restaurante()
+        with self.captureOnCommitCallbacks() as callbacks:
+            primera = encolar_qr(restaurante)
+            segunda = encolar_qr(restaurante)
+        self.assertEqual(primera.pk, segunda.pk)
+        self.assertEqual(TareaQR.objects.filter(clave=restaurante.slug).count(), 1)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(TareaQR.objects.get(pk=primera.pk).estado, TareaQR.COMPLETADA)
+
+    def test_una_tarea_pendiente_caducada_se_vuelve_a_lanzar(self):
+        restaurante = self.crear_restaurante()
+        hace_un_rato = timezone.now() - timedelta(minutes=5)
+        TareaQR.objects.filter(clave=restaurante.slug).update(estado=TareaQR.PENDIENTE, actualizada=hace_un_rato)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            encolar_qr(restaurante)
+        self.assertEqual(callbacks, [])
+
+        with override_settings(QR_TAREAS={'SINCRONO': True, 'CADUCIDAD': 60}):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                encolar_qr(restaurante)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(TareaQR.objects.get(clave=restaurante.slug).estado, TareaQR.COMPLETADA)
+
+    def test_regenerar_qrs_pendientes_reanuda_las_tareas_perdidas(self):
+        perdida = self.crear_restaurante('Perdida')
+        reciente = self.crear_restaurante('Reciente')
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TareaQR.objects.filter(clave=perdida.slug).update(estado=TareaQR.EN_PROCESO, actualizada=hace_una_hora)
+        TareaQR.objects.filter(clave=reciente.slug).update(estado=TareaQR.EN_PROCESO)
+
+        salida = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('regenerar_qrs', pendientes=True, stdout=salida)
+
+        self.assertIn('1 tareas QR', salida.getvalue())
+        self.assertEqual(TareaQR.objects.get(clave=perdida.slug).estado, TareaQR.COMPLETADA)
+        self.assertEqual(TareaQR.objects.get(clave=reciente.slug).estado, TareaQR.EN_PROCESO)
+
+    def test_regenerar_qrs_reemplaza_los_archivos(self):
+        restaurante = self.crear_restaurante()
+        restaurante.refresh_from_db()
+        anterior = restaurante.qr_code.name
+
+        with override_settings(SITE_URL='https://menu.example.com'):
+            call_command('regenerar_qrs', procesos=1, stdout=StringIO())
+
+        restaurante.refresh_from_db()
+        self.assertNotEqual(restaurante.qr_code.name, anterior)
+        self.assertTrue(restaurante.qr_code.storage.exists(restaurante.qr_code.name))
+        self.assertFalse(restaurante.qr_code.storage.exists(anterior))
+
+
+def imagen_jpeg(ancho=1600, alto=1200, orientacion=None):
+    """JPEG de prueba con metadatos EXIF."""
+    exif = Image.Exif()
+    exif[0x010F] = 'Cámara de prueba'  # Make
+    if orientacion:
+        exif[0x0112] = orientacion  # Orientation
+    buffer = BytesIO()
+    Image.new('RGB', (ancho, alto), 'orange').save(buffer, format='JPEG', exif=exif)
+    return SimpleUploadedFile('pizza.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImagenesTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+
+    def test_subir_imagen_genera_variantes_sin_exif(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('plato_crear', args=[self.categoria.id]), {
+            'nombre': 'Margarita', 'descripcion': '', 'precio': '8.50', 'disponible': 'on',
+            'imagen': imagen_jpeg(),
+        })
+        plato = Plato.objects.get()
+        variantes = plato.imagen_variantes
+        self.assertEqual(variantes['origen'], plato.imagen.name)
+        self.assertEqual([ancho for ancho, _ in variantes['webp']], [320, 640, 960])
+        self.assertEqual([ancho for ancho, _ in variantes['jpeg']], [960])
+
+        for nombre in (plato.imagen.name, variantes['webp'][0][1], variantes['jpeg'][0][1]):
+            with plato.imagen.storage.open(nombre) as archivo, Image.open(archivo) as imagen:
+                self.assertEqual(len(imagen.getexif()), 0)
+
+    def test_el_original_se_guarda_sin_metadatos_y_derecho(self):
+        # Orientación 6: la cámara estaba girada 90°, la foto se ve vertical
+        plato = Plato.objects.create(
+            categoria=self.categoria, nombre='Margarita', precio=Decimal('8.50'), imagen=imagen_jpeg(orientacion=6))
+        with plato.imagen.storage.open(plato.imagen.name) as archivo, Image.open(archivo) as imagen:
+            self.assertEqual(len(imagen.getexif()), 0)
+            self.assertEqual(imagen.size, (1200, 1600))
+            self.assertEqual(imagen.format, 'JPEG')
+        self.assertTrue(plato.imagen.name.startswith('platos/pizza'))
+
+    def test_las_animaciones_conservan_sus_fotogramas(self):
+        fotogramas = [Image.new('RGB', (400, 300), color) for color in ('red', 'green', 'blue')]
+        buffer = BytesIO()
+        fotogramas[0].save(buffer, format='GIF', save_all=True, append_images=fotogramas[1:], duration=100, loop=0)
+        gif = SimpleUploadedFile('pizza.gif', buffer.getvalue(), content_type='image/gif')
+        plato = Plato.objects.create(categoria=self.categoria, nombre='Margarita', precio=Decimal('8.50'), imagen=gif)
+        with plato.imagen.storage.open(plato.imagen.name) as archivo, Image.open(archivo) as imagen:
+            self.assertEqual(imagen.n_frames, 3)
+
+    def test_dashboard_usa_las_variantes_del_logo(self):
+        self.restaurante.logo = imagen_jpeg(400, 400)
+        self.restaurante.save()
+
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'type="image/webp" srcset="/logos/variantes/pizza-320.webp 320w')
+        self.assertContains(response, '-400.jpg"')
+
+    def test_menu_publico_usa_srcset_y_carga_diferida(self):
+        Plato.objects.create(categoria=self.categoria, nombre='Margarita', precio=Decimal('8.50'), imagen=imagen_jpeg())
+        response = self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertContains(response, 'type="image/webp" srcset="/platos/variantes/pizza')
+        self.assertContains(response, '320w')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, '-960.jpg"')
+
+    def test_imagen_pequeña_no_se_agranda(self):
+        plato = Plato.objects.create(categoria=self.categoria, nombre='Mini', precio=Decimal('1'), imagen=imagen_jpeg(400, 300))
+        self.assertEqual([ancho for ancho, _ in plato.imagen_variantes['webp']], [320, 400])
+
+    def test_procesar_imagenes_existentes(self):
+        plato = Plato.objects.create(categoria=self.categoria, nombre='Margarita', precio=Decimal('8.50'), imagen=imagen_jpeg())
+        Plato.objects.filter(pk=plato.pk).update(imagen_variantes={})
+
+        call_command('procesar_imagenes', procesos=1, stdout=StringIO())
+
+        plato.refresh_from_db()
+        self.assertEqual(plato.imagen_variantes['origen'], plato.imagen.name)
+        self.assertTrue(plato.imagen.storage.exists(plato.imagen_variantes['webp'][0][1]))
+
+
+class SlugTests(BaseTestCase):
+
+    def crear(self, nombre, username):
+        dueño = User.objects.create(username=username)
+        return Restaurante.objects.create(dueño=dueño, nombre=nombre)
+
+    def test_slug_con_sufijo_siguiente_al_mayor(self):
+        self.assertEqual(self.crear('Pizzería Pepe', 'a').slug, 'pizzeria-pepe-1')
+        self.assertEqual(self.crear('Pizzería Pepe', 'b').slug, 'pizzeria-pepe-2')
+        # Otro restaurante cuyo nombre solo comparte el prefijo no cuenta
+        self.assertEqual(self.crear('Pizzería Pepe Centro', 'c').slug, 'pizzeria-pepe-centro')
+
+    def test_slug_se_elige_en_una_consulta(self):
+        for i in range(20):
+            self.crear('Pizzería Pepe', f'u{i}')
+        restaurante = Restaurante(nombre='Pizzería Pepe')
+        with self.assertNumQueries(1):
+            self.assertEqual(restaurante.siguiente_slug_libre(), 'pizzeria-pepe-21')
+
+    def test_reintenta_si_otro_registro_toma_el_slug(self):
+        self.crear('Sushi', 'a')
+        segundo = Restaurante(dueño=User.objects.create(username='b'), nombre='Sushi')
+        # Simula que el slug se eligió antes de que se guardara el primero
+        with mock.patch.object(Restaurante, 'siguiente_slug_libre', side_effect=['sushi', 'sushi-1']):
+            segundo.save()
+        self.assertEqual(segundo.slug, 'sushi-1')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEMPORAL, QR_TAREAS={'SINCRONO': True})
+class SlugConcurrenteTests(TransactionTestCase):
+
+    HILOS = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("SQLite en memoria compartida no espera los bloqueos entre hilos")
+
+    def test_registros_simultaneos_con_el_mismo_nombre(self):
+        dueños = [User.objects.create(username=f'dueño{i}') for i in range(self.HILOS)]
+        barrera = threading.Barrier(self.HILOS)
+        errores = []
+
+        def registrar(dueño):
+            try:
+                barrera.wait()
+                Restaurante.objects.create(dueño=dueño, nombre='La Parrilla')
+            except Exception as exc:
+                errores.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        hilos = [threading.Thread(target=registrar, args=(d,)) for d in dueños]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        slugs = sorted(Restaurante.objects.values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), self.HILOS)
+        self.assertIn('la-parrilla', slugs)
+
+
+class MenuJSONTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        cls.plato = Plato.objects.create(categoria=cls.categoria, nombre='Margarita', precio=Decimal('8.50'))
+        Plato.objects.create(categoria=cls.categoria, nombre='Agotada', precio=Decimal('9'), disponible=False)
+        cls.url = reverse('menu_json', args=[cls.restaurante.slug])
+
+    def test_devuelve_el_menu_compacto(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        datos = json.loads(response.content)
+        self.assertEqual(datos['restaurante']['slug'], self.restaurante.slug)
+        self.assertEqual(datos['categorias'][0]['nombre'], 'Pizzas')
+        self.assertEqual(
+            [(p['nombre'], p['precio']) for p in datos['categorias'][0]['platos']],
+            [('Margarita', '8.50')],
+        )
+        self.assertNotIn(b': ', response.content)
+
+    def test_respuesta_gzip_precomprimida(self):
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['categorias'][0]['nombre'], 'Pizzas')
+
+    def test_payload_en_cache_y_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.plato.nombre = 'Napolitana'
+        self.plato.save()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Napolitana')
+
+    def test_no_registra_visitas(self):
+        self.client.get(self.url)
+        self.assertFalse(Visit.objects.exists())
+
+
+class MenuEstaticoTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(MENU_ESTATICO={'DIRECTORIO': self.directorio, 'SINCRONO': True})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.html = Path(self.directorio) / 'restaurante' / self.restaurante.slug / 'index.html'
+
+    def test_cambiar_un_plato_vuelve_a_publicar_el_menu(self):
+        categoria = Categoria.objects.create(restaurante=self.restaurante, nombre='Pizzas')
+        with self.captureOnCommitCallbacks(execute=True):
+            Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+
+        contenido = self.html.read_text()
+        self.assertIn('Margarita', contenido)
+        self.assertIn('sendBeacon("/restaurante/pizzeria-pepe/visita/")', contenido)
+        self.assertNotIn('Cerrar Sesión', contenido)
+        self.assertEqual(gzip.decompress(self.html.with_name('index.html.gz').read_bytes()).decode(), contenido)
+
+    def test_procesar_imagenes_vuelve_a_publicar_el_menu(self):
+        categoria = Categoria.objects.create(restaurante=self.restaurante, nombre='Pizzas')
+        plato = Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'), imagen=imagen_jpeg())
+        Plato.objects.filter(pk=plato.pk).update(imagen_variantes={})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurante.save()
+        self.assertNotIn('/platos/variantes/', self.html.read_text())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('procesar_imagenes', procesos=1, stdout=StringIO())
+        self.assertIn('/platos/variantes/', self.html.read_text())
+
+    def test_desactivar_retira_el_menu(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurante.save()
+        self.assertTrue(self.html.exists())
+
+        self.restaurante.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurante.save()
+        self.assertFalse(self.html.parent.exists())
+
+    def test_publicar_menus_regenera_todo_y_borra_sobrantes(self):
+        sobrante = Path(self.directorio) / 'restaurante' / 'ya-no-existe'
+        sobrante.mkdir(parents=True)
+
+        call_command('publicar_menus', hilos=1, stdout=StringIO())
+
+        self.assertTrue(self.html.exists())
+        self.assertFalse(sobrante.exists())
+
+    def test_beacon_registra_la_visita(self):
+        response = self.client.post(reverse('visita_beacon', args=[self.restaurante.slug]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Visit.objects.get().restaurante, self.restaurante)
+        self.assertEqual(self.client.get(reverse('visita_beacon', args=[self.restaurante.slug])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('visita_beacon', args=['no-existe'])).status_code, 404)
+
+
+class GenerarDatosTests(BaseTestCase):
+    def test_genera_restaurantes_platos_y_visitas_con_su_resumen(self):
+        call_command('generar_datos', restaurantes=2, categorias=2, platos=3, visitas=50,
+                     prefijo='carga', stdout=StringIO())
+
+        self.assertEqual(Restaurante.objects.filter(slug__startswith='carga-').count(), 2)
+        self.assertEqual(Plato.objects.filter(categoria__restaurante__slug__startswith='carga-').count(), 12)
+        self.assertEqual(Visit.objects.count(), 50)
+        self.assertEqual(sum(VisitDailyStat.objects.values_list('visitas', flat=True)), 50)
+        self.assertTrue(self.client.login(username='carga-0', password='demo'))
+
+    def test_solo_recalcula_el_resumen_de_sus_restaurantes(self):
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=timezone.localdate(), tipo='menu', visitas=99)
+
+        call_command('generar_datos', restaurantes=2, categorias=1, platos=1, visitas=50,
+                     prefijo='carga', stdout=StringIO())
+
+        self.assertEqual(VisitDailyStat.objects.get(restaurante=self.restaurante).visitas, 99)
+        self.assertEqual(
+            VisitDailyStat.objects.filter(restaurante__slug__startswith='carga-').aggregate(Sum('visitas'))['visitas__sum'], 50)
+
+    def test_no_repite_un_prefijo_existente(self):
+        call_command('generar_datos', restaurantes=1, categorias=1, platos=1, visitas=0,
+                     prefijo='carga', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generar_datos', restaurantes=1, categorias=1, platos=1, visitas=0,
+                         prefijo='carga', stdout=StringIO())
+
+
+@override_settings(INSTRUMENTACION={'MUESTREO': 1.0})
+class InstrumentacionTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        vaciar_muestras()
+
+    def test_cabecera_server_timing_para_staff(self):
+        User.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard'))
+
+        cabecera = response['Server-Timing']
+        self.assertRegex(cabecera, r'db;dur=[\d.]+;desc="\d+ consultas"')
+        self.assertRegex(cabecera, r'tpl;dur=[\d.]+')
+        self.assertRegex(cabecera, r'total;dur=[\d.]+')
+        vista = resumen_por_vista()['vistas']['dashboard']
+        self.assertEqual(vista['peticiones'], 1)
+        self.assertGreater(vista['consultas_max'], 0)
+        self.assertGreater(vista['plantillas_ms_media'], 0)
+
+    def test_sin_server_timing_para_el_publico(self):
+        response = self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertNotIn('Server-Timing', response)
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotIn('Server-Timing', response)
+        # La muestra se guarda igual
+        self.assertEqual(set(resumen_por_vista()['vistas']), {'menu_publico', 'dashboard'})
+
+        # Con DEBUG también en las vistas públicas, que no tienen request.user
+        with override_settings(DEBUG=True):
+            response = self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertRegex(response['Server-Timing'], r'tpl;dur=[\d.]+')
+        self.assertGreater(resumen_por_vista()['vistas']['menu_publico']['plantillas_ms_media'], 0)
+
+    async def test_server_timing_para_staff_por_asgi(self):
+        await User.objects.filter(pk=self.usuario.pk).aupdate(is_staff=True)
+        await self.async_client.aforce_login(self.usuario)
+        # dashboard_eventos es async: login_required solo resuelve request.auser()
+        response = await self.async_client.get(reverse('dashboard_eventos'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('consultas', response['Server-Timing'])
+        await response.streaming_content.aclose()
+
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_plantillas_medidas_sin_parchear_django(self):
+        from django.template.backends.django import Template
+
+        self.assertFalse(hasattr(Template.render, 'medido'))
+        self.assertIsInstance(engines['django'].get_template('pages/index.html'), PlantillaMedida)
+
+    def test_muestreo_cero_no_mide(self):
+        with override_settings(INSTRUMENTACION={'MUESTREO': 0}):
+            response = self.client.get(reverse('home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(resumen_por_vista()['vistas'], {})
+
+    def test_avisa_al_pasar_el_presupuesto_de_consultas(self):
+        with override_settings(INSTRUMENTACION={'MUESTREO': 1.0, 'PRESUPUESTO_CONSULTAS': 0}), \
+                self.assertLogs('core.instrumentacion', 'WARNING') as logs:
+            self.client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+        self.assertIn('menu_publico hizo', logs.output[0])
+        self.assertEqual(resumen_por_vista()['vistas']['menu_publico']['sobre_presupuesto'], 1)
+
+    def test_resumen_solo_para_staff(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('rendimiento')).status_code, 302)
+
+        User.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+        self.client.get(reverse('home'))
+        datos = self.client.get(reverse('rendimiento')).json()
+        self.assertEqual(datos['presupuesto_consultas'], 20)
+        self.assertEqual(set(datos['vistas']['home']), {
+            'peticiones', 'p50_ms', 'p95_ms', 'p99_ms', 'consultas_media', 'consultas_max',
+            'sql_ms_media', 'plantillas_ms_media', 'sobre_presupuesto',
+        })
+
+
+class BaseDeDatosTests(BaseTestCase):
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "Pragmas de SQLite")
+    def test_pragmas_de_sqlite(self):
+        # La base de pruebas es un archivo (DATABASES['default']['TEST']), así
+        # que WAL y mmap se aplican igual que en producción
+        self.assertFalse(connection.is_in_memory_db())
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertEqual(cursor.execute('PRAGMA mmap_size').fetchone()[0], 134217728)
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+
+    def test_resumen_diario_agrupa_por_dia_local(self):
+        otro_plato = Plato.objects.create(
+            categoria=Categoria.objects.create(restaurante=self.restaurante, nombre='Postres'),
+            nombre='Flan', precio=Decimal('4'),
+        )
+        ayer = timezone.now() - timedelta(days=1)
+        Visit.objects.bulk_create([
+            Visit(restaurante=self.restaurante, tipo='menu'),
+            Visit(restaurante=self.restaurante, tipo='menu'),
+            Visit(restaurante=self.restaurante, tipo='menu', timestamp=ayer),
+            Visit(restaurante=self.restaurante, tipo='plato', plato=otro_plato),
+        ])
+
+        filas = {(f['fecha'], f['tipo'], f['plato_id']): f['visitas']
+                 for f in resumen_diario(Visit.objects.all())}
+        self.assertEqual(filas, {
+            (timezone.localdate(), 'menu', None): 2,
+            (timezone.localdate(ayer), 'menu', None): 1,
+            (timezone.localdate(), 'plato', otro_plato.id): 1,
+        })
+
+    def test_consultas_de_visitas_compilan_en_postgresql(self):
+        try:
+            import psycopg  # noqa: F401
+        except ImportError:
+            self.skipTest("psycopg no está instalado")
+        postgresql = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'menu_digital'},
+        })['default']
+
+        consultas = [
+            resumen_diario(Visit.objects.filter(timestamp__gte=inicio_del_dia(timezone.localdate()))),
+            VisitDailyStat.objects.values(dia=F('fecha')).annotate(total=Sum('visitas')).order_by('dia'),
+        ]
+        for consulta in consultas:
+            sql, _ = consulta.query.get_compiler(connection=postgresql).as_sql()
+            self.assertNotIn('django_datetime', sql)  # funciones registradas solo en SQLite
+        self.assertIn('AT TIME ZONE', consultas[0].query.get_compiler(connection=postgresql).as_sql()[0])
+
+
+class ArchivoVisitasTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def crear_visitas(self, dias_atras, cantidad):
+        momento = timezone.now() - timedelta(days=dias_atras)
+        visitas = [Visit(restaurante=self.restaurante, tipo='menu', timestamp=momento) for _ in range(cantidad)]
+        Visit.objects.bulk_create(visitas)
+        return visitas
+
+    def test_archiva_borra_y_conserva_el_resumen(self):
+        antiguas = self.crear_visitas(120, 3)
+        acumular_estadisticas(antiguas)
+        self.crear_visitas(200, 2)  # sin resumen: importadas a mano
+        recientes = self.crear_visitas(1, 4)
+
+        salida = StringIO()
+        call_command('archivar_visitas', dias=90, directorio=self.directorio, lote=2, stdout=salida)
+
+        self.assertEqual(Visit.objects.count(), len(recientes))
+        self.assertIn('5 visitas archivadas en 2 archivos', salida.getvalue())
+        filas = []
+        for ruta in sorted(Path(self.directorio).glob('visitas-*.csv.gz')):
+            with gzip.open(ruta, 'rt') as archivo:
+                filas += list(csv.DictReader(archivo))
+        self.assertEqual(len(filas), 5)
+        self.assertEqual({f['restaurante_id'] for f in filas}, {str(self.restaurante.id)})
+
+        por_dia = dict(VisitDailyStat.objects.values_list('fecha').annotate(Sum('visitas')))
+        self.assertEqual(por_dia[timezone.localdate(timezone.now() - timedelta(days=120))], 3)
+        self.assertEqual(por_dia[timezone.localdate(timezone.now() - timedelta(days=200))], 2)
+
+    def test_completa_el_resumen_restaurante_a_restaurante(self):
+        otro = Restaurante.objects.create(
+            dueño=User.objects.create_user(username='otro', password='clave-segura-123'), nombre='Otro')
+        fecha = timezone.localdate(timezone.now() - timedelta(days=120))
+        self.crear_visitas(120, 3)
+        # Más de lo que queda en bruto: incluye visitas ya archivadas
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=fecha, tipo='menu', visitas=5)
+        Visit.objects.bulk_create([
+            Visit(restaurante=otro, tipo='menu', timestamp=timezone.now() - timedelta(days=120)),
+            Visit(restaurante=otro, tipo='qr', timestamp=timezone.now() - timedelta(days=120)),
+        ])
+
+        call_command('archivar_visitas', dias=90, directorio=self.directorio, stdout=StringIO())
+
+        resumen = dict(((r, t), n) for r, t, n in VisitDailyStat.objects.filter(fecha=fecha).values_list(
+            'restaurante_id', 'tipo', 'visitas'))
+        self.assertEqual(resumen, {
+            (self.restaurante.id, 'menu'): 5,
+            (otro.id, 'menu'): 1,
+            (otro.id, 'qr'): 1,
+        })
+
+    def test_completa_sin_bajar_las_filas_de_un_dia_archivado_en_parte(self):
+        fecha = timezone.localdate(timezone.now() - timedelta(days=120))
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=fecha, tipo='menu', visitas=10)
+        self.crear_visitas(120, 3)
+        Visit.objects.create(restaurante=self.restaurante, tipo='qr', timestamp=timezone.now() - timedelta(days=120))
+
+        call_command('archivar_visitas', dias=90, directorio=self.directorio, stdout=StringIO())
+
+        self.assertEqual(dict(VisitDailyStat.objects.filter(fecha=fecha).values_list('tipo', 'visitas')),
+                         {'menu': 10, 'qr': 1})
+
+    def test_recalcular_no_borra_el_resumen_de_dias_archivados(self):
+        archivado = timezone.localdate() - timedelta(days=120)
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=archivado, tipo='menu', visitas=7)
+        self.crear_visitas(1, 2)
+
+        salida = StringIO()
+        call_command('recalcular_estadisticas', desde=archivado, stdout=salida)
+
+        self.assertIn('pueden estar archivados', salida.getvalue())
+        self.assertEqual(VisitDailyStat.objects.get(fecha=archivado).visitas, 7)
+        self.assertEqual(VisitDailyStat.objects.get(fecha=timezone.localdate() - timedelta(days=1)).visitas, 2)
+
+    def test_recalcular_respeta_un_archivado_con_menos_dias(self):
+        # archivar_visitas --dias 30: lo anterior a la visita más antigua solo está en el resumen
+        archivado = timezone.localdate() - timedelta(days=40)
+        VisitDailyStat.objects.create(restaurante=self.restaurante, fecha=archivado, tipo='menu', visitas=7)
+        self.crear_visitas(20, 2)
+
+        call_command('recalcular_estadisticas', stdout=StringIO())
+
+        self.assertEqual(VisitDailyStat.objects.get(fecha=archivado).visitas, 7)
+        self.assertEqual(VisitDailyStat.objects.exclude(fecha=archivado).get().visitas, 2)
+
+    def test_sin_visitas_antiguas_no_hace_nada(self):
+        self.crear_visitas(1, 2)
+        call_command('archivar_visitas', dias=90, directorio=self.directorio, stdout=StringIO())
+        self.assertEqual(Visit.objects.count(), 2)
+        self.assertEqual(list(Path(self.directorio).iterdir()), [])
+
+
+class VistasAsyncTests(BaseTestCase):
+
+    async def test_menu_publico_por_asgi(self):
+        with override_settings(DEBUG=True, INSTRUMENTACION={'MUESTREO': 1.0}):
+            response = await self.async_client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Pizzería Pepe')
+        self.assertIn('consultas', response['Server-Timing'])
+        self.assertEqual(await Visit.objects.acount(), 1)
+
+        condicional = await self.async_client.get(
+            reverse('menu_publico', args=[self.restaurante.slug]), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(condicional.status_code, 304)
+
+    def test_wsgi_usa_las_vistas_sincronas(self):
+        with mock.patch('core.via_publica.async_to_sync') as puente:
+            self.assertEqual(self.client.get(reverse('menu_publico', args=[self.restaurante.slug])).status_code, 200)
+            self.assertEqual(self.client.post(reverse('visita_beacon', args=[self.restaurante.slug])).status_code, 204)
+        puente.assert_not_called()
+        self.assertEqual(Visit.objects.count(), 2)
+
+    async def test_asgi_usa_las_vistas_async(self):
+        with mock.patch('core.via_publica.sync_to_async') as puente:
+            response = await self.async_client.get(reverse('menu_publico', args=[self.restaurante.slug]))
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.post(reverse('visita_beacon', args=[self.restaurante.slug]))
+            self.assertEqual(response.status_code, 204)
+        puente.assert_not_called()
+
+    async def test_beacon_por_asgi(self):
+        response = await self.async_client.post(reverse('visita_beacon', args=[self.restaurante.slug]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(await Visit.objects.acount(), 1)
+        response = await self.async_client.post(reverse('visita_beacon', args=['no-existe']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_vaciado_en_segundo_plano_sin_esperarlo(self):
+        with override_settings(VISITAS_BUFFER={'TAMANO': 1, 'SINCRONO': False}), \
+                mock.patch('core.visitas._vaciar_en_hilo') as vaciar:
+            await aregistrar_visita(self.restaurante.id)
+            vaciar.assert_not_called()
+            await asyncio.gather(*visitas._tareas)
+        vaciar.assert_called_once_with()
+
+
+class EventosDashboardTests(BaseTestCase):
+
+    def test_latido(self):
+        self.assertEqual(eventos.latido(), 15)
+        with override_settings(EVENTOS_DASHBOARD={'LATIDO': 3}):
+            self.assertEqual(eventos.latido(), 3)
+
+    async def test_publicar_reparte_entre_suscriptores(self):
+        with eventos.suscribir(self.restaurante.id) as una, eventos.suscribir(self.restaurante.id) as otra:
+            self.assertEqual(eventos.publicar(self.restaurante.id, {'visitas': 1}), 2)
+            self.assertEqual(eventos.publicar(self.restaurante.id + 1, {'visitas': 1}), 0)
+            self.assertEqual(await una.get(), {'visitas': 1})
+            self.assertEqual(await otra.get(), {'visitas': 1})
+        self.assertEqual(eventos.suscriptores(), 0)
+
+    @override_settings(EVENTOS_DASHBOARD={'MAX_PENDIENTES': 2})
+    async def test_cliente_lento_se_resincroniza(self):
+        with eventos.suscribir(self.restaurante.id) as cola:
+            for n in range(3):
+                eventos.publicar(self.restaurante.id, {'visitas': n})
+            await asyncio.sleep(0)
+            # El tercer aviso no cabe: se descartan los pendientes y se pide el estado
+            self.assertIs(await cola.get(), eventos.RESINCRONIZAR)
+            self.assertTrue(cola.empty())
+
+    async def test_flujo_con_las_visitas_nuevas(self):
+        categoria = await Categoria.objects.acreate(restaurante=self.restaurante, nombre='Pizzas')
+        plato = await Plato.objects.acreate(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+        await VisitDailyStat.objects.acreate(
+            restaurante=self.restaurante, fecha=timezone.localdate(), tipo='plato', plato=plato, visitas=3)
+        await self.async_client.aforce_login(self.usuario)
+
+        response = await self.async_client.get(reverse('dashboard_eventos'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        flujo = aiter(response.streaming_content)
+        estado = (await anext(flujo)).decode()
+        self.assertTrue(estado.startswith('event: estado\n'))
+        self.assertIn('"visitas_hoy": 3', estado)
+        self.assertIn('"Margarita"', estado)
+
+        # El vaciado del buffer publica el aviso
+        await aregistrar_visita(self.restaurante.id, tipo='plato', plato_id=plato.id)
+        aviso = (await anext(flujo)).decode()
+        self.assertTrue(aviso.startswith('event: visitas\n'))
+        datos = json.loads(aviso.split('data: ', 1)[1])
+        self.assertEqual(datos['visitas'], 1)
+        self.assertEqual(datos['platos'], {str(plato.id): {'nombre': 'Margarita', 'visitas': 1}})
+        # Al desconectarse el cliente, el servidor ASGI cancela la tarea que
+        # espera el siguiente aviso y se retira la suscripción
+        siguiente = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0)
+        siguiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await siguiente
+        self.assertEqual(eventos.suscriptores(), 0)
+
+    def test_con_wsgi_manda_el_estado_y_cierra(self):
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard_eventos'))
+        contenido = b''.join(response.streaming_content).decode()
+        self.assertIn('retry: 60000', contenido)
+        self.assertIn('event: estado', contenido)
+
+
+class ViaPublicaTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('menu_publico', args=[self.restaurante.slug])
+
+    @override_settings(VISITAS_BUFFER={'TAMANO': 100, 'SEGUNDOS': 3600})
+    def test_no_carga_la_sesion_ni_el_usuario(self):
+        anonima = self.client.get(self.url)
+        self.client.force_login(self.usuario)
+        cache.clear()
+        # Con cookie de sesión: solo restaurante, categorías y platos
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.content, anonima.content)
+        self.assertEqual(response['ETag'], anonima['ETag'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertNotIn('csrftoken', response.cookies)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotContains(response, 'Cerrar Sesión')
+
+    def test_las_demas_vistas_siguen_con_sesion(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertContains(self.client.get(reverse('home')), 'Cerrar Sesión')
+
+    def test_slug_inexistente(self):
+        response = self.client.get(reverse('menu_publico', args=['no-existe']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_vista_sincrona_por_asgi(self):
+        response = await self.async_client.get(reverse('menu_json', args=[self.restaurante.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['restaurante']['nombre'], 'Pizzería Pepe')
+
+
+class RestauranteActualTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sin_restaurante = User.objects.create_user(username='admin', password='clave-segura-123')
+
+    def test_usuario_sin_restaurante_ve_la_pagina_de_error(self):
+        self.client.force_login(self.sin_restaurante)
+        for nombre in ('perfil', 'dashboard'):
+            with self.subTest(vista=nombre):
+                response = self.client.get(reverse(nombre))
+                self.assertContains(response, 'No tienes un restaurante asociado.')
+        response = self.client.post(reverse('categoria_crear'), {'nombre': 'Postres'})
+        self.assertContains(response, 'No tienes un restaurante asociado.')
+        self.assertFalse(Categoria.objects.exists())
+        # Las vistas de un objeto solo encuentran los de su restaurante
+        categoria = Categoria.objects.create(restaurante=self.restaurante, nombre='Pizzas')
+        self.assertEqual(self.client.get(reverse('categoria_editar', args=[categoria.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('dashboard_eventos')).status_code, 404)
+
+    def test_sin_sesion_redirige_al_login(self):
+        response = self.client.get(reverse('perfil'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_el_restaurante_se_consulta_solo_si_se_usa(self):
+        self.client.force_login(self.usuario)
+        # Sesión y usuario: el formulario no necesita el restaurante
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('categoria_crear'))
+        with self.assertNumQueries(1):
+            self.assertEqual(response.wsgi_request.restaurante, self.restaurante)
+            self.assertEqual(response.wsgi_request.restaurante.id, self.restaurante.pk)
+        # Sesión, usuario y restaurante, una sola vez aunque lo usen la
+        # comprobación de restaurante_requerido y la vista
+        with self.assertNumQueries(3):
+            self.client.get(reverse('menu_importar'))
+
+    async def test_vistas_async(self):
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.get(reverse('dashboard_eventos'))
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.aclose()
+        self.assertEqual(await response.asgi_request.arestaurante(), self.restaurante)
+
+    def test_crear_o_borrar_el_restaurante(self):
+        self.client.force_login(self.sin_restaurante)
+        self.assertContains(self.client.get(reverse('dashboard')), 'No tienes un restaurante asociado.')
+
+        restaurante = Restaurante.objects.create(dueño=self.sin_restaurante, nombre='Bar Nuevo')
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, 'No tienes un restaurante asociado.')
+        self.assertEqual(response.wsgi_request.restaurante.id, restaurante.pk)
+
+        restaurante.delete()
+        self.assertContains(self.client.get(reverse('dashboard')), 'No tienes un restaurante asociado.')
+
+    def test_un_cambio_de_dueño_hecho_en_otro_proceso_se_ve_al_momento(self):
+        categoria = Categoria.objects.create(restaurante=self.restaurante, nombre='Pizzas')
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('categoria_editar', args=[categoria.pk])).status_code, 200)
+
+        # QuerySet.update() no envía señales: como si el cambio lo hubiera
+        # hecho otro worker, cuyas señales no llegan a este proceso
+        Restaurante.objects.filter(pk=self.restaurante.pk).update(dueño=self.sin_restaurante)
+
+        response = self.client.post(reverse('categoria_editar', args=[categoria.pk]), {'nombre': 'Robada'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Categoria.objects.get(pk=categoria.pk).nombre, 'Pizzas')
+        self.client.force_login(self.sin_restaurante)
+        self.assertEqual(self.client.get(reverse('categoria_editar', args=[categoria.pk])).status_code, 200)
+
+
+class AdminTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123'))
+
+    def crear_restaurantes(self, cantidad, visitas_por_restaurante=1):
+        inicio = Restaurante.objects.count()
+        usuarios = User.objects.bulk_create([User(username=f'dueño-{inicio + i}') for i in range(cantidad)])
+        restaurantes = [Restaurante.objects.create(dueño=u, nombre=f'Restaurante {u.pk}') for u in usuarios]
+        for restaurante in restaurantes:
+            categoria = Categoria.objects.create(restaurante=restaurante, nombre='Pizzas')
+            plato = Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+            Visit.objects.bulk_create([Visit(restaurante=restaurante, plato=plato)] * visitas_por_restaurante)
+        return restaurantes
+
+    def test_los_listados_no_dependen_del_tamaño(self):
+        urls = [reverse(f'admin:core_{modelo}_changelist') for modelo in ('restaurante', 'categoria', 'plato', 'visit')]
+        urls.append(reverse('admin:core_plato_changelist') + f'?categoria__restaurante__id__exact={self.restaurante.pk}')
+        urls.append(reverse('admin:core_visit_changelist') + f'?restaurante__id__exact={self.restaurante.pk}')
+        consultas = {}
+        for cantidad in (5, 50):
+            self.crear_restaurantes(cantidad, visitas_por_restaurante=3)
+            for url in urls:
+                with CaptureQueriesContext(connection) as capturadas:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                consultas.setdefault(url, set()).add(len(capturadas))
+        for url, numeros in consultas.items():
+            self.assertEqual(len(numeros), 1, f'{url}: {numeros}')
+
+    def test_filtro_por_restaurante_no_lista_todos(self):
+        self.crear_restaurantes(3)
+        response = self.client.get(reverse('admin:core_categoria_changelist'))
+        self.assertContains(response, 'data-model-name="categoria"')
+        self.assertNotContains(response, f'restaurante__id__exact={self.restaurante.pk}')
+
+        response = self.client.get(reverse('admin:core_categoria_changelist'), {'restaurante__id__exact': self.restaurante.pk})
+        self.assertContains(response, f'<option value="{self.restaurante.pk}" selected>Pizzería Pepe</option>')
+
+    def test_conteo_estimado_en_tablas_grandes(self):
+        self.crear_restaurantes(3)
+        url = reverse('admin:core_restaurante_changelist')
+        with mock.patch('core.admin.CONTEO_EXACTO_HASTA', 2):
+            with CaptureQueriesContext(connection) as capturadas:
+                self.client.get(url)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in capturadas.captured_queries))
+        with CaptureQueriesContext(connection) as capturadas:
+            self.client.get(url)
+        self.assertTrue(any('COUNT(' in q['sql'] for q in capturadas.captured_queries))
+
+    def test_visitas_paginadas_por_clave(self):
+        Visit.objects.bulk_create([Visit(restaurante=self.restaurante)] * 150)
+        url = reverse('admin:core_visit_changelist')
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(url)
+        self.assertFalse(any('COUNT(' in q['sql'] or 'OFFSET' in q['sql'] for q in capturadas.captured_queries))
+        ids = [v.pk for v in response.context['cl'].result_list]
+        self.assertEqual(len(ids), 100)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertContains(response, 'Unas 150 visits')
+
+        response = self.client.get(url + response.context['cl'].siguiente)
+        siguientes = [v.pk for v in response.context['cl'].result_list]
+        self.assertEqual(len(siguientes), 50)
+        self.assertLess(max(siguientes), min(ids))
+        self.assertIsNone(response.context['cl'].siguiente)
+        self.assertContains(response, 'Más recientes')
+
+    def test_estimacion_tras_archivar(self):
+        Visit.objects.bulk_create([Visit(restaurante=self.restaurante)] * 150)
+        # archivar_visitas borra las más antiguas, que son los ids más bajos
+        Visit.objects.filter(pk__in=Visit.objects.order_by('pk').values('pk')[:100]).delete()
+        self.assertEqual(filas_estimadas(Visit), 50)
+        self.assertContains(self.client.get(reverse('admin:core_visit_changelist')), 'Unas 50 visits')
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "sqlite_stat1 es propio de SQLite")
+    def test_estimacion_con_sqlite_stat1(self):
+        Visit.objects.bulk_create([Visit(restaurante=self.restaurante)] * 150)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_visit')
+        Visit.objects.filter(pk=Visit.objects.order_by('-pk').values('pk')[:1]).delete()
+        self.assertEqual(filas_estimadas(Visit), 150)
+
+    def test_jerarquia_de_fechas(self):
+        hace_400_dias = timezone.now() - timedelta(days=400)
+        Visit.objects.bulk_create([
+            Visit(restaurante=self.restaurante, timestamp=hace_400_dias),
+            Visit(restaurante=self.restaurante),
+        ])
+        url = reverse('admin:core_visit_changelist')
+        este_año = timezone.localdate().year
+        response = self.client.get(url)
+        años = [opcion['title'] for opcion in response.context['cl'].jerarquia_de_fechas()['choices']]
+        self.assertEqual(años, [str(a) for a in range(timezone.localtime(hace_400_dias).year, este_año + 1)])
+
+        response = self.client.get(url, {'timestamp__year': este_año})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        meses = response.context['cl'].jerarquia_de_fechas()['choices']
+        self.assertEqual(len(meses), 1)
+
+    def test_visitas_de_solo_lectura(self):
+        visita = Visit.objects.create(restaurante=self.restaurante)
+        self.assertEqual(self.client.get(reverse('admin:core_visit_add')).status_code, 403)
+        response = self.client.post(reverse('admin:core_visit_delete', args=[visita.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Visit.objects.filter(pk=visita.pk).exists())
+
+
+class ArranqueTests(TestCase):
+
+    def test_el_worker_no_importa_pillow_ni_qrcode(self):
+        proceso = subprocess.run(
+            [sys.executable, '-c', "import sys, menu_digital.wsgi; print('PIL' in sys.modules, 'qrcode' in sys.modules)"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        )
+        self.assertEqual(proceso.stdout.split(), ['False', 'False'])
+
+    def test_precargar_compila_todas_las_plantillas(self):
+        nombres = arranque.precargar()
+        self.assertIn('pages/dashboard.html', nombres)
+        self.assertIn('layout/publico.html', nombres)
+        cargador = engines['django'].engine.template_loaders[0]
+        self.assertIsInstance(cargador, CachedLoader)
+        self.assertTrue(set(nombres) <= set(cargador.get_template_cache))
+
+
+class ImportacionMenuTests(BaseTestCase):
+    CSV = (
+        "categoria,nombre,descripcion,precio,disponible\n"
+        "Pizzas,Margarita,Tomate y mozzarella,8.50,1\n"
+        "Pizzas,Cuatro quesos,,10,0\n"
+        "Postres,Tiramisú,Casero,4.5,\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def subir(self, contenido, nombre='menu.csv'):
+        archivo = SimpleUploadedFile(nombre, contenido.encode())
+        return self.client.post(reverse('menu_importar'), {'archivo': archivo})
+
+    def test_importa_csv_desde_el_dashboard(self):
+        version = self.restaurante.menu_actualizado
+        response = self.subir(self.CSV)
+
+        self.assertRedirects(response, reverse('dashboard'))
+        platos = Plato.objects.filter(categoria__restaurante=self.restaurante).order_by('id')
+        self.assertEqual(
+            [(p.categoria.nombre, p.nombre, p.precio, p.disponible) for p in platos],
+            [('Pizzas', 'Margarita', Decimal('8.50'), True), ('Pizzas', 'Cuatro quesos', Decimal('10'), False),
+             ('Postres', 'Tiramisú', Decimal('4.5'), True)],
+        )
+        self.restaurante.refresh_from_db()
+        self.assertGreater(self.restaurante.menu_actualizado, version)
+
+    def test_reimportar_actualiza_sin_duplicar(self):
+        self.subir(self.CSV)
+        self.subir("categoria,nombre,precio\nPizzas,Margarita,9\nPizzas,Diavola,11\n")
+
+        self.assertEqual(Categoria.objects.filter(restaurante=self.restaurante).count(), 2)
+        self.assertEqual(Plato.objects.filter(categoria__restaurante=self.restaurante).count(), 4)
+        self.assertEqual(Plato.objects.get(nombre='Margarita').precio, Decimal('9'))
+
+    def test_una_fila_invalida_no_guarda_nada(self):
+        response = self.subir(self.CSV + "Pizzas,Sin precio,,,1\nPizzas,Negativa,,abc,1\n")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Fila 4')
+        self.assertContains(response, 'Fila 5')
+        self.assertFalse(Plato.objects.exists())
+        self.assertFalse(Categoria.objects.exists())
+
+    def test_importa_json_lines_por_lotes_con_consultas_constantes(self):
+        lineas = ''.join(
+            json.dumps({'categoria': f'Categoría {n % 5}', 'nombre': f'Plato {n}', 'precio': '5'}) + '\n'
+            for n in range(300)
+        )
+        ruta = Path(MEDIA_TEMPORAL) / 'menu.jsonl'
+        ruta.write_text(lineas)
+
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('importar_menu', self.restaurante.slug, str(ruta), lote=100, stdout=StringIO())
+        self.assertEqual(Plato.objects.count(), 300)
+        self.assertLess(len(consultas), 25)
+
+    def test_exporta_y_vuelve_a_importar(self):
+        self.subir(self.CSV)
+        response = self.client.get(reverse('menu_exportar', args=['csv']))
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        contenido = b''.join(response.streaming_content).decode()
+        self.assertEqual(contenido.splitlines()[1], 'Pizzas,Margarita,Tomate y mozzarella,8.50,1')
+
+        Plato.objects.all().delete()
+        self.subir(contenido)
+        self.assertEqual(Plato.objects.count(), 3)
+
+        jsonl = b''.join(self.client.get(reverse('menu_exportar', args=['jsonl'])).streaming_content)
+        self.assertEqual(json.loads(jsonl.splitlines()[2])['nombre'], 'Tiramisú')
+        self.assertEqual(self.client.get(reverse('menu_exportar', args=['xlsx'])).status_code, 404)
+
+
+class BusquedaTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        pizzas = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        bebidas = Categoria.objects.create(restaurante=cls.restaurante, nombre='Bebidas')
+        Plato.objects.bulk_create([
+            Plato(categoria=pizzas, nombre='Margarita', descripcion='Tomate y albahaca', precio=Decimal('8.50')),
+            Plato(categoria=pizzas, nombre='Jamón y piña', descripcion='Hawaiana', precio=Decimal('12')),
+            Plato(categoria=bebidas, nombre='Café solo', precio=Decimal('1.50')),
+            Plato(categoria=bebidas, nombre='Café con leche', precio=Decimal('2'), disponible=False),
+        ])
+        otro = Restaurante.objects.create(dueño=User.objects.create(username='otro'), nombre='Otro')
+        Plato.objects.create(categoria=Categoria.objects.create(restaurante=otro, nombre='Cafés'),
+                             nombre='Café del otro', precio=Decimal('1'))
+
+    def buscar(self, **parametros):
+        response = self.client.get(reverse('buscar_platos', args=[self.restaurante.slug]), parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def nombres(self, datos):
+        return sorted(p['nombre'] for p in datos['resultados'])
+
+    def test_sin_acentos_por_prefijo_y_solo_del_restaurante(self):
+        self.assertEqual(self.nombres(self.buscar(q='cafe')), ['Café con leche', 'Café solo'])
+        self.assertEqual(self.nombres(self.buscar(q='JAMON pi')), ['Jamón y piña'])
+        self.assertEqual(self.nombres(self.buscar(q='marg')), ['Margarita'])
+        self.assertEqual(self.nombres(self.buscar(q='albahaca')), ['Margarita'])
+        self.assertEqual(self.buscar(q='')['resultados'], [])
+
+    def test_facetas_y_filtros(self):
+        datos = self.buscar(q='cafe', disponible='1')
+        self.assertEqual(self.nombres(datos), ['Café solo'])
+        self.assertEqual(datos['total'], 2)
+        self.assertEqual(datos['facetas']['disponible'], {'si': 1, 'no': 1})
+        self.assertEqual(datos['facetas']['precio'][0], {'desde': None, 'hasta': '5', 'platos': 2})
+
+        self.assertEqual(self.nombres(self.buscar(q='cafe', precio_min='1.75')), ['Café con leche'])
+        self.assertEqual(self.nombres(self.buscar(q='cafe', precio_max='1.6', precio_min='x')), ['Café solo'])
+
+    def test_el_indice_sigue_a_los_cambios(self):
+        plato = Plato.objects.get(nombre='Margarita')
+        plato.nombre = 'Napolitana'
+        plato.save()
+        self.assertEqual(self.nombres(self.buscar(q='marg')), [])
+        self.assertEqual(self.nombres(self.buscar(q='napo')), ['Napolitana'])
+
+        plato.delete()
+        self.assertEqual(self.nombres(self.buscar(q='napo')), [])
+
+    def test_la_categoria_cambia_de_restaurante(self):
+        otro = Restaurante.objects.get(nombre='Otro')
+        Categoria.objects.filter(restaurante=self.restaurante, nombre='Pizzas').update(restaurante=otro)
+        self.assertEqual(self.nombres(self.buscar(q='marg')), [])
+        datos = busqueda.buscar_platos(otro, 'marg')
+        self.assertEqual([p['nombre'] for p in datos['resultados']], ['Margarita'])
+
+    def test_dos_consultas_mas_la_del_restaurante(self):
+        busqueda.indice_disponible()  # se comprueba una vez por proceso
+        with self.assertNumQueries(3):
+            self.buscar(q='cafe')
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "FTS5 es propio de SQLite")
+    def test_usa_fts5(self):
+        self.assertTrue(busqueda.indice_disponible())
+        sql = str(busqueda.coincidencias(self.restaurante, 'cafe').query)
+        self.assertIn('core_plato_fts MATCH', sql)
+
+
+class AnaliticaTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        categoria = Categoria.objects.create(restaurante=cls.restaurante, nombre='Pizzas')
+        cls.margarita = Plato.objects.create(categoria=categoria, nombre='Margarita', precio=Decimal('8.50'))
+        cls.cuatro_quesos = Plato.objects.create(categoria=categoria, nombre='Cuatro quesos', precio=Decimal('9.50'))
+
+    def a_las(self, dias_atras, hora):
+        fecha = timezone.localdate() - timedelta(days=dias_atras)
+        return timezone.make_aware(datetime.combine(fecha, time(hora, 30)))
+
+    def crear_visitas(self):
+        hoy, hace_una_semana = self.a_las(0, 10), self.a_las(7, 10)
+        Visit.objects.bulk_create(
+            [Visit(restaurante=self.restaurante, tipo='menu', timestamp=hoy)] * 3
+            + [Visit(restaurante=self.restaurante, tipo='qr', timestamp=hoy)]
+            + [Visit(restaurante=self.restaurante, tipo='menu', timestamp=hace_una_semana)] * 2
+            + [Visit(restaurante=self.restaurante, tipo='plato', plato=self.margarita, timestamp=hoy)] * 2
+            + [Visit(restaurante=self.restaurante, tipo='plato', plato=self.cuatro_quesos, timestamp=hace_una_semana)]
+            # Fuera de la ventana de 4 semanas
+            + [Visit(restaurante=self.restaurante, tipo='menu', timestamp=self.a_las(40, 10))]
+        )
+
+    def test_columnas_con_segundos_desde_epoch(self):
+        momento = self.a_las(1, 15)
+        Visit.objects.create(restaurante=self.restaurante, tipo='plato', plato=self.margarita, timestamp=momento)
+        _, desde, hasta = analitica.ventana(4)
+        instantes, tipos, platos = analitica.columnas_de_visitas(self.restaurante.pk, desde, hasta)
+        self.assertEqual(list(instantes), [int(momento.timestamp())])
+        self.assertEqual(list(tipos), [analitica.CODIGOS_TIPO['plato']])
+        self.assertEqual(list(platos), [self.margarita.pk])
+
+    def test_informe(self):
+        self.crear_visitas()
+        datos = analitica.informe(self.restaurante)
+
+        self.assertEqual(datos['visitas'], 9)
+        dia = timezone.localdate().weekday()
+        # Hoy y hace una semana caen en la misma casilla: 3 + 1 + 2 llegadas
+        self.assertEqual(datos['mapa_de_calor'][dia][10], 6)
+        self.assertEqual(datos['maximo_por_hora'], 6)
+        self.assertEqual(sum(map(sum, datos['mapa_de_calor'])), 6)
+
+        self.assertEqual(datos['semana_a_semana']['menu'], {'actual': 3, 'anterior': 2, 'variacion': 50.0})
+        self.assertEqual(datos['semana_a_semana']['qr'], {'actual': 1, 'anterior': 0, 'variacion': None})
+
+        self.assertEqual(datos['visitas_menu'], 5)
+        margarita, cuatro_quesos = datos['conversion']
+        self.assertEqual(margarita, {
+            'plato_id': self.margarita.pk, 'nombre': 'Margarita', 'vistas': 2, 'conversion': 40.0,
+            'semana_actual': 2, 'semana_anterior': 0, 'variacion': None,
+        })
+        self.assertEqual((cuatro_quesos['semana_actual'], cuatro_quesos['semana_anterior']), (0, 1))
+        self.assertEqual(cuatro_quesos['variacion'], -100.0)
+
+    def test_informe_en_cache(self):
+        self.crear_visitas()
+        analitica.informe(self.restaurante)
+        with self.assertNumQueries(0):
+            datos = analitica.informe(self.restaurante)
+        self.assertEqual(datos['visitas'], 9)
+
+    @override_settings(TIME_ZONE='Europe/Madrid')
+    def test_horas_con_cambio_de_horario(self):
+        # El 29 de marzo de 2026 en Madrid se pasa de las 2:00 a las 3:00
+        inicios, hora_de_semana, _ = analitica.horas_de_la_ventana(date(2026, 3, 23), 1)
+        self.assertEqual(len(inicios), 7 * 24)
+        domingo = 6 * 24
+        self.assertEqual(inicios[domingo + 2], inicios[domingo + 3])
+        self.assertEqual(hora_de_semana[domingo + 3], domingo + 3)
+
+        tres_y_media = int(datetime(2026, 3, 29, 1, 30, tzinfo=dt_timezone.utc).timestamp())  # 3:30 en Madrid
+        por_hora, _ = analitica.contar(
+            array('q', [tres_y_media]), array('b', [analitica.CODIGOS_TIPO['menu']]), array('q', [0]),
+            inicios, [0] * len(inicios))
+        self.assertEqual(por_hora[(domingo + 3) * analitica.NUM_TIPOS + analitica.CODIGOS_TIPO['menu']], 1)
+
+    def test_fragmento_del_dashboard(self):
+        self.crear_visitas()
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('dashboard_analitica'))
+        self.assertContains(response, 'Conversión por plato')
+        self.assertContains(response, '40.0%')
+        self.assertContains(response, '+50.0%')
+        self.assertNotContains(response, '<html')
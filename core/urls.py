@@ -1,12 +1,15 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from .views import home, perfil, menu_publico, registro, dashboard, CategoriaCreateView, CategoriaUpdateView, CategoriaDeleteView, PlatoCreateView, CustomLoginView, PlatoUpdateView, PlatoDeleteView
+from .views import home, perfil, menu_publico, menu_json, buscar_platos, visita_beacon, rendimiento, menu_importar, menu_exportar, registro, dashboard, dashboard_estadisticas, dashboard_analitica, dashboard_categorias, dashboard_eventos, CategoriaCreateView, CategoriaUpdateView, CategoriaDeleteView, PlatoCreateView, CustomLoginView, PlatoUpdateView, PlatoDeleteView
 
 urlpatterns = [
     # Rutas Públicas
     path('', home, name='home'),
     path('perfil/', perfil, name='perfil'),
     path('restaurante/<slug:slug>/', menu_publico, name='menu_publico'),
+    path('restaurante/<slug:slug>/visita/', visita_beacon, name='visita_beacon'),
+    path('api/restaurante/<slug:slug>/menu.json', menu_json, name='menu_json'),
+    path('api/restaurante/<slug:slug>/buscar/', buscar_platos, name='buscar_platos'),
 
 
     # Rutas de Autenticación
@@ -17,6 +20,12 @@ urlpatterns = [
     
     # Rutas Privadas
     path('dashboard/', dashboard, name='dashboard'),
+    path('dashboard/estadisticas/', dashboard_estadisticas, name='dashboard_estadisticas'),
+    path('dashboard/analitica/', dashboard_analitica, name='dashboard_analitica'),
+    path('dashboard/categorias/', dashboard_categorias, name='dashboard_categorias'),
+    path('dashboard/eventos/', dashboard_eventos, name='dashboard_eventos'),
+    path('menu/importar/', menu_importar, name='menu_importar'),
+    path('menu/exportar.<str:formato>', menu_exportar, name='menu_exportar'),
     path('categorias/nueva/', CategoriaCreateView.as_view(), name='categoria_crear'),
     path('categorias/<int:pk>/editar/', CategoriaUpdateView.as_view(), name='categoria_editar'),
     path('categorias/<int:pk>/eliminar/', CategoriaDeleteView.as_view(), name='categoria_eliminar'),
@@ -25,4 +34,7 @@ urlpatterns = [
     path('categoria/<int:categoria_id>/platos/nuevo/', PlatoCreateView.as_view(), name='plato_crear'),
     path('platos/<int:pk>/editar/', PlatoUpdateView.as_view(), name='plato_editar'),
     path('platos/<int:pk>/eliminar/', PlatoDeleteView.as_view(), name='plato_eliminar'),    
+
+    # Métricas internas (solo staff)
+    path('rendimiento/', rendimiento, name='rendimiento'),
 ]
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Vía rápida para las vistas públicas y anónimas (menú público, beacon, APIs).
+
+Cada escaneo del QR pasaba por todo ``MIDDLEWARE``: cargar la sesión (una
+consulta si el navegador trae cookie), buscar al usuario (otra), preparar los
+mensajes y comprobar el CSRF, para una página que es igual para todos.
+
+Las vistas marcadas con ``@via_publica`` las llama directamente
+``ViaPublicaMiddleware``, que va antes de ``SessionMiddleware`` en
+``MIDDLEWARE``; el resto de la pila no llega a ejecutarse. Por eso estas
+vistas no pueden usar ``request.user``, ``request.session`` ni mensajes, no
+tienen protección CSRF y sus plantillas extienden ``layout/publico.html``,
+que no incluye la barra de navegación ni los mensajes.
+
+Una vista pública puede tener dos implementaciones: la síncrona, que es la
+que está en ``urls.py``, y una async (``@via_publica(asincrona=...)``). El
+middleware llama a la async bajo ASGI y a la síncrona bajo WSGI, así ninguno
+de los dos servidores paga ``async_to_sync``/``sync_to_async`` por petición.
+"""
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+
+
+def via_publica(vista=None, *, asincrona=None):
+    """Marca ``vista`` para servirla sin sesión, autenticación, mensajes ni CSRF.
+
+    ``asincrona`` es la misma vista escrita como corrutina, para ASGI.
+    """
+    def marcar(vista):
+        vista.via_publica = True
+        if asincrona is not None:
+            vista.asincrona = asincrona
+        return vista
+    return marcar if vista is None else marcar(vista)
+
+
+def _vista_publica(request):
+    try:
+        coincidencia = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if not getattr(coincidencia.func, 'via_publica', False):
+        return None
+    request.resolver_match = coincidencia
+    return coincidencia
+
+
+@sync_and_async_middleware
+def ViaPublicaMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            coincidencia = _vista_publica(request)
+            if coincidencia is None:
+                return await get_response(request)
+            vista = getattr(coincidencia.func, 'asincrona', coincidencia.func)
+            if not iscoroutinefunction(vista):
+                vista = sync_to_async(vista)
+            return await vista(request, *coincidencia.args, **coincidencia.kwargs)
+    else:
+        def middleware(request):
+            coincidencia = _vista_publica(request)
+            if coincidencia is None:
+                return get_response(request)
+            vista = coincidencia.func
+            if iscoroutinefunction(vista):
+                vista = async_to_sync(vista)
+            return vista(request, *coincidencia.args, **coincidencia.kwargs)
+    return middleware
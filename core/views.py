@@ -1,14 +1,26 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.contrib.auth import login
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
-from django.core.paginator import Paginator
 from django.contrib import messages
-from django.db.models import Count
-from datetime import datetime, timedelta
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from decimal import Decimal, InvalidOperation
+from functools import partial
 
 from .forms import (
     CustomUserCreationForm,
@@ -18,7 +30,20 @@ from .forms import (
     CustomAuthenticationForm,
     CustomUserProfileForm
 )
-from .models import Restaurante, Categoria, Plato, Visit
+from .models import TIPOS_VISITA, Restaurante, Categoria, Plato, Visit
+from .menu import cargar_menu, elegir_codificacion, payload_menu
+from .cache_menu import etag_menu, segundos_cache_menu, version_menu
+from . import analitica
+from . import busqueda
+from . import dashboard as dashboard_datos
+from . import eventos
+from .imagenes import fuentes_de_imagen
+from .importacion import COLUMNAS, FORMATOS, ErrorImportacion, exportar_menu, formato_de, importar_menu, leer_filas
+from .instrumentacion import resumen_por_vista
+from .restaurante_actual import RestauranteRequeridoMixin, restaurante_requerido, sin_restaurante
+from .tareas_qr import encolar_qr
+from .via_publica import via_publica
+from .visitas import aregistrar_visita, registrar_visita
 
 # --- Vistas Públicas ---
 
@@ -28,19 +53,121 @@ def home(request):
 def handler404(request, exception):
     return render(request, 'pages/error.html', status=404)
 
+def _contexto_menu_publico(restaurante):
+    # Sin request: la página es igual para todos y no hace falta ningún
+    # context processor (ver core/via_publica.py)
+    return {
+        'restaurante': restaurante,
+        # La plantilla llama a cargar_menu solo si el fragmento no está en caché
+        'categorias': partial(cargar_menu, restaurante),
+        'cache_segundos': segundos_cache_menu(),
+        'version_menu': version_menu(restaurante),
+    }
+
+def _menu_no_modificado(request, restaurante):
+    """304 si el cliente ya tiene esta versión del menú, si no ``None``."""
+    return get_conditional_response(
+        request, etag=etag_menu(restaurante), last_modified=int(restaurante.menu_actualizado.timestamp()))
+
+def _cabeceras_menu(response, restaurante):
+    response.headers['ETag'] = etag_menu(restaurante)
+    response.headers['Last-Modified'] = http_date(int(restaurante.menu_actualizado.timestamp()))
+    # Se puede guardar (también en una CDN) pero hay que revalidarla siempre
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+async def amenu_publico(request, slug):
+    """``menu_publico`` para ASGI."""
+    restaurante = await aget_object_or_404(Restaurante, slug=slug)
+    await aregistrar_visita(restaurante.id, tipo='menu')
+    response = _menu_no_modificado(request, restaurante)
+    if response is None:
+        # El render sigue siendo síncrono porque cargar_menu consulta la base de datos
+        html = await sync_to_async(render_to_string)('components/menu_publico.html', _contexto_menu_publico(restaurante))
+        response = HttpResponse(html)
+    return _cabeceras_menu(response, restaurante)
+
+@via_publica(asincrona=amenu_publico)
 def menu_publico(request, slug):
     restaurante = get_object_or_404(Restaurante, slug=slug)
-    categorias = restaurante.categorias.prefetch_related('platos').all()
-    # Registra visita cuando se accede al menú público
-    Visit.objects.create(restaurante=restaurante, tipo='menu')
-    return render(request, 'components/menu_publico.html', {
-        'restaurante': restaurante,
-        'categorias': categorias
-    })
+    # Registra visita cuando se accede al menú público (se guarda por lotes)
+    registrar_visita(restaurante.id, tipo='menu')
+    response = _menu_no_modificado(request, restaurante)
+    if response is None:
+        response = HttpResponse(render_to_string('components/menu_publico.html', _contexto_menu_publico(restaurante)))
+    return _cabeceras_menu(response, restaurante)
+
+@csrf_exempt
+@require_POST
+async def avisita_beacon(request, slug):
+    """``visita_beacon`` para ASGI."""
+    restaurante_id = await Restaurante.objects.filter(slug=slug).values_list('id', flat=True).afirst()
+    if restaurante_id is None:
+        raise Http404
+    await aregistrar_visita(restaurante_id, tipo='menu')
+    return HttpResponse(status=204)
+
+@via_publica(asincrona=avisita_beacon)
+@csrf_exempt
+@require_POST
+def visita_beacon(request, slug):
+    """Registra la visita de un menú servido como HTML estático (ver core/publicacion.py)."""
+    restaurante_id = Restaurante.objects.filter(slug=slug).values_list('id', flat=True).first()
+    if restaurante_id is None:
+        raise Http404
+    registrar_visita(restaurante_id, tipo='menu')
+    return HttpResponse(status=204)
+
+@via_publica
+def menu_json(request, slug):
+    """Menú público en JSON para kioscos y apps; no registra visitas."""
+    restaurante = get_object_or_404(Restaurante, slug=slug)
+    etag = f'W/"json-{restaurante.pk}-{version_menu(restaurante)}"'
+    ultima_modificacion = int(restaurante.menu_actualizado.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        payload = payload_menu(restaurante)
+        codificacion = elegir_codificacion(request.headers.get('Accept-Encoding', ''), payload)
+        response = HttpResponse(payload[codificacion], content_type='application/json')
+        if codificacion != 'identity':
+            response.headers['Content-Encoding'] = codificacion
+        response.headers['Content-Length'] = len(payload[codificacion])
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(ultima_modificacion)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+@via_publica
+def buscar_platos(request, slug):
+    """Búsqueda de platos con facetas de precio y disponibilidad (ver core/busqueda.py)."""
+    restaurante = get_object_or_404(Restaurante, slug=slug)
+    disponible = {'1': True, '0': False}.get(request.GET.get('disponible'))
+    response = JsonResponse(busqueda.buscar_platos(
+        restaurante,
+        request.GET.get('q', ''),
+        precio_min=_decimal_o_none(request.GET.get('precio_min')),
+        precio_max=_decimal_o_none(request.GET.get('precio_max')),
+        disponible=disponible,
+    ))
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+def _decimal_o_none(valor):
+    try:
+        return Decimal(valor) if valor else None
+    except InvalidOperation:
+        return None
 
-@login_required
+@staff_member_required
+def rendimiento(request):
+    """Percentiles por vista de las peticiones medidas por este proceso."""
+    return JsonResponse(resumen_por_vista(), json_dumps_params={'indent': 2})
+
+@restaurante_requerido
 def perfil(request):
-    restaurante = request.user.restaurante
+    restaurante = request.restaurante
     user_form = CustomUserProfileForm(request.POST or None, instance=request.user)
     rest_form = RestauranteForm(request.POST or None, request.FILES or None, instance=restaurante)
 
@@ -56,12 +183,10 @@ def perfil(request):
         'restaurante': restaurante
     })
 
-@login_required
+@restaurante_requerido
 def regenerar_qr(request):
-    restaurante = request.user.restaurante
-    restaurante.generar_qr()
-    restaurante.save()
-    messages.success(request, "Código QR regenerado correctamente.")
+    encolar_qr(request.restaurante)
+    messages.success(request, "El código QR se está regenerando.")
     return redirect('dashboard')
 
 # --- Vistas de Autenticación ---
@@ -102,63 +227,144 @@ class CustomLoginView(LoginView):
 
 # --- Vistas Privadas (Dashboard) ---
 
-@login_required
-def dashboard(request):
-    try:
-        restaurante = request.user.restaurante
-    except Restaurante.DoesNotExist:
-        return render(request, 'pages/error.html', {
-            'message': 'No tienes un restaurante asociado.'
-        })
-
-    categorias = restaurante.categorias.all().order_by('nombre')
-    paginator = Paginator(categorias, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    hoy = datetime.now().date()
-    hace_14 = hoy - timedelta(days=13)
-
-    # Estadísticas principales
-    visitas_hoy = restaurante.visitas.filter(timestamp__date=hoy).count()
-    visitas_ultimas_2semanas = restaurante.visitas.filter(timestamp__date__gte=hace_14).count()
-
-    # Para gráfico: visitas agrupadas por día en últimos 14 días
-    stats_dias = restaurante.visitas.filter(timestamp__date__gte=hace_14).extra(
-        {'dia': "date(timestamp)"}
-    ).values('dia').annotate(total=Count('id')).order_by('dia')
-
-    # Platos más vistos
-    top_platos = (restaurante.visitas
-        .filter(plato__isnull=False)
-        .values('plato__nombre')
-        .annotate(veces=Count('id'))
-        .order_by('-veces')[:5])
-
-    context = {
+def _contexto_dashboard(request, restaurante):
+    pagina = dashboard_datos.numero_de_pagina(request.GET.get('page'))
+    # Las plantillas llaman a estas funciones solo si su fragmento no está en caché
+    return {
         'restaurante': restaurante,
-        'page_obj': page_obj,
-        'visitas_hoy': visitas_hoy,
-        'visitas_ultimas_2semanas': visitas_ultimas_2semanas,
-        'stats_dias': list(stats_dias),
-        'top_platos': top_platos,
+        'logo': fuentes_de_imagen(restaurante.logo, restaurante.logo_variantes),
+        'hoy': timezone.localdate(),
+        'estadisticas': partial(dashboard_datos.estadisticas, restaurante),
+        'segundos_estadisticas': dashboard_datos.segundos_cache_estadisticas(),
+        'pagina': pagina,
+        'categorias': partial(dashboard_datos.pagina_de_categorias, restaurante, pagina),
+        'cache_segundos': segundos_cache_menu(),
+        'version_menu': version_menu(restaurante),
     }
-    return render(request, 'pages/dashboard.html', context)
+
+@restaurante_requerido
+def dashboard(request):
+    return render(request, 'pages/dashboard.html', _contexto_dashboard(request, request.restaurante))
+
+@restaurante_requerido
+def dashboard_estadisticas(request):
+    """Fragmento de estadísticas del dashboard, para refrescarlo sin recargar."""
+    return render(request, 'components/dashboard_estadisticas.html',
+                  _contexto_dashboard(request, request.restaurante))
+
+@restaurante_requerido
+def dashboard_analitica(request):
+    """Fragmento con el mapa de calor, la semana frente a la anterior y la conversión por plato."""
+    datos = analitica.informe(request.restaurante)
+    return render(request, 'components/dashboard_analitica.html', {
+        'analitica': datos,
+        'mapa': zip(analitica.DIAS_SEMANA, datos['mapa_de_calor']),
+        'por_tipo': [(etiqueta, datos['semana_a_semana'][tipo]) for tipo, etiqueta in TIPOS_VISITA],
+    })
+
+@restaurante_requerido
+def dashboard_categorias(request):
+    """Fragmento con una página de categorías del dashboard (``?page=``)."""
+    return render(request, 'components/dashboard_categorias.html',
+                  _contexto_dashboard(request, request.restaurante))
+
+def _evento_sse(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n"
+
+@login_required
+async def dashboard_eventos(request):
+    """Contadores del dashboard en vivo (Server-Sent Events, ver core/eventos.py).
+
+    Manda el estado completo al conectarse y después lo que suma cada lote de
+    visitas, con un comentario de latido para que los proxies no corten la
+    conexión. Con WSGI una respuesta infinita ocuparía un hilo para siempre,
+    así que solo se manda el estado y el navegador vuelve a pedirlo pasado
+    ``retry`` (como un refresco periódico).
+    """
+    restaurante = await request.arestaurante()
+    if restaurante is None:
+        raise Http404
+    segundos_latido = eventos.latido()
+
+    async def flujo():
+        with eventos.suscribir(restaurante.id) as cola:
+            aviso = eventos.RESINCRONIZAR
+            while True:
+                if aviso is eventos.RESINCRONIZAR:
+                    estado = await sync_to_async(dashboard_datos.contadores)(restaurante)
+                    yield _evento_sse('estado', estado)
+                elif aviso is None:
+                    yield ': latido\n\n'
+                else:
+                    yield _evento_sse('visitas', aviso)
+                try:
+                    aviso = await asyncio.wait_for(cola.get(), timeout=segundos_latido)
+                except asyncio.TimeoutError:
+                    aviso = None
+
+    if isinstance(request, ASGIRequest):
+        contenido = flujo()
+    else:
+        estado = await sync_to_async(dashboard_datos.contadores)(restaurante)
+        segundos = dashboard_datos.segundos_cache_estadisticas()
+        contenido = [f"retry: {segundos * 1000}\n", _evento_sse('estado', estado)]
+    response = StreamingHttpResponse(contenido, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # que nginx no acumule el flujo
+    return response
+
+# --- Importación y exportación del menú ---
+
+@restaurante_requerido
+def menu_importar(request):
+    restaurante = request.restaurante
+    errores = []
+    if request.method == 'POST' and request.FILES.get('archivo'):
+        archivo = request.FILES['archivo']
+        try:
+            filas = leer_filas(archivo.file, formato_de(archivo.name))
+            resumen = importar_menu(restaurante, filas)
+        except ErrorImportacion as exc:
+            errores = exc.errores
+        else:
+            messages.success(request, (
+                f"Menú importado: {resumen['platos_creados']} platos nuevos, "
+                f"{resumen['platos_actualizados']} actualizados y "
+                f"{resumen['categorias_creadas']} categorías nuevas."
+            ))
+            return redirect('dashboard')
+    elif request.method == 'POST':
+        errores = ['Selecciona un archivo.']
+    return render(request, 'pages/menu_importar.html', {'errores': errores, 'columnas': COLUMNAS})
+
+@restaurante_requerido
+def menu_exportar(request, formato):
+    if formato not in FORMATOS:
+        raise Http404
+    restaurante = request.restaurante
+    response = StreamingHttpResponse(
+        exportar_menu(restaurante, formato),
+        content_type='text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson',
+    )
+    response['Content-Disposition'] = f'attachment; filename="menu-{restaurante.slug}.{formato}"'
+    return response
 
 # --- Categorías ---
 
-class CategoriaCreateView(LoginRequiredMixin, CreateView):
+class CategoriaCreateView(RestauranteRequeridoMixin, CreateView):
     model = Categoria
     form_class = CategoriaForm
     template_name = 'pages/categoria_form.html'
     success_url = reverse_lazy('dashboard')
 
     def form_valid(self, form):
-        form.instance.restaurante = self.request.user.restaurante
+        if not self.request.restaurante:
+            return sin_restaurante(self.request)
+        form.instance.restaurante_id = self.request.restaurante.id
         messages.success(self.request, 'Categoría creada correctamente.')
         return super().form_valid(form)
 
-class CategoriaUpdateView(LoginRequiredMixin, UpdateView):
+class CategoriaUpdateView(RestauranteRequeridoMixin, UpdateView):
     model = Categoria
     form_class = CategoriaForm
     template_name = 'pages/categoria_form.html'
@@ -169,9 +375,9 @@ class CategoriaUpdateView(LoginRequiredMixin, UpdateView):
         return super().form_valid(form)
 
     def get_queryset(self):
-        return Categoria.objects.filter(restaurante=self.request.user.restaurante)
+        return Categoria.objects.filter(restaurante__dueño_id=self.request.user.id)
 
-class CategoriaDeleteView(LoginRequiredMixin, DeleteView):
+class CategoriaDeleteView(RestauranteRequeridoMixin, DeleteView):
     model = Categoria
     template_name = 'pages/categoria_confirm_delete.html'
     success_url = reverse_lazy('dashboard')
@@ -181,11 +387,11 @@ class CategoriaDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Categoria.objects.filter(restaurante=self.request.user.restaurante)
+        return Categoria.objects.filter(restaurante__dueño_id=self.request.user.id)
 
 # --- Platos ---
 
-class PlatoCreateView(LoginRequiredMixin, CreateView):
+class PlatoCreateView(RestauranteRequeridoMixin, CreateView):
     model = Plato
     form_class = PlatoForm
     template_name = 'pages/plato_form.html'
@@ -194,7 +400,7 @@ class PlatoCreateView(LoginRequiredMixin, CreateView):
         categoria = get_object_or_404(
             Categoria,
             id=self.kwargs['categoria_id'],
-            restaurante=self.request.user.restaurante
+            restaurante__dueño_id=self.request.user.id
         )
         form.instance.categoria = categoria
         messages.success(self.request, 'Plato agregado correctamente.')
@@ -203,7 +409,7 @@ class PlatoCreateView(LoginRequiredMixin, CreateView):
     def get_success_url(self):
         return reverse_lazy('dashboard')
 
-class PlatoUpdateView(LoginRequiredMixin, UpdateView):
+class PlatoUpdateView(RestauranteRequeridoMixin, UpdateView):
     model = Plato
     form_class = PlatoForm
     template_name = 'pages/plato_form.html'
@@ -214,9 +420,9 @@ class PlatoUpdateView(LoginRequiredMixin, UpdateView):
         return super().form_valid(form)
 
     def get_queryset(self):
-        return Plato.objects.filter(categoria__restaurante=self.request.user.restaurante)
+        return Plato.objects.filter(categoria__restaurante__dueño_id=self.request.user.id)
 
-class PlatoDeleteView(LoginRequiredMixin, DeleteView):
+class PlatoDeleteView(RestauranteRequeridoMixin, DeleteView):
     model = Plato
     template_name = 'pages/plato_confirm_delete.html'
     success_url = reverse_lazy('dashboard')
@@ -226,4 +432,4 @@ class PlatoDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Plato.objects.filter(categoria__restaurante=self.request.user.restaurante)
+        return Plato.objects.filter(categoria__restaurante__dueño_id=self.request.user.id)
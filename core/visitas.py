@@ -0,0 +1,290 @@
+"""
+Registro de visitas por lotes.
+
+El menú público no escribe en la base de datos en cada escaneo: las visitas se
+acumulan en memoria y se guardan con ``bulk_create`` cuando el buffer llega a
+``VISITAS_BUFFER['TAMANO']`` elementos o cuando pasan
+``VISITAS_BUFFER['SEGUNDOS']`` segundos. El vaciado siempre se hace en un hilo
+en segundo plano, nunca en la petición del cliente, y si la base de datos
+falla el lote vuelve al buffer para el siguiente intento. Para que una caída
+larga no agote la memoria del worker, el buffer no pasa de
+``VISITAS_BUFFER['MAXIMO']`` visitas: las más antiguas se descartan (y se
+registra cuántas). Con
+``VISITAS_BUFFER['SINCRONO'] = True`` cada visita se guarda al momento, que es
+lo que usan las pruebas.
+
+Cada lote también suma sus visitas a ``VisitDailyStat``, el resumen diario que
+lee el dashboard, y se publica en core/eventos.py para los dashboards abiertos.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, time as hora
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import eventos
+
+CONFIG_POR_DEFECTO = {
+    'TAMANO': 100,
+    'SEGUNDOS': 5,
+    'SINCRONO': False,
+    'MAXIMO': 10_000,
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pendientes = []
+_ultimo_vaciado = time.monotonic()
+_hilo = None
+_hilo_lote = None
+_tareas = set()
+
+
+def _config():
+    config = dict(CONFIG_POR_DEFECTO)
+    config.update(getattr(settings, 'VISITAS_BUFFER', {}))
+    return config
+
+
+def registrar_visita(restaurante_id, tipo='menu', plato_id=None):
+    """Encola una visita; se guarda en el próximo vaciado del buffer.
+
+    Si toca vaciar el buffer, el vaciado se lanza en un hilo aparte y la
+    respuesta no lo espera (salvo con ``SINCRONO``).
+    """
+    config = _config()
+    if config['SINCRONO']:
+        _encolar(restaurante_id, tipo, plato_id, config)
+        vaciar_visitas()
+    elif _encolar(restaurante_id, tipo, plato_id, config):
+        _vaciar_en_segundo_plano()
+    else:
+        _iniciar_hilo(config['SEGUNDOS'])
+
+
+async def aregistrar_visita(restaurante_id, tipo='menu', plato_id=None):
+    """Como ``registrar_visita``, para vistas async.
+
+    Si toca vaciar el buffer, el vaciado se lanza en un hilo aparte y la
+    respuesta no lo espera (salvo con ``SINCRONO``).
+    """
+    config = _config()
+    if config['SINCRONO']:
+        _encolar(restaurante_id, tipo, plato_id, config)
+        await sync_to_async(vaciar_visitas)()
+    elif _encolar(restaurante_id, tipo, plato_id, config):
+        tarea = asyncio.create_task(sync_to_async(_vaciar_en_hilo, thread_sensitive=False)())
+        # El event loop solo guarda referencias débiles a las tareas
+        _tareas.add(tarea)
+        tarea.add_done_callback(_tareas.discard)
+    else:
+        _iniciar_hilo(config['SEGUNDOS'])
+
+
+def _encolar(restaurante_id, tipo, plato_id, config):
+    """Añade la visita al buffer; devuelve si ya toca vaciarlo."""
+    from .models import Visit
+
+    visita = Visit(
+        restaurante_id=restaurante_id,
+        plato_id=plato_id,
+        tipo=tipo,
+        timestamp=timezone.now(),
+    )
+    with _lock:
+        _pendientes.append(visita)
+        descartadas = _recortar(config['MAXIMO'])
+        lleno = len(_pendientes) >= config['TAMANO']
+        vencido = time.monotonic() - _ultimo_vaciado >= config['SEGUNDOS']
+    _avisar_descartadas(descartadas)
+    return lleno or vencido
+
+
+def _recortar(maximo):
+    """Descarta las visitas más antiguas que pasen de ``maximo`` (con ``_lock`` tomado)."""
+    sobran = len(_pendientes) - maximo
+    if sobran <= 0:
+        return 0
+    del _pendientes[:sobran]
+    return sobran
+
+
+def _avisar_descartadas(descartadas):
+    if descartadas:
+        logger.error("Buffer de visitas lleno: descartadas las %d visitas más antiguas", descartadas)
+
+
+def vaciar_visitas():
+    """Guarda en la base de datos todas las visitas pendientes.
+
+    Devuelve el número de visitas escritas. Si la escritura falla, las
+    visitas vuelven al buffer y se relanza la excepción.
+    """
+    global _ultimo_vaciado
+    from .models import Plato, Restaurante, Visit
+
+    with _lock:
+        lote = list(_pendientes)
+        _pendientes.clear()
+        _ultimo_vaciado = time.monotonic()
+    if not lote:
+        return 0
+
+    try:
+        # Descarta visitas de restaurantes eliminados mientras estaban en el buffer
+        existentes = set(
+            Restaurante.objects
+            .filter(id__in={v.restaurante_id for v in lote})
+            .values_list('id', flat=True)
+        )
+        lote = [v for v in lote if v.restaurante_id in existentes]
+        platos = {v.plato_id for v in lote if v.plato_id is not None}
+        nombres_platos = {}
+        if platos:
+            nombres_platos = dict(
+                Plato.objects.filter(id__in=platos).values_list('id', 'nombre')
+            )
+            for visita in lote:
+                if visita.plato_id not in nombres_platos:
+                    visita.plato_id = None
+        with transaction.atomic():
+            Visit.objects.bulk_create(lote, batch_size=500)
+            acumular_estadisticas(lote)
+    except Exception:
+        for visita in lote:
+            # bulk_create pudo asignarles id antes del ROLLBACK
+            visita.pk = None
+        with _lock:
+            _pendientes[:0] = lote
+            descartadas = _recortar(_config()['MAXIMO'])
+        _avisar_descartadas(descartadas)
+        raise
+    eventos.publicar_visitas(lote, nombres_platos)
+    return len(lote)
+
+
+def acumular_estadisticas(visitas):
+    """Suma las visitas dadas a su fila de ``VisitDailyStat``."""
+    from .models import VisitDailyStat
+
+    conteos = Counter(
+        (v.restaurante_id, timezone.localdate(v.timestamp), v.tipo, v.plato_id)
+        for v in visitas
+    )
+    for (restaurante_id, fecha, tipo, plato_id), total in conteos.items():
+        clave = dict(restaurante_id=restaurante_id, fecha=fecha, tipo=tipo, plato_id=plato_id)
+        if VisitDailyStat.objects.filter(**clave).update(visitas=F('visitas') + total):
+            continue
+        try:
+            with transaction.atomic():
+                VisitDailyStat.objects.create(visitas=total, **clave)
+        except IntegrityError:
+            # Otro proceso creó la fila entre el UPDATE y el INSERT
+            VisitDailyStat.objects.filter(**clave).update(visitas=F('visitas') + total)
+
+
+def resumen_diario(visitas):
+    """Filas de ``VisitDailyStat`` calculadas a partir del queryset ``visitas``.
+
+    Usa ``TruncDate`` en la zona horaria actual, que Django traduce tanto en
+    SQLite como en PostgreSQL (no hay SQL propio de un motor).
+    """
+    return (
+        visitas
+        .annotate(fecha=TruncDate('timestamp'))
+        .values('restaurante_id', 'fecha', 'tipo', 'plato_id')
+        .annotate(visitas=Count('id'))
+        .order_by()
+    )
+
+
+def reconstruir_resumen(visitas, estadisticas, lote=1000):
+    """Sustituye las filas ``estadisticas`` por el resumen de ``visitas``.
+
+    Los dos querysets tienen que abarcar los mismos restaurantes y días.
+    Devuelve el número de filas creadas.
+    """
+    from .models import VisitDailyStat
+
+    creadas = 0
+    with transaction.atomic():
+        estadisticas.delete()
+        filas = []
+        for fila in resumen_diario(visitas).iterator():
+            filas.append(VisitDailyStat(**fila))
+            if len(filas) >= lote:
+                VisitDailyStat.objects.bulk_create(filas)
+                creadas += len(filas)
+                filas = []
+        VisitDailyStat.objects.bulk_create(filas)
+        creadas += len(filas)
+    return creadas
+
+
+def inicio_del_dia(fecha):
+    """Primer instante de ``fecha`` en la zona horaria actual.
+
+    Para filtrar visitas por día se usa un rango sobre ``timestamp``
+    (``timestamp__gte=inicio_del_dia(d)``) en lugar de ``timestamp__date``,
+    que envuelve la columna en una función y no puede usar el índice
+    ``(restaurante, timestamp)``.
+    """
+    return timezone.make_aware(datetime.combine(fecha, hora.min))
+
+
+def visitas_pendientes():
+    with _lock:
+        return len(_pendientes)
+
+
+def _iniciar_hilo(intervalo):
+    global _hilo
+    if _hilo is not None and _hilo.is_alive():
+        return
+    with _lock:
+        if _hilo is not None and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(
+            target=_bucle_vaciado, args=(intervalo,),
+            name='vaciado-visitas', daemon=True,
+        )
+        _hilo.start()
+
+
+def _vaciar_en_segundo_plano():
+    """Vacía el buffer en un hilo de un solo uso, si no hay ya uno vaciándolo."""
+    global _hilo_lote
+    with _lock:
+        if _hilo_lote is not None and _hilo_lote.is_alive():
+            return
+        _hilo_lote = threading.Thread(target=_vaciar_en_hilo, name='vaciado-visitas-lote', daemon=True)
+        _hilo_lote.start()
+
+
+def _bucle_vaciado(intervalo):
+    while True:
+        time.sleep(intervalo)
+        _vaciar_en_hilo()
+
+
+def _vaciar_en_hilo():
+    try:
+        vaciar_visitas()
+    except Exception:
+        logger.exception("No se pudieron guardar las visitas pendientes")
+    finally:
+        # Cada hilo tiene su propia conexión; no la dejamos abierta
+        connection.close()
+
+
+atexit.register(vaciar_visitas)
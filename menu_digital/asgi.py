@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'menu_digital.settings')
 
 application = get_asgi_application()
+
+# Compila las plantillas antes de la primera petición (ver core/arranque.py)
+from core.arranque import precargar  # noqa: E402
+
+precargar()
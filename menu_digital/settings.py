@@ -41,20 +41,32 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Las vistas públicas (@via_publica) se sirven aquí, sin sesión,
+    # autenticación, mensajes ni CSRF (ver core/via_publica.py)
+    'core.via_publica.ViaPublicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # request.restaurante del dueño, perezoso y consultado como mucho una vez
+    # por petición (ver core/restaurante_actual.py)
+    'core.restaurante_actual.RestauranteActualMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'menu_digital.urls'
 
+# Sin 'loaders', Django usa el loader con caché (también con DEBUG, que lo
+# vacía al editar una plantilla); los workers lo llenan al arrancar con
+# core.arranque.precargar, desde wsgi.py y asgi.py
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que mide el tiempo de render (ver core/instrumentacion.py)
+        'BACKEND': 'core.instrumentacion.DjangoTemplatesMedidas',
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,13 +85,102 @@ WSGI_APPLICATION = 'menu_digital.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# Se elige con variables de entorno:
+#   DB_MOTOR=sqlite (por defecto) o postgresql
+#   DB_NOMBRE, DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO
+#   DB_CONN_MAX_AGE: segundos que se reutiliza una conexión (por defecto 60)
+#   DB_POOL=1: pool de conexiones de psycopg (requiere psycopg[pool])
+# PostgreSQL necesita las dependencias de requirements-postgresql.txt.
+# Con PostgreSQL, `DB_MOTOR=postgresql python manage.py test` pasa las mismas
+# pruebas, incluidas las de agregación de visitas.
+
+DB_MOTOR = os.environ.get('DB_MOTOR', 'sqlite')
+
+if DB_MOTOR == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NOMBRE', 'menu_digital'),
+            'USER': os.environ.get('DB_USUARIO', 'menu_digital'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PUERTO', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # El pool ya reutiliza las conexiones; Django exige CONN_MAX_AGE = 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+            'timeout': 10,
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NOMBRE') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'OPTIONS': {
+                # WAL deja leer mientras se escribe; con synchronous=NORMAL
+                # solo se sincroniza el disco en los checkpoints
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+                # Espera hasta 5 s a que se libere el bloqueo en vez de
+                # fallar con "database is locked"
+                'timeout': 5,
+                # Las transacciones piden el bloqueo de escritura al empezar,
+                # así dos escritores no chocan al pasar de lectura a escritura
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # Las pruebas usan un archivo y no la base en memoria: así los
+            # hilos de SlugConcurrenteTests tienen cada uno su conexión, con
+            # los mismos bloqueos y PRAGMAs que en producción
+            'TEST': {
+                'NAME': os.environ.get('DB_NOMBRE_PRUEBAS') or BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con varios procesos de servidor conviene FileBasedCache, para que la
+# invalidación del menú público llegue a todos.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'menu-digital',
     }
 }
 
+# Tiempo máximo que se guarda el menú público renderizado (ver core/cache_menu.py)
+MENU_CACHE_SEGUNDOS = 60 * 60 * 24
+
+# Las estadísticas del dashboard se cachean poco: cambian con cada visita (ver core/dashboard.py)
+DASHBOARD_ESTADISTICAS_SEGUNDOS = 60
+
+# Mapa de calor, semana a semana y conversión por plato (ver core/analitica.py).
+# SEMANAS debe ser menor que ARCHIVO_VISITAS['DIAS'] / 7: lo archivado no cuenta
+ANALITICA = {
+    'SEMANAS': 4,
+    'SEGUNDOS_CACHE': 600,
+    'LOTE': 50_000,
+}
+
+# Contadores del dashboard en vivo por Server-Sent Events (ver core/eventos.py)
+EVENTOS_DASHBOARD = {
+    'LATIDO': 15,
+    'MAX_PENDIENTES': 100,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,3 +234,48 @@ LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
 
 SITE_URL = "http://127.0.0.1:8000"
+
+# Registro de visitas por lotes (ver core/visitas.py). Con SINCRONO=True cada
+# visita se guarda en la misma petición. Si la base de datos no responde, el
+# buffer guarda como mucho MAXIMO visitas y descarta las más antiguas.
+VISITAS_BUFFER = {
+    'TAMANO': 100,
+    'SEGUNDOS': 5,
+    'SINCRONO': False,
+    'MAXIMO': 10_000,
+}
+
+# Generación de códigos QR en segundo plano (ver core/tareas_qr.py). Con
+# SINCRONO=True el QR se genera al terminar la transacción, en el mismo hilo.
+# Las tareas que llevan CADUCIDAD segundos sin avanzar se dan por perdidas y
+# se vuelven a lanzar.
+QR_TAREAS = {
+    'SINCRONO': False,
+    'HILOS': 2,
+    'CADUCIDAD': 600,
+}
+
+# Publicación de los menús como HTML estático para nginx/CDN (ver
+# core/publicacion.py). Desactivada mientras DIRECTORIO sea None.
+MENU_ESTATICO = {
+    'DIRECTORIO': os.environ.get('MENU_ESTATICO_DIR') or None,
+    'SINCRONO': False,
+    'HILOS': 2,
+}
+
+# Server-Timing (solo staff o DEBUG) y resumen por vista en /rendimiento/ (ver
+# core/instrumentacion.py). MUESTREO es la fracción de peticiones medidas.
+INSTRUMENTACION = {
+    'ACTIVA': True,
+    'MUESTREO': float(os.environ.get('INSTRUMENTACION_MUESTREO', '0.1')),
+    'PRESUPUESTO_CONSULTAS': 20,
+    'TAMANO_BUFFER': 2000,
+}
+
+# Visitas en bruto más antiguas que DIAS se exportan a CSV.gz y se borran
+# (python manage.py archivar_visitas, p. ej. cada noche desde cron)
+ARCHIVO_VISITAS = {
+    'DIAS': 90,
+    'DIRECTORIO': os.environ.get('ARCHIVO_VISITAS_DIR') or BASE_DIR / 'archivo' / 'visitas',
+    'LOTE': 5000,
+}